@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from gspread.utils import rowcol_to_a1
+
+from inventory import PRODUCTS, RESERVED_STATUS, product_columns
+from sheet_shards import shard_offset
+
+logger = logging.getLogger(__name__)
+
+
+class AccountPool:
+    """مخزون محلي من الحسابات المحجوزة مسبقاً لكل منتج لتسليم فوري بدون قراءة الشيت"""
+
+    def __init__(self, bot, pool_file="account_pool.json", min_size=10, max_size=100,
+                 refill_interval=30, demand_window=600):
+        self.bot = bot
+        self.pool_file = pool_file
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.refill_interval = refill_interval
+        self.demand_window = demand_window
+
+        # ملفات مخزون كل العمليات (عند التشغيل بعدة عمليات يُضاف ملف كل عملية)
+        self.pool_files = [pool_file]
+        self._swept = False
+
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._demand = {product: deque() for product in PRODUCTS}
+
+        state = self.load_pool()
+        # الحسابات المحجوزة في الشيت والجاهزة للتسليم
+        self.reserved = {product: state["reserved"].get(product, []) for product in PRODUCTS}
+        # الحسابات التي سُلمت ولم تُكتب حالتها في الشيت بعد
+        self.pending_marks = state["pending"]
+
+    @property
+    def enabled(self):
+        return self.min_size > 0
+
+    def load_pool(self, pool_file=None):
+        """تحميل حالة المخزون من الملف"""
+        pool_file = pool_file or self.pool_file
+        if os.path.exists(pool_file):
+            try:
+                with open(pool_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                return {
+                    "reserved": state.get("reserved", {}),
+                    "pending": state.get("pending", [])
+                }
+            except Exception as e:
+                logger.error("خطأ في تحميل مخزون الحسابات: %s", e)
+        return {"reserved": {}, "pending": []}
+
+    def save_pool(self):
+        """حفظ حالة المخزون بشكل ذري حتى لا تضيع الحجوزات عند إعادة التشغيل"""
+        state = {"reserved": self.reserved, "pending": self.pending_marks}
+        temp_file = f"{self.pool_file}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.pool_file)
+            return True
+        except Exception as e:
+            logger.error("خطأ في حفظ مخزون الحسابات: %s", e)
+            return False
+
+    def size(self, product):
+        """عدد الحسابات المحجوزة لمنتج"""
+        return len(self.reserved[product])
+
+    def reserved_rows(self, product):
+        """صفوف المنتج المحجوزة أو المنتظرة للكتابة"""
+        with self._lock:
+            rows = {account['row'] for account in self.reserved[product]}
+            rows.update(mark['row'] for mark in self.pending_marks if mark['product'] == product)
+        return rows
+
+    def target_size(self, product):
+        """حجم المخزون المطلوب حسب الطلب الأخير"""
+        now = time.monotonic()
+        demand = self._demand[product]
+        while demand and demand[0][0] < now - self.demand_window:
+            demand.popleft()
+
+        # ما يكفي لفترتي إعادة تعبئة بمعدل الطلب الحالي
+        recent = sum(count for _, count in demand)
+        expected = recent / self.demand_window * self.refill_interval * 2
+        return max(self.min_size, min(self.max_size, math.ceil(expected)))
+
+    def needs_refill(self, product):
+        """هل انخفض المخزون إلى أقل من نصف الحجم المطلوب"""
+        return self.size(product) < self.target_size(product) / 2 or bool(self.pending_marks)
+
+    def take(self, product, count, used_cells, on_taken=None):
+        """أخذ حسابات من المخزون بدون أي طلب للشيت، أو None إذا لم يكفِ المخزون
+
+        used_cells(account) تُرجع الخلايا [(row, col, value)] التي تُكتب لاحقاً في الشيت
+        on_taken(accounts) تُستدعى قبل حفظ المخزون (تسجيل الحجز في سجل العمليات)
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            self._demand[product].append((time.monotonic(), count))
+            pool = self.reserved[product]
+            if len(pool) < count:
+                return None
+
+            accounts = pool[:count]
+            del pool[:count]
+            for account in accounts:
+                self.pending_marks.append({
+                    "product": product,
+                    "row": account['row'],
+                    "cells": used_cells(account)
+                })
+            if on_taken:
+                on_taken(accounts)
+            self.save_pool()
+
+        return accounts
+
+    def discard(self, product, rows):
+        """إزالة صفوف من المخزون ومن الحالات المنتظرة (كُتبت أو أُلغيت مباشرة في الشيت)"""
+        rows = set(rows)
+        with self._lock:
+            self.reserved[product] = [account for account in self.reserved[product] if account['row'] not in rows]
+            self.pending_marks = [
+                mark for mark in self.pending_marks
+                if mark['product'] != product or mark['row'] not in rows
+            ]
+            self.save_pool()
+
+    def refill(self):
+        """كتابة الحالات المنتظرة ثم إعادة تعبئة المخزون (تعمل في خيط منفصل)"""
+        if not self.enabled or not self.bot.sheet:
+            return
+        # تجاهل الطلب إذا كانت هناك تعبئة جارية
+        if not self._refill_lock.acquire(blocking=False):
+            return
+        try:
+            if not self._swept:
+                self.release_orphan_reservations()
+                self._swept = True
+            self.flush_pending_marks()
+            for product in PRODUCTS:
+                self.refill_product(product)
+        except Exception as e:
+            logger.error("خطأ في إعادة تعبئة مخزون الحسابات: %s", e)
+        finally:
+            self._refill_lock.release()
+
+    def flush_pending_marks(self):
+        """كتابة حالة الحسابات المُسلمة في الشيت بطلب واحد"""
+        # القائمة تُؤخذ داخل قفل الحجز حتى لا تُكتب حالة حساب أُلغي شراؤه للتو
+        with self.bot.claim_lock:
+            with self._lock:
+                pending = list(self.pending_marks)
+            if not pending:
+                return
+
+            updates = [
+                {'range': rowcol_to_a1(row, col), 'values': [[value]]}
+                for mark in pending
+                for row, col, value in mark["cells"]
+            ]
+            self.bot.sheet.batch_update(updates)
+            self.bot.read_cache.invalidate()
+
+        with self._lock:
+            flushed = {id(mark) for mark in pending}
+            self.pending_marks = [mark for mark in self.pending_marks if id(mark) not in flushed]
+            self.save_pool()
+        logger.info("تم تحديث %s حساب مُسلم من المخزون في الشيت", len(pending))
+
+    def refill_product(self, product):
+        """حجز حسابات جديدة لمنتج حتى يصل المخزون للحجم المطلوب"""
+        missing = self.target_size(product) - self.size(product)
+        if missing <= 0:
+            return
+
+        status_col = product_columns(product)[2]
+        with self.bot.claim_lock:
+            # قراءة حديثة حتى لا نحجز صفاً استُخدم للتو
+            accounts = self.bot.lease_accounts(
+                product,
+                self.bot.iter_available_accounts(product, self.reserved_rows(product), fresh=True),
+                missing
+            )
+            if not accounts:
+                return
+
+            self.bot.sheet.batch_update([
+                {'range': rowcol_to_a1(account['row'], status_col), 'values': [[RESERVED_STATUS]]}
+                for account in accounts
+            ])
+            self.bot.read_cache.invalidate()
+
+            with self._lock:
+                self.reserved[product].extend(accounts)
+                self.save_pool()
+
+        logger.info("تم حجز %s حساب %s في المخزون", len(accounts), PRODUCTS[product]['name'])
+
+    def owned_rows(self, product):
+        """صفوف المنتج التي يملكها مخزون أي عملية أو عملية شراء مفتوحة أو بيع مسجل أو حجز نشط"""
+        owned = self.reserved_rows(product)
+        for pool_file in self.pool_files:
+            if pool_file == self.pool_file:
+                continue
+            state = self.load_pool(pool_file)
+            owned.update(account['row'] for account in state["reserved"].get(product, []))
+            owned.update(mark['row'] for mark in state["pending"] if mark['product'] == product)
+        owned.update(account['row'] for entry_product, account in self.bot.journal.open_accounts()
+                     if entry_product == product)
+        # حساب سُلم من ملف مخزون ضاع قبل كتابة حالته: مبيع وليس يتيماً
+        owned.update(self.bot.ledger.rows(product))
+        if self.bot.leases is not None:
+            # صفوف تحجزها عملية أخرى الآن ولم تحفظ ملف مخزونها بعد
+            owned.update(self.bot.leases.active_rows(product))
+        return owned
+
+    def release_orphan_reservations(self):
+        """إرجاع الصفوف المعلمة "محجوز" التي لا يملكها أحد (ملف مخزون ضاع أو تغير عدد العمليات)"""
+        for product in PRODUCTS:
+            status_col = product_columns(product)[2]
+            owned = self.owned_rows(product)
+            orphans = []
+            for shard in range(self.bot.shard_count()):
+                status_values, = self.bot.read_columns(status_col, fresh=True, shard=shard)
+                orphans.extend(
+                    shard_offset(shard) + i + 1
+                    for i, status in enumerate(status_values)
+                    if i > 0 and status.strip() == RESERVED_STATUS and shard_offset(shard) + i + 1 not in owned
+                )
+            if not orphans:
+                continue
+
+            self.bot.write_account_cells(product, [{'row': row} for row in orphans], [
+                cell for row in orphans for cell in self.bot.cleared_cells(product, row)
+            ])
+            logger.warning("↩️ تم إرجاع %d حساب %s محجوز بدون مالك إلى المخزون المتاح",
+                           len(orphans), PRODUCTS[product]['name'])
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+قياس أداء مسار الشراء والأوامر الثقيلة بدون شبكة
+
+يشغل المعالجات الحقيقية عبر Application.process_update مع ورقة وهمية في الذاكرة
+وطبقة طلبات تلقرام وهمية، ثم يطبع الإنتاجية وزمن p50/p99 وعدد استدعاءات Sheets.
+
+أمثلة:
+    python -m benchmarks.bench_purchase --scenario buy --users 1000
+    python -m benchmarks.bench_purchase --scenario buy100 --users 20 --latency 0.05
+    python -m benchmarks.bench_purchase --scenario broadcast --users 50000
+    python -m benchmarks.bench_purchase --scenario all
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from telegram.ext import Application
+
+import telegram_bot
+from user_database import UserDatabase
+from benchmarks.fake_sheet import FakeWorksheet
+from benchmarks.fake_telegram import FakeTelegramRequest, make_command_update
+
+ADMIN_ID = 6461427638
+
+# السيناريو -> (الأمر، كريدت كل مستخدم، عدد التحديثات لكل مستخدم، عدد المستخدمين الافتراضي)
+SCENARIOS = {
+    "buy": ("/buy", 1, 1, 1000),
+    "buy100": ("/buy100", 100, 1, 20),
+    "email": ("/email", 1, 1, 1000),
+    "stats": ("/stats", 0, 1, 100),
+    "broadcast": ("/broadcast رسالة اختبار", 0, 0, 50000),
+    "giveall": ("/giveall100confirm", 0, 0, 1000),
+}
+
+
+def percentile(values, q):
+    """النسبة المئوية من قائمة القيم"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed_users(user_db, count, credits):
+    """إضافة مستخدمين مباشرة مع حفظ واحد فقط"""
+    now = datetime.now().isoformat()
+    for user_id in range(1, count + 1):
+        user_db.users[str(user_id)] = {
+            "credits": credits,
+            "total_purchases": 0,
+            "join_date": now,
+            "last_activity": now,
+            "username": f"user{user_id}",
+            "first_name": f"User{user_id}",
+            "is_banned": False,
+            "is_new": False,
+            "welcome_credits_given": False
+        }
+    user_db.index.rebuild(user_db.users)
+    user_db.rebuild_username_index()
+    user_db.save_database()
+
+
+async def build_application(request):
+    """بناء تطبيق تلقرام بمعالجات البوت الحقيقية وطبقة طلبات وهمية"""
+    application = (
+        Application.builder()
+        .token("123456:BENCHMARK")
+        .request(request)
+        .get_updates_request(FakeTelegramRequest())
+        .updater(None)
+        .build()
+    )
+    telegram_bot.register_handlers(application)
+    await application.initialize()
+    return application
+
+
+async def run_updates(application, updates, concurrency):
+    """معالجة التحديثات بتوازٍ محدد وقياس زمن كل تحديث"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(update):
+        async with semaphore:
+            start = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(process(update) for update in updates))
+    return latencies, time.perf_counter() - start
+
+
+async def run_scenario(name, args):
+    command, credits, updates_per_user, default_users = SCENARIOS[name]
+    users = args.users or default_users
+
+    sheet = FakeWorksheet(latency=args.latency, jitter=args.jitter, quota_per_minute=args.quota)
+    accounts_needed = users * (100 if name == "buy100" else 1) + 10
+    sheet.fill_product(1, accounts_needed, prefix="yt")
+    sheet.fill_product(6, accounts_needed, prefix="gpt")
+
+    user_db = UserDatabase(os.path.join(args.workdir, f"users_{name}.json"))
+    seed_users(user_db, users, credits)
+
+    bot = telegram_bot.TelegramAccountBot(sheet=sheet, user_db=user_db)
+    bot.account_pool.pool_file = os.path.join(args.workdir, f"account_pool_{name}.json")
+    bot.account_pool.min_size = args.pool_size
+    telegram_bot.bot_instance = bot
+
+    if args.pool_size:
+        await asyncio.to_thread(bot.account_pool.refill)
+    sheet.calls.clear()
+
+    request = FakeTelegramRequest(latency=args.telegram_latency)
+    application = await build_application(request)
+
+    if updates_per_user:
+        updates = [
+            make_command_update(application.bot, user_id, command)
+            for user_id in range(1, users + 1)
+            for _ in range(updates_per_user)
+        ]
+    else:
+        # أوامر الأدمن: تحديث واحد يمر على جميع المستخدمين
+        updates = [make_command_update(application.bot, ADMIN_ID, command, username=bot.admin_username)]
+
+    latencies, elapsed = await run_updates(application, updates, args.concurrency)
+    await application.shutdown()
+
+    print(f"\n=== {name} ({users} مستخدم، {len(updates)} تحديث) ===")
+    print(f"الزمن الكلي: {elapsed:.2f}s | الإنتاجية: {len(updates) / elapsed:.1f} تحديث/ثانية")
+    print(f"p50: {percentile(latencies, 0.5) * 1000:.1f}ms | p99: {percentile(latencies, 0.99) * 1000:.1f}ms "
+          f"| الأقصى: {max(latencies) * 1000:.1f}ms")
+    print(f"استدعاءات Sheets: {sum(sheet.calls.values())} {dict(sheet.calls)}")
+    print(f"استدعاءات تلقرام: {sum(request.calls.values())} {dict(request.calls)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="قياس أداء البوت بورقة وتلقرام وهميين")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS) + ["all"], default="all")
+    parser.add_argument("--users", type=int, default=0, help="عدد المستخدمين (افتراضي حسب السيناريو)")
+    parser.add_argument("--concurrency", type=int, default=100, help="عدد التحديثات المعالجة بالتوازي")
+    parser.add_argument("--latency", type=float, default=0.0, help="تأخير كل استدعاء Sheets بالثواني")
+    parser.add_argument("--jitter", type=float, default=0.0, help="تذبذب عشوائي إضافي للتأخير")
+    parser.add_argument("--quota", type=int, default=None, help="حد طلبات Sheets بالدقيقة (429 عند تجاوزه)")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="تأخير كل طلب تلقرام")
+    parser.add_argument("--pool-size", type=int, default=0, help="حجم مخزون الحسابات المحجوزة (0 = معطل)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # سجلات المعالجات تشوه القياس
+    logging.getLogger().setLevel(logging.WARNING)
+    args.workdir = tempfile.mkdtemp(prefix="bot_bench_")
+    # عزل ملفات البوت (users.json، account_pool.json...) عن ملفات التشغيل الحقيقي
+    os.chdir(args.workdir)
+
+    scenarios = ["buy", "buy100", "email", "stats", "broadcast", "giveall"] if args.scenario == "all" else [args.scenario]
+    for name in scenarios:
+        asyncio.run(run_scenario(name, args))
+
+
+if __name__ == '__main__':
+    main()
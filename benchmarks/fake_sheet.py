@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from collections import Counter, deque
+
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol
+
+
+class _QuotaResponse:
+    """استجابة شبيهة بـ requests لبناء APIError (429) كما يرجعها Google"""
+
+    status_code = 429
+    text = "Quota exceeded"
+
+    def json(self):
+        return {
+            "error": {
+                "code": 429,
+                "message": "Quota exceeded for quota metric 'Read requests' (fake worksheet)",
+                "status": "RESOURCE_EXHAUSTED"
+            }
+        }
+
+
+class FakeWorksheet:
+    """ورقة gspread داخل الذاكرة مع تأخير قابل للضبط وحد طلبات بالدقيقة"""
+
+    def __init__(self, latency=0.0, jitter=0.0, quota_per_minute=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_per_minute = quota_per_minute
+
+        self._lock = threading.Lock()
+        self._columns = {}  # رقم العمود -> قائمة القيم (index 0 = الصف 1)
+        self._recent_calls = deque()
+        self.calls = Counter()
+
+    # ===== تجهيز البيانات =====
+
+    def fill_product(self, email_col, count, used=0, prefix="user"):
+        """إضافة صف عناوين و count حساب في أعمدة منتج (أول used منها مُستخدمة)"""
+        self._set(1, email_col, "Gmail")
+        self._set(1, email_col + 1, "Password")
+        self._set(1, email_col + 2, "Status")
+        for i in range(count):
+            row = i + 2
+            self._set(row, email_col, f"{prefix}{i}@example.com")
+            self._set(row, email_col + 1, f"pass{i}")
+            if i < used:
+                self._set(row, email_col + 2, "مُستخدم")
+
+    def _set(self, row, col, value):
+        column = self._columns.setdefault(col, [])
+        if len(column) < row:
+            column.extend([''] * (row - len(column)))
+        column[row - 1] = str(value)
+
+    def _cell(self, row, col):
+        column = self._columns.get(col, [])
+        return column[row - 1] if row <= len(column) else ''
+
+    def _call(self, method):
+        """تسجيل الاستدعاء ومحاكاة التأخير والحد الأقصى للطلبات"""
+        with self._lock:
+            self.calls[method] += 1
+            if self.quota_per_minute:
+                now = time.monotonic()
+                while self._recent_calls and self._recent_calls[0] < now - 60:
+                    self._recent_calls.popleft()
+                if len(self._recent_calls) >= self.quota_per_minute:
+                    self.calls["quota_exceeded"] += 1
+                    raise APIError(_QuotaResponse())
+                self._recent_calls.append(now)
+
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    # ===== واجهة gspread المستخدمة في البوت =====
+
+    def col_values(self, col):
+        self._call("col_values")
+        with self._lock:
+            values = list(self._columns.get(col, []))
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+    def update_cell(self, row, col, value):
+        self._call("update_cell")
+        with self._lock:
+            self._set(row, col, value)
+
+    def get(self, range_name):
+        self._call("get")
+        start, _, end = range_name.partition(":")
+        start_row, start_col = a1_to_rowcol(start)
+        end_row, end_col = a1_to_rowcol(end or start)
+        with self._lock:
+            rows = [
+                [self._cell(row, col) for col in range(start_col, end_col + 1)]
+                for row in range(start_row, end_row + 1)
+            ]
+        # gspread يحذف الخلايا والصفوف الفارغة في النهاية
+        for values in rows:
+            while values and values[-1] == '':
+                values.pop()
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def update(self, range_name, values):
+        self._call("update")
+        start = range_name.partition(":")[0]
+        start_row, start_col = a1_to_rowcol(start)
+        with self._lock:
+            for row_offset, row_values in enumerate(values):
+                for col_offset, value in enumerate(row_values):
+                    self._set(start_row + row_offset, start_col + col_offset, value)
+
+    def batch_update(self, data):
+        self._call("batch_update")
+        with self._lock:
+            for item in data:
+                start_row, start_col = a1_to_rowcol(item['range'].partition(":")[0])
+                for row_offset, row_values in enumerate(item['values']):
+                    for col_offset, value in enumerate(row_values):
+                        self._set(start_row + row_offset, start_col + col_offset, value)
+
+    def get_all_records(self):
+        self._call("get_all_records")
+        with self._lock:
+            max_row = max((len(column) for column in self._columns.values()), default=0)
+            columns = sorted(self._columns)
+            headers = [self._cell(1, col) for col in columns]
+            return [
+                {header: self._cell(row, col) for header, col in zip(headers, columns) if header}
+                for row in range(2, max_row + 1)
+            ]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "Bench Bot", "username": "bench_bot"}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """طبقة طلبات تلقرام وهمية: ترد على طلبات Bot API من الذاكرة وتعد الرسائل المرسلة"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, chat_id, **fields):
+        return {
+            "message_id": fields.pop("message_id", None) or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **fields
+        }
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        parameters = request_data.parameters if request_data else {}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = self._message(
+                parameters.get("chat_id", 0),
+                message_id=parameters.get("message_id"),
+                text=parameters.get("text", "")
+            )
+        elif api_method == "sendDocument":
+            result = self._message(
+                parameters.get("chat_id", 0),
+                document={"file_id": "fake", "file_unique_id": "fake"}
+            )
+        else:
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+_update_ids = itertools.count(1)
+
+
+def make_command_update(bot, user_id, text, username=None):
+    """بناء Update لرسالة أمر من مستخدم"""
+    update_id = next(_update_ids)
+    command_length = len(text.split()[0])
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {
+                "id": user_id,
+                "is_bot": False,
+                "first_name": f"User{user_id}",
+                "username": username or f"user{user_id}"
+            },
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": command_length}]
+        }
+    }, bot)
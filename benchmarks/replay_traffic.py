@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+إعادة تشغيل تحديثات مسجلة (TRAFFIC_RECORD_FILE) على نسخة من البوت
+
+يحافظ على الفواصل الزمنية الأصلية مقسومة على --speed (1، 10، 100...) ويرسل كل
+تحديث في وقته دون انتظار انتهاء السابق (حمل مفتوح كالإنتاج)، ثم يطبع توزيع زمن
+المعالجة لكل أمر والتأخر عن الجدول.
+
+أمثلة:
+    python -m benchmarks.replay_traffic traffic.jsonl --speed 10
+    python -m benchmarks.replay_traffic traffic.jsonl --speed 100 --max-gap 0.5 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from telegram import Update
+
+import telegram_bot
+from traffic_recorder import read_recording
+from user_database import UserDatabase
+from benchmarks.bench_purchase import build_application, percentile
+from benchmarks.fake_sheet import FakeWorksheet
+from benchmarks.fake_telegram import FakeTelegramRequest
+
+
+def update_kind(data):
+    """تصنيف التحديث لتجميع الأزمنة: اسم الأمر أو نوع التحديث"""
+    message = data.get("message") or data.get("edited_message")
+    if message:
+        text = message.get("text") or ""
+        if text.startswith("/"):
+            return text.split()[0].split("@")[0].rstrip("0123456789") or text.split()[0]
+        return "document" if "document" in message else "message"
+    if "callback_query" in data:
+        return "callback:" + (data["callback_query"].get("data") or "").split(":")[0]
+    return next((key for key in data if key != "update_id"), "unknown")
+
+
+def recorded_user_ids(records):
+    """معرفات المستخدمين الموجودة في التسجيل"""
+    user_ids = set()
+    for _, data in records:
+        for key in ("message", "edited_message", "callback_query"):
+            sender = (data.get(key) or {}).get("from")
+            if sender:
+                user_ids.add(sender["id"])
+    return user_ids
+
+
+def seed_recorded_users(user_db, user_ids, credits):
+    """إنشاء مستخدمي التسجيل مسبقاً بكريدت محدد"""
+    now = datetime.now().isoformat()
+    for user_id in user_ids:
+        user_db.users[str(user_id)] = {
+            "credits": credits,
+            "total_purchases": 0,
+            "join_date": now,
+            "last_activity": now,
+            "username": None,
+            "first_name": "User",
+            "is_banned": False,
+            "is_new": False,
+            "welcome_credits_given": True
+        }
+    user_db.index.rebuild(user_db.users)
+    user_db.rebuild_username_index()
+    user_db.save_database()
+
+
+def build_schedule(records, speed, max_gap):
+    """أوقات الإرسال النسبية بعد تطبيق السرعة وحد أقصى للفجوات"""
+    schedule = []
+    offset = 0.0
+    previous = None
+    for timestamp, data in records:
+        if previous is not None:
+            gap = max(0.0, timestamp - previous)
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            offset += gap / speed
+        previous = timestamp
+        schedule.append((offset, data))
+    return schedule
+
+
+async def replay(args):
+    records = read_recording(args.recording)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("❌ لا توجد تحديثات في التسجيل")
+        return
+
+    sheet = FakeWorksheet(latency=args.latency, jitter=args.jitter, quota_per_minute=args.quota)
+    sheet.fill_product(1, args.accounts, prefix="yt")
+    sheet.fill_product(6, args.accounts, prefix="gpt")
+
+    user_db = UserDatabase(os.path.join(args.workdir, "users_replay.json"))
+    seed_recorded_users(user_db, recorded_user_ids(records), args.credits)
+
+    bot = telegram_bot.TelegramAccountBot(sheet=sheet, user_db=user_db)
+    bot.account_pool.pool_file = os.path.join(args.workdir, "account_pool_replay.json")
+    bot.account_pool.min_size = args.pool_size
+    telegram_bot.bot_instance = bot
+    if args.pool_size:
+        await asyncio.to_thread(bot.account_pool.refill)
+    sheet.calls.clear()
+
+    request = FakeTelegramRequest(latency=args.telegram_latency)
+    application = await build_application(request)
+
+    latencies = defaultdict(list)
+    lags = []
+    errors = 0
+
+    async def process(scheduled_at, data, start):
+        nonlocal errors
+        delay = start + scheduled_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        began = time.perf_counter()
+        lags.append(began - start - scheduled_at)
+        try:
+            await application.process_update(Update.de_json(data, application.bot))
+        except Exception:
+            errors += 1
+        latencies[update_kind(data)].append(time.perf_counter() - began)
+
+    schedule = build_schedule(records, args.speed, args.max_gap)
+    start = time.perf_counter()
+    await asyncio.gather(*(process(scheduled_at, data, start) for scheduled_at, data in schedule))
+    elapsed = time.perf_counter() - start
+    await application.shutdown()
+
+    recorded_span = records[-1][0] - records[0][0]
+    all_latencies = [value for values in latencies.values() for value in values]
+    print(f"\n=== إعادة تشغيل {len(records)} تحديث بسرعة ×{args.speed:g} ===")
+    print(f"مدة التسجيل: {recorded_span:.1f}s | مدة الإعادة: {elapsed:.2f}s | "
+          f"الإنتاجية: {len(records) / elapsed:.1f} تحديث/ثانية | أخطاء: {errors}")
+    print(f"الكل: p50 {percentile(all_latencies, 0.5) * 1000:.1f}ms | p90 {percentile(all_latencies, 0.9) * 1000:.1f}ms "
+          f"| p99 {percentile(all_latencies, 0.99) * 1000:.1f}ms | الأقصى {max(all_latencies) * 1000:.1f}ms")
+    print(f"التأخر عن الجدول: p50 {percentile(lags, 0.5) * 1000:.1f}ms | p99 {percentile(lags, 0.99) * 1000:.1f}ms")
+    for kind, values in sorted(latencies.items(), key=lambda item: -len(item[1])):
+        print(f"  {kind:<20} {len(values):>7} | p50 {percentile(values, 0.5) * 1000:8.1f}ms "
+              f"| p99 {percentile(values, 0.99) * 1000:8.1f}ms")
+    print(f"استدعاءات Sheets: {sum(sheet.calls.values())} {dict(sheet.calls)}")
+    print(f"استدعاءات تلقرام: {sum(request.calls.values())} {dict(request.calls)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="إعادة تشغيل تحديثات مسجلة على البوت")
+    parser.add_argument("recording", help="ملف التسجيل (TRAFFIC_RECORD_FILE)")
+    parser.add_argument("--speed", type=float, default=1.0, help="مضاعف السرعة (1، 10، 100...)")
+    parser.add_argument("--max-gap", type=float, default=None, help="أقصى فجوة بين تحديثين بالثواني قبل تطبيق السرعة")
+    parser.add_argument("--limit", type=int, default=0, help="إعادة أول N تحديث فقط")
+    parser.add_argument("--credits", type=int, default=10, help="كريدت كل مستخدم في التسجيل")
+    parser.add_argument("--accounts", type=int, default=10000, help="عدد الحسابات المتاحة لكل منتج")
+    parser.add_argument("--latency", type=float, default=0.0, help="تأخير كل استدعاء Sheets بالثواني")
+    parser.add_argument("--jitter", type=float, default=0.0, help="تذبذب عشوائي إضافي للتأخير")
+    parser.add_argument("--quota", type=int, default=None, help="حد طلبات Sheets بالدقيقة")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="تأخير كل طلب تلقرام")
+    parser.add_argument("--pool-size", type=int, default=0, help="حجم مخزون الحسابات المحجوزة (0 = معطل)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.recording = os.path.abspath(args.recording)
+    logging.getLogger().setLevel(logging.WARNING)
+    args.workdir = tempfile.mkdtemp(prefix="bot_replay_")
+    os.chdir(args.workdir)
+    asyncio.run(replay(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+محاكي محلي لجزء Google Sheets v4 REST API الذي يستخدمه gspread
+
+يدعم: بيانات الجدول (metadata)، values get / batchGet / update / batchUpdate،
+وتاريخ آخر تعديل عبر Drive. مع تأخير قابل للبرمجة، حد طلبات بالدقيقة (429)
+وأخطاء 5xx عشوائية.
+
+تشغيل:
+    python -m benchmarks.sheets_emulator --port 8085 --seed-youtube 5000 --seed-chatgpt 5000 \\
+        --latency lognormal:-2.5,0.6 --read-quota 300 --write-quota 300 --error-rate 0.01
+
+ثم تشغيل البوت عليه:
+    GOOGLE_SHEETS_ENDPOINT=http://127.0.0.1:8085 GOOGLE_SHEET_ID=emulator python telegram_bot.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+_CELL_RE = re.compile(r"^([A-Za-z]*)(\d*)$")
+
+
+def column_index(letters):
+    """تحويل حروف العمود إلى رقم (A -> 1)"""
+    index = 0
+    for char in letters.upper():
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+def parse_range(range_name, default_title):
+    """تحليل نطاق A1 إلى (اسم الورقة، صف1، عمود1، صف2، عمود2) مع None للأطراف المفتوحة"""
+    title = default_title
+    if "!" in range_name:
+        title, range_name = range_name.rsplit("!", 1)
+        title = title.strip("'")
+    elif not _CELL_RE.match(range_name.split(":")[0]):
+        # اسم الورقة فقط يعني الورقة كاملة
+        return range_name.strip("'"), 1, 1, None, None
+
+    start, _, end = range_name.partition(":")
+    start_col, start_row = _CELL_RE.match(start).groups()
+    if end:
+        end_col, end_row = _CELL_RE.match(end).groups()
+    else:
+        end_col, end_row = start_col, start_row
+
+    return (
+        title,
+        int(start_row) if start_row else 1,
+        column_index(start_col) if start_col else 1,
+        int(end_row) if end_row else None,
+        column_index(end_col) if end_col else None,
+    )
+
+
+def latency_sampler(spec):
+    """دالة تأخير من وصف مثل fixed:0.1 أو uniform:0.05,0.3 أو lognormal:-2.5,0.6"""
+    if not spec:
+        return lambda: 0.0
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"توزيع غير معروف: {spec}")
+
+
+class EmulatedSpreadsheet:
+    """جدول واحد بورقة واحدة مخزن كصفوف في الذاكرة"""
+
+    def __init__(self, spreadsheet_id, title="Sheet1"):
+        self.spreadsheet_id = spreadsheet_id
+        self.title = title
+        self.rows = []  # قائمة صفوف، كل صف قائمة نصوص
+        self.modified_time = datetime.now(timezone.utc)
+        self.lock = threading.Lock()
+
+    def seed_product(self, first_col, count, prefix):
+        """إضافة صف عناوين و count حساب متاح بدءاً من العمود first_col"""
+        self.write(1, first_col, [["Gmail", "Password", "Status"]])
+        self.write(2, first_col, [[f"{prefix}{i}@example.com", f"pass{i}"] for i in range(count)])
+
+    def column_count(self):
+        return max((len(row) for row in self.rows), default=0)
+
+    def metadata(self):
+        return {
+            "spreadsheetId": self.spreadsheet_id,
+            "properties": {"title": f"Emulated {self.spreadsheet_id}", "locale": "en_US", "timeZone": "UTC"},
+            "sheets": [{
+                "properties": {
+                    "sheetId": 0,
+                    "title": self.title,
+                    "index": 0,
+                    "sheetType": "GRID",
+                    "gridProperties": {
+                        "rowCount": max(1000, len(self.rows)),
+                        "columnCount": max(26, self.column_count())
+                    }
+                }
+            }]
+        }
+
+    def read(self, start_row, start_col, end_row, end_col, major_dimension="ROWS"):
+        """قراءة نطاق مع حذف الخلايا الفارغة في النهاية كما يفعل Google"""
+        end_row = end_row or len(self.rows)
+        end_col = end_col or self.column_count()
+        values = []
+        for row_number in range(start_row, end_row + 1):
+            row = self.rows[row_number - 1] if row_number <= len(self.rows) else []
+            values.append([row[col - 1] if col <= len(row) else "" for col in range(start_col, end_col + 1)])
+
+        if major_dimension == "COLUMNS":
+            values = [list(column) for column in zip(*values)] if values else []
+
+        for line in values:
+            while line and line[-1] == "":
+                line.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def write(self, start_row, start_col, values):
+        """كتابة قيم بدءاً من خلية مع توسيع الورقة عند الحاجة"""
+        for row_offset, row_values in enumerate(values):
+            row_number = start_row + row_offset
+            while len(self.rows) < row_number:
+                self.rows.append([])
+            row = self.rows[row_number - 1]
+            for col_offset, value in enumerate(row_values):
+                col = start_col + col_offset
+                if len(row) < col:
+                    row.extend([""] * (col - len(row)))
+                row[col - 1] = "" if value is None else str(value)
+        self.modified_time = datetime.now(timezone.utc)
+        return sum(len(row_values) for row_values in values)
+
+
+class EmulatorState:
+    """الجداول وإعدادات التأخير والحدود والأخطاء المشتركة بين الطلبات"""
+
+    def __init__(self, latency=None, read_quota=None, write_quota=None, error_rate=0.0):
+        self.spreadsheets = {}
+        self.sample_latency = latency_sampler(latency)
+        self.quotas = {"read": read_quota, "write": write_quota}
+        self.error_rate = error_rate
+        self._recent = {"read": deque(), "write": deque()}
+        self._quota_lock = threading.Lock()
+        self.stats = {"read": 0, "write": 0, "throttled": 0, "errors": 0}
+
+    def spreadsheet(self, spreadsheet_id):
+        if spreadsheet_id not in self.spreadsheets:
+            self.spreadsheets[spreadsheet_id] = EmulatedSpreadsheet(spreadsheet_id)
+        return self.spreadsheets[spreadsheet_id]
+
+    def admit(self, kind):
+        """تطبيق حد الطلبات بالدقيقة لنوع الطلب (قراءة/كتابة)"""
+        limit = self.quotas[kind]
+        with self._quota_lock:
+            self.stats[kind] += 1
+            if not limit:
+                return True
+            now = time.monotonic()
+            recent = self._recent[kind]
+            while recent and recent[0] < now - 60:
+                recent.popleft()
+            if len(recent) >= limit:
+                self.stats["throttled"] += 1
+                return False
+            recent.append(now)
+            return True
+
+
+class SheetsEmulatorHandler(BaseHTTPRequestHandler):
+    state = None  # EmulatorState يُضبط عند التشغيل
+    protocol_version = "HTTP/1.1"
+
+    # ===== أدوات الاستجابة =====
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, reason):
+        self._send_json(status, {"error": {"code": status, "message": message, "status": reason}})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def log_message(self, format, *args):
+        pass
+
+    # ===== التوجيه =====
+
+    def _dispatch(self, method):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = parse_qs(parsed.query)
+
+        time.sleep(self.state.sample_latency())
+
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            self.state.stats["errors"] += 1
+            status = random.choice((500, 502, 503))
+            self._send_error(status, "Injected backend error", "UNAVAILABLE")
+            return
+
+        drive = re.match(r"^/drive/v3/files/([^/]+)$", path)
+        if drive:
+            spreadsheet = self.state.spreadsheet(drive.group(1))
+            self._send_json(200, {
+                "id": spreadsheet.spreadsheet_id,
+                "name": spreadsheet.metadata()["properties"]["title"],
+                "modifiedTime": spreadsheet.modified_time.isoformat().replace("+00:00", "Z")
+            })
+            return
+
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(.*)$", path)
+        if not match:
+            self._send_error(404, f"Unknown path {path}", "NOT_FOUND")
+            return
+
+        spreadsheet = self.state.spreadsheet(match.group(1))
+        rest = match.group(2)
+        kind = "read" if method == "GET" else "write"
+        if not self.state.admit(kind):
+            self._send_error(
+                429,
+                f"Quota exceeded for quota metric '{kind.title()} requests' and limit "
+                f"'{kind.title()} requests per minute per user'",
+                "RESOURCE_EXHAUSTED"
+            )
+            return
+
+        with spreadsheet.lock:
+            if method == "GET" and rest == "":
+                self._send_json(200, spreadsheet.metadata())
+            elif method == "GET" and rest == "/values:batchGet":
+                self._batch_get(spreadsheet, query)
+            elif method == "GET" and rest.startswith("/values/"):
+                self._values_get(spreadsheet, unquote(rest[len("/values/"):]), query)
+            elif method == "PUT" and rest.startswith("/values/"):
+                self._values_update(spreadsheet, unquote(rest[len("/values/"):]), self._read_body())
+            elif method == "POST" and rest == "/values:batchUpdate":
+                self._values_batch_update(spreadsheet, self._read_body())
+            elif method == "POST" and rest == ":batchUpdate":
+                # طلبات التنسيق وتغيير الحجم: الورقة تتوسع تلقائياً عند الكتابة
+                body = self._read_body()
+                self._send_json(200, {"spreadsheetId": spreadsheet.spreadsheet_id,
+                                      "replies": [{} for _ in body.get("requests", [])]})
+            else:
+                self._send_error(404, f"Unsupported {method} {rest}", "NOT_FOUND")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    # ===== عمليات القيم =====
+
+    def _value_range(self, spreadsheet, range_name, major_dimension):
+        title, start_row, start_col, end_row, end_col = parse_range(range_name, spreadsheet.title)
+        values = spreadsheet.read(start_row, start_col, end_row, end_col, major_dimension)
+        value_range = {"range": f"'{title}'!{range_name.rsplit('!', 1)[-1]}", "majorDimension": major_dimension}
+        if values:
+            value_range["values"] = values
+        return value_range
+
+    def _values_get(self, spreadsheet, range_name, query):
+        major_dimension = query.get("majorDimension", ["ROWS"])[0]
+        self._send_json(200, self._value_range(spreadsheet, range_name, major_dimension))
+
+    def _batch_get(self, spreadsheet, query):
+        major_dimension = query.get("majorDimension", ["ROWS"])[0]
+        self._send_json(200, {
+            "spreadsheetId": spreadsheet.spreadsheet_id,
+            "valueRanges": [
+                self._value_range(spreadsheet, range_name, major_dimension)
+                for range_name in query.get("ranges", [])
+            ]
+        })
+
+    def _write_range(self, spreadsheet, range_name, values, major_dimension="ROWS"):
+        _, start_row, start_col, _, _ = parse_range(range_name, spreadsheet.title)
+        if major_dimension == "COLUMNS":
+            values = [list(row) for row in zip(*values)]
+        updated_cells = spreadsheet.write(start_row, start_col, values)
+        return {
+            "spreadsheetId": spreadsheet.spreadsheet_id,
+            "updatedRange": range_name,
+            "updatedRows": len(values),
+            "updatedColumns": max((len(row) for row in values), default=0),
+            "updatedCells": updated_cells
+        }
+
+    def _values_update(self, spreadsheet, range_name, body):
+        self._send_json(200, self._write_range(
+            spreadsheet, range_name, body.get("values", []), body.get("majorDimension", "ROWS")
+        ))
+
+    def _values_batch_update(self, spreadsheet, body):
+        responses = [
+            self._write_range(spreadsheet, item["range"], item.get("values", []), item.get("majorDimension", "ROWS"))
+            for item in body.get("data", [])
+        ]
+        self._send_json(200, {
+            "spreadsheetId": spreadsheet.spreadsheet_id,
+            "totalUpdatedCells": sum(response["updatedCells"] for response in responses),
+            "responses": responses
+        })
+
+
+def make_server(state, host="127.0.0.1", port=8085):
+    """خادم HTTP مربوط بحالة محاكي محددة"""
+    handler = type("BoundSheetsEmulatorHandler", (SheetsEmulatorHandler,), {"state": state})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_emulator(state, host="127.0.0.1", port=8085):
+    """تشغيل المحاكي في خيط خلفي (للاستخدام من داخل سكربتات القياس)"""
+    server = make_server(state, host, port)
+    threading.Thread(target=server.serve_forever, name="sheets-emulator", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="محاكي Google Sheets API محلي")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--sheet-id", default="emulator", help="معرف الجدول الذي تُضاف له البيانات الأولية")
+    parser.add_argument("--seed-youtube", type=int, default=1000, help="عدد حسابات يوتيوب (الأعمدة A-C)")
+    parser.add_argument("--seed-chatgpt", type=int, default=1000, help="عدد حسابات شات جي بي تي (الأعمدة F-H)")
+    parser.add_argument("--latency", default=None, help="fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MU,SIGMA")
+    parser.add_argument("--read-quota", type=int, default=None, help="حد طلبات القراءة بالدقيقة")
+    parser.add_argument("--write-quota", type=int, default=None, help="حد طلبات الكتابة بالدقيقة")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبة أخطاء 5xx العشوائية (0-1)")
+    args = parser.parse_args()
+
+    state = EmulatorState(args.latency, args.read_quota, args.write_quota, args.error_rate)
+    spreadsheet = state.spreadsheet(args.sheet_id)
+    spreadsheet.seed_product(1, args.seed_youtube, "yt")
+    spreadsheet.seed_product(6, args.seed_chatgpt, "gpt")
+
+    server = make_server(state, args.host, args.port)
+    print(f"📄 محاكي Sheets يعمل على http://{args.host}:{args.port} (الجدول: {args.sheet_id})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 الطلبات: {state.stats}")
+
+
+if __name__ == '__main__':
+    main()
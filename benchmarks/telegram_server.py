@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+خادم Bot API وهمي محلي لاختبار الحمل من البداية للنهاية
+
+يولد تحديثات getUpdates من مستخدمين وهميين حسب سيناريو أوامر، ويستقبل
+sendMessage / editMessageText / sendDocument مع تطبيق حدود تلقرام
+(لكل محادثة وعامة) بردود 429 retry_after، ويسجل الرسائل المسلّمة.
+
+تشغيل:
+    python -m benchmarks.telegram_server --port 8081 --users 500 --script "/start,/balance,/buy" --rate 50
+
+ثم تشغيل البوت عليه:
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python telegram_bot.py
+
+الإحصائيات الحالية: GET http://127.0.0.1:8081/stats
+"""
+
+import argparse
+import itertools
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "Load Test Bot", "username": "load_test_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+# الطرق التي ترسل رسالة للمستخدم وتخضع لحدود الإرسال
+SEND_METHODS = ("sendMessage", "editMessageText", "sendDocument")
+
+
+class TokenBucket:
+    """دلو رموز بسيط: rate رمز بالثانية بسعة burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        """أخذ رمز؛ يرجع 0 عند النجاح أو عدد الثواني حتى يتوفر رمز"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeBotApi:
+    """حالة الخادم: طابور التحديثات، حدود الإرسال والرسائل المسجلة"""
+
+    def __init__(self, users=100, script=("/start",), rate=10.0, first_user_id=100000,
+                 chat_rate=1.0, chat_burst=3, global_rate=30.0, record_file=None):
+        self.users = users
+        self.script = list(script)
+        self.rate = rate
+        self.first_user_id = first_user_id
+
+        self.updates = []
+        self.condition = threading.Condition()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.generation_done = False
+
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_buckets = {}
+        self._limit_lock = threading.Lock()
+
+        self.calls = Counter()
+        self.delivered = Counter()  # chat_id -> عدد الرسائل المسلمة
+        self.throttled = Counter()  # "chat" / "global" -> عدد ردود 429
+        self.record_file = open(record_file, "a", encoding="utf-8") if record_file else None
+        self._record_lock = threading.Lock()
+
+    # ===== توليد التحديثات =====
+
+    def make_update(self, user_id, text):
+        update_id = next(self._update_ids)
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"},
+            "text": text
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def generate(self):
+        """إضافة تحديثات السيناريو بالمعدل المحدد: كل خطوة تُرسل من جميع المستخدمين"""
+        interval = 1.0 / self.rate if self.rate else 0
+        next_at = time.monotonic()
+        for text in self.script:
+            for offset in range(self.users):
+                update = self.make_update(self.first_user_id + offset, text)
+                with self.condition:
+                    self.updates.append(update)
+                    self.condition.notify_all()
+                if interval:
+                    next_at += interval
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+        self.generation_done = True
+        print(f"✅ تم توليد {self.users * len(self.script)} تحديث")
+
+    def get_updates(self, offset, limit, timeout):
+        """getUpdates مع الانتظار الطويل: التحديثات ذات المعرف >= offset"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            # حذف التحديثات المؤكدة كما يفعل تلقرام
+            if offset:
+                self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.updates[:limit]
+
+    # ===== حدود الإرسال =====
+
+    def check_limits(self, chat_id):
+        """يرجع (السبب، ثواني الانتظار) عند تجاوز الحد أو None"""
+        with self._limit_lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            wait = bucket.acquire()
+            if wait:
+                return "chat", wait
+            wait = self.global_bucket.acquire()
+            if wait:
+                # إرجاع رمز المحادثة لأن الرسالة لم تُرسل
+                bucket.tokens += 1
+                return "global", wait
+        return None
+
+    def record(self, method, chat_id, message):
+        self.delivered[chat_id] += 1
+        if self.record_file:
+            entry = {"ts": time.time(), "method": method, "chat_id": chat_id,
+                     "text": message.get("text"), "document": "document" in message}
+            with self._record_lock:
+                self.record_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def message(self, chat_id, **fields):
+        return {
+            "message_id": fields.pop("message_id", None) or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **fields
+        }
+
+    # ===== تنفيذ الطرق =====
+
+    def call(self, method, params):
+        """تنفيذ طريقة Bot API؛ يرجع (حالة HTTP، جسم JSON)"""
+        self.calls[method] += 1
+
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+
+        if method == "getUpdates":
+            updates = self.get_updates(
+                int(params.get("offset") or 0),
+                int(params.get("limit") or 100),
+                float(params.get("timeout") or 0)
+            )
+            return 200, {"ok": True, "result": updates}
+
+        if method in SEND_METHODS:
+            chat_id = int(params.get("chat_id") or 0)
+            limited = self.check_limits(chat_id)
+            if limited:
+                reason, wait = limited
+                self.throttled[reason] += 1
+                retry_after = max(1, math.ceil(wait))
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after}
+                }
+
+            if method == "sendDocument":
+                message = self.message(chat_id, document={
+                    "file_id": f"doc{chat_id}", "file_unique_id": f"doc{chat_id}",
+                    "file_name": params.get("document_name") or "document"
+                }, caption=params.get("caption"))
+            else:
+                message = self.message(chat_id, message_id=params.get("message_id"), text=params.get("text", ""))
+            self.record(method, chat_id, message)
+            return 200, {"ok": True, "result": message}
+
+        # deleteWebhook، setMyCommands، answerCallbackQuery... تنجح دائماً
+        return 200, {"ok": True, "result": True}
+
+    def stats(self):
+        return {
+            "pending_updates": len(self.updates),
+            "generation_done": self.generation_done,
+            "calls": dict(self.calls),
+            "delivered_messages": sum(self.delivered.values()),
+            "chats_reached": len(self.delivered),
+            "throttled": dict(self.throttled)
+        }
+
+
+def parse_parameters(handler):
+    """قراءة معاملات الطلب من query أو form أو multipart أو JSON"""
+    params = {key: values[-1] for key, values in parse_qs(urlparse(handler.path).query).items()}
+    length = int(handler.headers.get("Content-Length") or 0)
+    if not length:
+        return params
+
+    body = handler.rfile.read(length)
+    content_type = handler.headers.get("Content-Type", "")
+    if content_type.startswith("application/json"):
+        params.update(json.loads(body or b"{}"))
+    elif content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=default_policy).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                params[f"{name}_name"] = part.get_filename()
+            else:
+                params[name] = part.get_content()
+    else:
+        params.update({key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()})
+    return params
+
+
+class BotApiHandler(BaseHTTPRequestHandler):
+    api = None  # FakeBotApi يُضبط عند التشغيل
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self):
+        path = urlparse(self.path).path
+        if path == "/stats":
+            self._send_json(200, self.api.stats())
+            return
+
+        match = re.match(r"^/bot[^/]+/(\w+)$", path)
+        if not match:
+            self._send_json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+
+        status, payload = self.api.call(match.group(1), parse_parameters(self))
+        self._send_json(status, payload)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(api, host="127.0.0.1", port=8081):
+    """خادم HTTP مربوط بحالة Bot API وهمية محددة"""
+    handler = type("BoundBotApiHandler", (BotApiHandler,), {"api": api})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="خادم Bot API وهمي لاختبار الحمل")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=100, help="عدد المستخدمين الوهميين")
+    parser.add_argument("--first-user-id", type=int, default=100000)
+    parser.add_argument("--script", default="/start,/balance,/buy", help="أوامر يرسلها كل مستخدم بالترتيب (مفصولة بفواصل)")
+    parser.add_argument("--rate", type=float, default=10.0, help="عدد التحديثات المولدة بالثانية (0 = دفعة واحدة)")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="رسائل بالثانية لكل محادثة")
+    parser.add_argument("--chat-burst", type=int, default=3, help="أقصى دفعة رسائل لكل محادثة")
+    parser.add_argument("--global-rate", type=float, default=30.0, help="رسائل بالثانية لجميع المحادثات")
+    parser.add_argument("--record", default=None, help="ملف JSONL لتسجيل الرسائل المسلمة")
+    args = parser.parse_args()
+
+    api = FakeBotApi(
+        users=args.users,
+        script=[text.strip() for text in args.script.split(",") if text.strip()],
+        rate=args.rate,
+        first_user_id=args.first_user_id,
+        chat_rate=args.chat_rate,
+        chat_burst=args.chat_burst,
+        global_rate=args.global_rate,
+        record_file=args.record
+    )
+    threading.Thread(target=api.generate, name="update-generator", daemon=True).start()
+
+    server = make_server(api, args.host, args.port)
+    print(f"🤖 خادم Bot API الوهمي يعمل على http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {json.dumps(api.stats(), ensure_ascii=False)}")
+    finally:
+        if api.record_file:
+            api.record_file.close()
+
+
+if __name__ == '__main__':
+    main()
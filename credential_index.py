@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from inventory import PRODUCTS
+from sheet_shards import shard_offset, split_row
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class CredentialIndex:
+    """فهرس إيميل -> صفوف كل المنتجات لكشف الحسابات المكررة بدون مسح الأعمدة"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locations = {}  # email -> {(product, row)}
+        self._claimed = set()  # إيميلات بيعت أو حُجزت من أي صف
+        self._last_row = {}  # (product, shard) -> آخر صف فيه إيميل داخل الورقة
+        self.built_at = None
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def build(self, columns):
+        """بناء الفهرس بمرور واحد على {product: [(email_col, status_col) لكل ورقة]} من الشيت"""
+        locations = {}
+        claimed = set()
+        last_row = {}
+
+        for product, shards in columns.items():
+            for shard, (email_col, status_col) in enumerate(shards):
+                last_row[(product, shard)] = max(len(email_col), 1)
+                offset = shard_offset(shard)
+                for i in range(1, len(email_col)):
+                    email = normalize_email(email_col[i])
+                    if not email:
+                        continue
+                    locations.setdefault(email, set()).add((product, i + 1 + offset))
+                    if i < len(status_col) and status_col[i].strip():
+                        claimed.add(email)
+
+        with self._lock:
+            self._locations = locations
+            self._claimed = claimed
+            self._last_row = last_row
+            self.built_at = time.time()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def contains(self, email):
+        return normalize_email(email) in self._locations
+
+    def locations(self, email):
+        return sorted(self._locations.get(normalize_email(email), ()))
+
+    def last_row(self, product, shard=0):
+        """آخر صف فيه إيميل للمنتج داخل الورقة"""
+        return self._last_row.get((product, shard), 1)
+
+    def add(self, product, row, email):
+        """تسجيل إيميل أُضيف للشيت؛ يرجع False إذا كان موجوداً مسبقاً في أي منتج"""
+        email = normalize_email(email)
+        with self._lock:
+            rows = self._locations.setdefault(email, set())
+            new = not rows
+            rows.add((product, row))
+            shard, local_row = split_row(row)
+            self._last_row[(product, shard)] = max(self.last_row(product, shard), local_row)
+        return new
+
+    def is_claimed(self, email):
+        return normalize_email(email) in self._claimed
+
+    def claim(self, accounts):
+        """تسجيل إيميلات حسابات بيعت أو حُجزت حتى لا يُعطى نفس الإيميل من صف آخر"""
+        with self._lock:
+            self._claimed.update(normalize_email(account['email']) for account in accounts)
+
+    def unclaim(self, accounts):
+        with self._lock:
+            self._claimed.difference_update(normalize_email(account['email']) for account in accounts)
+
+    def unclaimed(self, candidates):
+        """تصفية المرشحين: إيميل بيع من صف آخر أو تكرر في نفس الدفعة لا يُعطى"""
+        if not self.ready:
+            yield from candidates
+            return
+        seen = set()
+        for account in candidates:
+            email = normalize_email(account['email'])
+            if email in self._claimed or email in seen:
+                continue
+            seen.add(email)
+            yield account
+
+    def collisions(self):
+        """الإيميلات الموجودة في أكثر من صف {email: [(product, row), ...]}"""
+        with self._lock:
+            return {
+                email: sorted(rows)
+                for email, rows in self._locations.items()
+                if len(rows) > 1
+            }
+
+
+def index_columns(bot, fresh=True):
+    """قراءة أعمدة الإيميل والحالة لكل المنتجات في كل الأوراق لبناء الفهرس"""
+    return {
+        product: [
+            bot.read_columns(layout["email_col"], layout["status_col"], fresh=fresh, shard=shard)
+            for shard in range(bot.shard_count())
+        ]
+        for product, layout in PRODUCTS.items()
+    }
+
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# تخطيط أعمدة كل منتج في الشيت
+PRODUCTS = {
+    "youtube": {
+        "name": "يوتيوب",
+        "email_col": 1,  # العمود A
+        "password_col": 2,  # العمود B
+        "status_col": 3,  # العمود C
+    },
+    "chatgpt": {
+        "name": "شات جي بي تي",
+        "email_col": 6,  # العمود F
+        "password_col": 7,  # العمود G
+        "status_col": 8,  # العمود H
+    },
+}
+
+# علامة الحجز التي تُكتب في عمود الحالة للحسابات المحجوزة مسبقاً (فقط مع ACCOUNT_POOL_SIZE > 0)
+# الحساب المحجوز يُحسب متاحاً في الإحصائيات ولا يُعطى من الشيت مباشرة
+RESERVED_STATUS = "محجوز"
+
+
+def product_columns(product):
+    """أرقام أعمدة المنتج (الإيميل، كلمة المرور، الحالة)"""
+    layout = PRODUCTS[product]
+    return layout["email_col"], layout["password_col"], layout["status_col"]
+
+
+def iter_available_rows(email_col, password_col, status_col, skip_rows=None, row_offset=0):
+    """المرور على الحسابات المتاحة (بدون حالة) بدءاً من الصف 2
+
+    row_offset يضاف لرقم الصف (أرقام الصفوف العامة للأوراق الإضافية)
+    """
+    skip_rows = skip_rows or ()
+    max_len = max(len(email_col), len(password_col), len(status_col))
+
+    for i in range(1, max_len):  # البداية من الصف 2 (index 1)
+        row = i + 1 + row_offset  # رقم الصف الفعلي في الشيت
+        if row in skip_rows:
+            continue
+
+        email = email_col[i].strip() if i < len(email_col) and email_col[i] else ''
+        password = password_col[i].strip() if i < len(password_col) and password_col[i] else ''
+        status = status_col[i].strip() if i < len(status_col) and status_col[i] else ''
+
+        if email and password and not status:
+            yield {
+                'row': row,
+                'email': email,
+                'password': password
+            }
+
+
+def count_rows(email_col, password_col, status_col):
+    """(المتاح، المُستخدم، عدد الصفوف مع العناوين) لأعمدة منتج"""
+    available = 0
+    used = 0
+    max_len = max(len(email_col), len(password_col), len(status_col))
+
+    for i in range(1, max_len):  # البداية من الصف 2
+        email = email_col[i].strip() if i < len(email_col) and email_col[i] else ''
+        password = password_col[i].strip() if i < len(password_col) and password_col[i] else ''
+        status = status_col[i].strip() if i < len(status_col) and status_col[i] else ''
+
+        if email and password:
+            # الحسابات المحجوزة في المخزون ما زالت متاحة للبيع
+            if status and status != RESERVED_STATUS:
+                used += 1
+            else:
+                available += 1
+
+    return available, used, max_len
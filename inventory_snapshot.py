@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from inventory import PRODUCTS
+from sheet_shards import split_row
+
+logger = logging.getLogger(__name__)
+
+# أعمدة المخزون المحفوظة: A, B, C ليوتيوب و F, G, H لشات جي بي تي
+SNAPSHOT_COLUMNS = (1, 2, 3, 6, 7, 8)
+
+
+class InventorySnapshot:
+    """نسخة محلية مضغوطة من أعمدة المخزون مع مراجعة الشيت لتشغيل فوري بعد إعادة التشغيل"""
+
+    def __init__(self, snapshot_file="inventory_snapshot.json.gz"):
+        self.snapshot_file = snapshot_file
+        self._lock = threading.Lock()
+        self.columns = {}  # (رقم الورقة، رقم العمود) -> القيم
+        self.revision = None  # وقت آخر تعديل لكل جدول (modifiedTime من Drive)
+        self.ledger_id = 0  # آخر عملية في سجل المشتريات عند الحفظ (ما بعدها لا يظهر في النسخة)
+        self.saved_at = None
+        self._mtime = None  # وقت تعديل الملف عند آخر تحميل أو حفظ
+        # تُخدم القراءات من النسخة حتى يتم التحقق منها مقابل الشيت
+        self.warm = False
+
+    def load(self):
+        """تحميل النسخة المحفوظة؛ يرجع True إذا أصبحت القراءات تُخدم منها"""
+        self.warm = self._read_file()
+        return self.warm
+
+    def reload(self):
+        """إعادة تحميل الملف إذا حفظته عملية أخرى بعد آخر تحميل؛ يرجع True إذا كانت هناك أعمدة
+
+        تقرأ الملف وتفك ضغطه: تُستدعى من خيط وليس من حلقة الأحداث
+        """
+        try:
+            mtime = os.path.getmtime(self.snapshot_file)
+        except OSError:
+            return bool(self.columns)
+        if mtime != self._mtime:
+            self._read_file()
+        return bool(self.columns)
+
+    def _read_file(self):
+        if not os.path.exists(self.snapshot_file):
+            return False
+        try:
+            mtime = os.path.getmtime(self.snapshot_file)
+            with gzip.open(self.snapshot_file, 'rt', encoding='utf-8') as f:
+                state = json.load(f)
+            with self._lock:
+                self.columns = {
+                    tuple(int(part) for part in key.split(":")): values
+                    for key, values in state["columns"].items()
+                }
+                self.revision = state.get("revision")
+                self.ledger_id = state.get("ledger_id", 0)
+                self.saved_at = state.get("saved_at")
+                self._mtime = mtime
+            return bool(self.columns)
+        except Exception as e:
+            logger.error("خطأ في تحميل نسخة المخزون: %s", e)
+            return False
+
+    def save(self, columns, revision, ledger_id=0):
+        """حفظ الأعمدة {(shard, column): values} ومراجعتها بشكل ذري"""
+        state = {
+            "revision": revision,
+            "ledger_id": ledger_id,
+            "saved_at": time.time(),
+            "columns": {f"{shard}:{column}": values for (shard, column), values in columns.items()}
+        }
+        # ملف مؤقت فريد: عدة عمليات قد تحفظ نفس النسخة في نفس الوقت
+        directory = os.path.dirname(os.path.abspath(self.snapshot_file))
+        with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(self.snapshot_file),
+                                         suffix=".tmp", delete=False) as raw:
+            temp_file = raw.name
+            try:
+                with gzip.open(raw, 'wt', encoding='utf-8') as f:
+                    json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+            except Exception:
+                raw.close()
+                os.remove(temp_file)
+                raise
+        os.replace(temp_file, self.snapshot_file)
+
+        with self._lock:
+            self.columns = dict(columns)
+            self.revision = revision
+            self.ledger_id = ledger_id
+            self.saved_at = state["saved_at"]
+            self._mtime = os.path.getmtime(self.snapshot_file)
+
+    def has(self, columns, shard=0):
+        return all((shard, column) in self.columns for column in columns)
+
+    def read(self, columns, taken_rows, shard=0):
+        """نسخ أعمدة ورقة مع تعليم الصفوف المعروف محلياً أنها خرجت من المخزون بعد الحفظ
+
+        taken_rows: {product: {row: status}} بأرقام الصفوف العامة من سجل المشتريات (بعد ledger_id) والعمليات المفتوحة والمخزون المحجوز
+        """
+        with self._lock:
+            result = {column: list(self.columns[(shard, column)]) for column in columns}
+
+        for product, rows in taken_rows.items():
+            status_values = result.get(PRODUCTS[product]["status_col"])
+            if status_values is None:
+                continue
+            for global_row, status in rows.items():
+                row_shard, row = split_row(global_row)
+                if row_shard != shard:
+                    continue
+                if len(status_values) < row:
+                    status_values.extend([''] * (row - len(status_values)))
+                if not status_values[row - 1].strip():
+                    status_values[row - 1] = status
+
+        return [result[column] for column in columns]
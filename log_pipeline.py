@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# حقول منظمة تضاف للسجل عبر extra={...}
+STRUCTURED_FIELDS = ("user_id", "command", "latency_ms", "product", "count")
+
+# أنماط القيم الحساسة التي لا يجب أن تصل لأي سجل
+_REDACTIONS = (
+    (re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----.*?(-----END [A-Z ]*PRIVATE KEY-----|$)", re.S), "[REDACTED KEY]"),
+    (re.compile(r'("private_key(?:_id)?"\s*:\s*")[^"]*'), r"\1[REDACTED]"),
+    (re.compile(r"\b\d{6,12}:[A-Za-z0-9_-]{30,}\b"), "[REDACTED TOKEN]"),
+    (re.compile(r"(?i)\b(password|passwd|token|secret)(\s*[=:]\s*)\S+"), r"\1\2[REDACTED]"),
+)
+
+
+def redact(text):
+    """إخفاء المفاتيح ورموز البوت وكلمات المرور من نص السجل"""
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class RedactingFormatter(logging.Formatter):
+    """تنسيق نصي عادي مع إخفاء القيم الحساسة"""
+
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """سجل JSON واحد في كل سطر مع الحقول المنظمة"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """تمرير نسبة فقط من السجلات المعلمة extra={"sampled": True} (مسارات ساخنة)"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """يضع السجل في الطابور كما هو: التنسيق يتم في خيط المستمع وليس في حلقة الأحداث"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # إسقاط السجل أفضل من تأخير التحديثات
+            self.dropped += 1
+
+
+def setup_logging(level=logging.INFO, log_format="text", sample_rate=1.0, queue_size=10000):
+    """توجيه كل السجلات عبر طابور إلى خيط خلفي يكتبها؛ يرجع المستمع"""
+    log_queue = queue.Queue(maxsize=queue_size)
+
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if log_format == "json" else RedactingFormatter(TEXT_FORMAT))
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # httpx يسجل كل طلب لتلقرام (مع رمز البوت في الرابط)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+
+    def stop_listener():
+        # كتابة ما تبقى في الطابور عند الخروج (إن لم يُوقف المستمع مسبقاً)
+        if listener._thread is not None:
+            listener.stop()
+
+    atexit.register(stop_listener)
+    return listener
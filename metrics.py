@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# حدود فئات زمن الاستجابة بالثواني
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+
+class Histogram:
+    """توزيع القيم على فئات ثابتة بصيغة Prometheus"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """تقدير الحد الأعلى للنسبة المئوية من الفئات"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self.buckets[-1]
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels_key, extra=None):
+    pairs = list(labels_key) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+class MetricsRegistry:
+    """سجل العدادات والتوزيعات المشترك بين المعالجات والخيوط"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (الاسم، الوسوم) -> القيمة
+        self.histograms = {}  # (الاسم، الوسوم) -> Histogram
+
+    def inc(self, name, amount=1, **labels):
+        """زيادة عداد"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """تسجيل قيمة في توزيع"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """قياس زمن كتلة كود مع عد الأخطاء"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def histogram_items(self, name):
+        """جميع توزيعات اسم معين مع وسومها"""
+        with self._lock:
+            return [(dict(labels), histogram) for (key, labels), histogram in self.histograms.items() if key == name]
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self.counters.get((name, _labels_key(labels)), 0)
+
+    def render_prometheus(self):
+        """تصدير جميع المقاييس بصيغة نص Prometheus"""
+        lines = []
+        with self._lock:
+            for name in sorted({key for key, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (key, labels), value in sorted(self.counters.items()):
+                    if key == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+            for name in sorted({key for key, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (key, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels, [("le", _format_bound(bound))])
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+# السجل العام المستخدم في البوت
+metrics = MetricsRegistry()
+
+
+def instrument_handler(name, callback, registry=metrics):
+    """تغليف معالج تلقرام لقياس زمنه وعدد مرات استدعائه وأخطائه"""
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        registry.inc("handler_calls_total", handler=name)
+        start = time.perf_counter()
+        try:
+            with registry.time("handler", handler=name):
+                return await callback(update, context)
+        finally:
+            # سجل وصول منظم بعينة فقط حتى لا يكلف كل تحديث كتابة سجل
+            user = getattr(update, "effective_user", None)
+            logger.info(
+                "handler %s", name,
+                extra={
+                    "sampled": True,
+                    "command": name,
+                    "user_id": user.id if user else None,
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 2)
+                }
+            )
+
+    return wrapper
+
+
+class InstrumentedWorksheet:
+    """غلاف لورقة gspread يقيس كل استدعاء لـ Sheets API"""
+
+    def __init__(self, worksheet, registry=metrics):
+        self._worksheet = worksheet
+        self._registry = registry
+
+    def __getattr__(self, name):
+        attribute = getattr(self._worksheet, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+
+        registry = self._registry
+
+        @functools.wraps(attribute)
+        def wrapper(*args, **kwargs):
+            registry.inc("sheets_calls_total", method=name)
+            with registry.time("sheets_call", method=name):
+                return attribute(*args, **kwargs)
+
+        return wrapper
+
+
+def instrument_database(user_db, registry=metrics):
+    """قياس زمن حفظ قاعدة البيانات وعدد البايتات المكتوبة"""
+    save_database = user_db.save_database
+
+    @functools.wraps(save_database)
+    def wrapper():
+        registry.inc("db_saves_total")
+        with registry.time("db_save"):
+            result = save_database()
+        if not result:
+            registry.inc("db_save_errors_total")
+        registry.inc("db_bytes_written_total", user_db.last_save_bytes)
+        return result
+
+    user_db.save_database = wrapper
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = metrics
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # عدم إغراق السجل بطلبات الجمع الدورية
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0", registry=metrics):
+    """تشغيل خادم HTTP في خيط خلفي يعرض /metrics بصيغة Prometheus"""
+    handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info("📈 خادم المقاييس يعمل على المنفذ %s", port)
+    return server
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import marshal
+import pstats
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilerController:
+    """تشغيل cProfile و tracemalloc عند الطلب لعدد من التحديثات أو لمدة محددة
+
+    عند التعطيل تكلفة كل تحديث فحص متغير واحد فقط
+    """
+
+    def __init__(self, scoped_classes=(), top_n=15):
+        self.active = False
+        self.top_n = top_n
+        self.handler_names = set()
+        self._scoped_methods = self._collect_methods(scoped_classes)
+
+        self._profile = None
+        self._memory_start = None
+        self._remaining_updates = None
+        self._timer = None
+        self._on_finish = None
+        self._started_at = None
+        self._updates_seen = 0
+
+    @staticmethod
+    def _collect_methods(classes):
+        """ربط (الملف، السطر، الاسم) لكل دالة بالاسم الكامل Class.method"""
+        methods = {}
+        for cls in classes:
+            for name, member in inspect.getmembers(cls, inspect.isfunction):
+                code = member.__code__
+                methods[(code.co_filename, code.co_firstlineno, code.co_name)] = f"{cls.__name__}.{name}"
+        return methods
+
+    def wrap(self, callback):
+        """تغليف معالج لعد التحديثات أثناء فترة التحليل"""
+        self.handler_names.add(callback.__name__)
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            try:
+                return await callback(update, context)
+            finally:
+                if self.active:
+                    self._count_update()
+
+        return wrapper
+
+    def start(self, on_finish, updates=None, seconds=None):
+        """بدء التحليل لعدد من التحديثات أو لمدة بالثواني
+
+        on_finish(report_text, profile_bytes) دالة async تُستدعى عند الانتهاء
+        """
+        if self.active:
+            return False
+
+        self._on_finish = on_finish
+        self._remaining_updates = updates
+        self._updates_seen = 0
+        self._started_at = time.monotonic()
+
+        tracemalloc.start()
+        self._memory_start = tracemalloc.take_snapshot()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self.active = True
+
+        if seconds:
+            self._timer = asyncio.get_running_loop().call_later(seconds, self._schedule_finish)
+        logger.info("🔬 بدء التحليل (تحديثات: %s، ثواني: %s)", updates, seconds)
+        return True
+
+    def _count_update(self):
+        self._updates_seen += 1
+        if self._remaining_updates is not None:
+            self._remaining_updates -= 1
+            if self._remaining_updates <= 0:
+                self._schedule_finish()
+
+    def _schedule_finish(self):
+        if self.active:
+            asyncio.get_running_loop().create_task(self.finish())
+
+    async def finish(self):
+        """إيقاف التحليل وإرسال التقرير"""
+        if not self.active:
+            return
+        self.active = False
+        self._profile.disable()
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        memory_end = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        report = self.build_report(memory_end)
+        self._profile.create_stats()
+        profile_bytes = marshal.dumps(self._profile.stats)
+
+        on_finish = self._on_finish
+        self._profile = None
+        self._memory_start = None
+        self._on_finish = None
+        logger.info("🔬 انتهى التحليل")
+
+        if on_finish:
+            await on_finish(report, profile_bytes)
+
+    def build_report(self, memory_end):
+        """ملخص أعلى النقاط الساخنة مقسم حسب المعالج ودوال البوت وقاعدة البيانات"""
+        duration = time.monotonic() - self._started_at
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+
+        handler_lines = []
+        method_lines = []
+        for (filename, lineno, funcname), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            scoped_name = self._scoped_methods.get((filename, lineno, funcname))
+            if scoped_name:
+                method_lines.append((cumtime, f"• `{scoped_name}`: {calls} مرة | {cumtime * 1000:.1f}ms"))
+            elif funcname in self.handler_names:
+                handler_lines.append((cumtime, f"• `{funcname}`: {calls} استئناف | {cumtime * 1000:.1f}ms"))
+
+        hotspots = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:self.top_n]
+
+        report = f"🔬 **تقرير التحليل** ({self._updates_seen} تحديث خلال {duration:.1f} ثانية)\n\n"
+        report += "⚙️ **المعالجات (وقت المعالج على خيط البوت):**\n"
+        report += "\n".join(line for _, line in sorted(handler_lines, reverse=True)[:self.top_n]) or "• لا يوجد"
+        report += "\n\n🧩 **دوال البوت وقاعدة البيانات:**\n"
+        report += "\n".join(line for _, line in sorted(method_lines, reverse=True)[:self.top_n]) or "• لا يوجد"
+        report += f"\n\n🔥 **أعلى {self.top_n} دوال (الوقت الذاتي):**\n"
+        for (filename, lineno, funcname), (_, calls, tottime, cumtime, _) in hotspots:
+            short_name = filename.rsplit('/', 1)[-1]
+            report += f"• `{short_name}:{lineno}({funcname})`: {tottime * 1000:.1f}ms ذاتي | {calls} مرة\n"
+
+        report += "\n🧠 **أعلى تخصيصات الذاكرة:**\n"
+        for diff in memory_end.compare_to(self._memory_start, 'lineno')[:5]:
+            frame = diff.traceback[0]
+            short_name = frame.filename.rsplit('/', 1)[-1]
+            report += f"• `{short_name}:{frame.lineno}`: {diff.size_diff / 1024:+.1f} KiB\n"
+
+        return report
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+from shared_store import Transactions, connect
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchase_journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    username TEXT,
+    first_name TEXT,
+    timestamp TEXT,
+    state TEXT NOT NULL,
+    accounts TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS purchase_journal_state ON purchase_journal (state, id);
+"""
+
+# مراحل عملية الشراء بالترتيب: نية -> حجز الحسابات -> خصم الكريدت -> تسليم
+INTENT = "intent"
+RESERVED = "reserved"
+DEBITED = "debited"
+DELIVERED = "delivered"
+COMPENSATED = "compensated"  # أُعيدت الحسابات للمخزون بدون خصم
+FAILED = "failed"  # لم يُحجز أي حساب
+
+FINAL_STATES = (DELIVERED, COMPENSATED, FAILED)
+
+_COLUMNS = ("id", "product", "count", "user_id", "chat_id", "username", "first_name",
+            "timestamp", "state", "accounts", "created_at", "updated_at")
+
+
+class PurchaseJournal:
+    """سجل دائم لمراحل كل عملية شراء لإكمالها أو التراجع عنها بعد توقف مفاجئ"""
+
+    def __init__(self, journal_file="purchase_journal.sqlite3"):
+        self.journal_file = journal_file
+        connection = connect(journal_file, JOURNAL_SCHEMA)
+        # كل مرحلة تُكتب على القرص قبل تنفيذ الخطوة التالية
+        connection.execute("PRAGMA synchronous=FULL")
+        self.transactions = Transactions(connection)
+        # العمليات التي بدأت قبل هذا الوقت تخص تشغيلاً سابقاً توقف
+        self.opened_at = time.time()
+
+    def _to_dict(self, row):
+        entry = dict(zip(_COLUMNS, row))
+        entry["accounts"] = json.loads(entry["accounts"]) if entry["accounts"] else []
+        return entry
+
+    def begin(self, product, count, user_id, chat_id, username=None, first_name=None, timestamp=None):
+        """تسجيل نية الشراء قبل أي تعديل على المخزون أو الكريدت؛ يرجع رقم العملية"""
+        now = time.time()
+        return self.transactions.run(lambda connection: connection.execute(
+            "INSERT INTO purchase_journal (product, count, user_id, chat_id, username, first_name, timestamp, "
+            "state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (product, count, user_id, chat_id, username, first_name, timestamp, INTENT, now, now)
+        ).lastrowid)
+
+    def _set_state(self, journal_id, state, accounts=None):
+        if journal_id is None:
+            return
+        if accounts is None:
+            sql, parameters = "UPDATE purchase_journal SET state = ?, updated_at = ? WHERE id = ?", \
+                (state, time.time(), journal_id)
+        else:
+            sql, parameters = "UPDATE purchase_journal SET state = ?, accounts = ?, updated_at = ? WHERE id = ?", \
+                (state, json.dumps(accounts, ensure_ascii=False), time.time(), journal_id)
+        self.transactions.run(lambda connection: connection.execute(sql, parameters))
+
+    def reserve(self, journal_id, accounts):
+        """تسجيل الحسابات المختارة قبل كتابتها كمُستخدمة في الشيت"""
+        self._set_state(journal_id, RESERVED, accounts)
+
+    def debited(self, journal_id):
+        self._set_state(journal_id, DEBITED)
+
+    def finish(self, journal_id, state=DELIVERED):
+        self._set_state(journal_id, state)
+
+    def get(self, journal_id):
+        rows = self.transactions.query(
+            f"SELECT {', '.join(_COLUMNS)} FROM purchase_journal WHERE id = ?", (journal_id,)
+        )
+        return self._to_dict(rows[0]) if rows else None
+
+    def unfinished(self, before=None):
+        """عمليات التشغيلات السابقة التي لم تصل لحالة نهائية (بالترتيب)"""
+        rows = self.transactions.query(
+            f"SELECT {', '.join(_COLUMNS)} FROM purchase_journal "
+            "WHERE state NOT IN (?, ?, ?) AND created_at < ? ORDER BY id",
+            (*FINAL_STATES, before or self.opened_at)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def open_accounts(self):
+        """[(product, account)] للعمليات التي حجزت حسابات ولم تنتهِ (من أي تشغيل)"""
+        rows = self.transactions.query(
+            "SELECT product, accounts FROM purchase_journal WHERE state IN (?, ?)", (RESERVED, DEBITED)
+        )
+        return [(product, account) for product, accounts in rows for account in json.loads(accounts or "[]")]
+
+    def prune(self, max_age=7 * 24 * 3600):
+        """حذف العمليات المنتهية القديمة"""
+        return self.transactions.run(lambda connection: connection.execute(
+            "DELETE FROM purchase_journal WHERE state IN (?, ?, ?) AND updated_at < ?",
+            (*FINAL_STATES, time.time() - max_age)
+        ).rowcount)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+
+from shared_store import Transactions, connect
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    username TEXT,
+    product TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    purchased_at TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT 'bot',
+    refunded_at TEXT
+);
+-- الصف قد يُعاد ملؤه بحساب جديد: التكرار هو نفس الحساب في نفس الصف فقط
+DROP INDEX IF EXISTS purchases_product_row;
+CREATE UNIQUE INDEX IF NOT EXISTS purchases_product_row_email ON purchases (product, row, email);
+CREATE INDEX IF NOT EXISTS purchases_user ON purchases (user_id, purchased_at);
+CREATE INDEX IF NOT EXISTS purchases_time ON purchases (purchased_at);
+-- البحث بالإيميل لا يفرق بين الأحرف الكبيرة والصغيرة (إيميل منسوخ بحالة مختلفة)
+DROP INDEX IF EXISTS purchases_email;
+CREATE INDEX IF NOT EXISTS purchases_email_nocase ON purchases (email COLLATE NOCASE);
+"""
+
+_COLUMNS = "id, user_id, username, product, row, email, purchased_at, source, refunded_at"
+
+# صيغ الشيت الحالية: العمود D "123 (@user) - name" والعمود H "مُستخدم - @user - وقت"
+_YOUTUBE_INFO_RE = re.compile(r"^\s*(\d+)(?:\s*\(@([^)]*)\))?")
+_CHATGPT_STATUS_RE = re.compile(r"^\s*مُستخدم\s*-\s*(?:@(\S+)|User_(\d+))\s*-\s*(.+?)\s*$")
+
+logger = logging.getLogger(__name__)
+
+
+class PurchaseLedger:
+    """سجل محلي لكل عملية شراء مفهرس بالمستخدم والمنتج والوقت وصف الشيت"""
+
+    def __init__(self, ledger_file="purchases.sqlite3"):
+        self.ledger_file = ledger_file
+        self.transactions = Transactions(connect(ledger_file, LEDGER_SCHEMA))
+
+    @staticmethod
+    def _to_dict(row):
+        return dict(zip(("id", "user_id", "username", "product", "row", "email",
+                         "purchased_at", "source", "refunded_at"), row))
+
+    def record(self, user_id, username, product, accounts, purchased_at, source="bot"):
+        """تسجيل حسابات مشتراة؛ نفس الحساب في نفس الصف المسجل مسبقاً يُتجاهل (مثل إعادة التسجيل عند الاستعادة)"""
+        rows = [
+            (user_id, username, product, account['row'], account['email'], purchased_at, source)
+            for account in accounts
+        ]
+        recorded = self.transactions.run(lambda connection: connection.executemany(
+            "INSERT OR IGNORE INTO purchases (user_id, username, product, row, email, purchased_at, source) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        ).rowcount)
+        if recorded < len(rows):
+            logger.info("تم تجاهل %d عملية مسجلة مسبقاً لمنتج %s للمستخدم %s", len(rows) - recorded, product, user_id)
+        return recorded
+
+    def user_history(self, user_id, limit=10, offset=0):
+        """مشتريات المستخدم من الأحدث للأقدم"""
+        rows = self.transactions.query(
+            f"SELECT {_COLUMNS} FROM purchases WHERE user_id = ? "
+            "ORDER BY purchased_at DESC, id DESC LIMIT ? OFFSET ?",
+            (user_id, limit, offset)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def user_summary(self, user_id):
+        """عدد مشتريات المستخدم لكل منتج (بدون المستردة)"""
+        rows = self.transactions.query(
+            "SELECT product, COUNT(*) FROM purchases WHERE user_id = ? AND refunded_at IS NULL GROUP BY product",
+            (user_id,)
+        )
+        return dict(rows)
+
+    def get(self, purchase_id):
+        rows = self.transactions.query(f"SELECT {_COLUMNS} FROM purchases WHERE id = ?", (purchase_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def find_by_email(self, email):
+        rows = self.transactions.query(
+            f"SELECT {_COLUMNS} FROM purchases WHERE email = ? COLLATE NOCASE ORDER BY id", (email.strip(),)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def find_by_row(self, product, row):
+        """كل مشتريات صف (قد يكون أُعيد ملؤه بحسابات مختلفة) من الأقدم للأحدث"""
+        rows = self.transactions.query(
+            f"SELECT {_COLUMNS} FROM purchases WHERE product = ? AND row = ? ORDER BY id", (product, row)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def between(self, start, end, limit=100):
+        """المشتريات في فترة زمنية (نصوص بصيغة %Y-%m-%d %H:%M:%S)"""
+        rows = self.transactions.query(
+            f"SELECT {_COLUMNS} FROM purchases WHERE purchased_at >= ? AND purchased_at < ? "
+            "ORDER BY purchased_at LIMIT ?",
+            (start, end, limit)
+        )
+        return [self._to_dict(row) for row in rows]
+
+    def mark_refunded(self, purchase_id, refunded_at):
+        """تعليم عملية كمستردة مرة واحدة فقط؛ يرجع العملية أو None إذا كانت مستردة أو غير موجودة"""
+
+        def work(connection):
+            cursor = connection.execute(
+                "UPDATE purchases SET refunded_at = ? WHERE id = ? AND refunded_at IS NULL",
+                (refunded_at, purchase_id)
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = connection.execute(f"SELECT {_COLUMNS} FROM purchases WHERE id = ?", (purchase_id,)).fetchone()
+            return self._to_dict(row)
+
+        return self.transactions.run(work)
+
+    def rows(self, product, after_id=0):
+        """صفوف الشيت المباعة لمنتج (بعد عملية معينة فقط مع after_id)"""
+        return {row for row, in self.transactions.query(
+            "SELECT row FROM purchases WHERE id > ? AND product = ?", (after_id, product)
+        )}
+
+    def last_id(self):
+        return self.transactions.query("SELECT COALESCE(MAX(id), 0) FROM purchases")[0][0]
+
+    def count(self):
+        return self.transactions.query("SELECT COUNT(*) FROM purchases")[0][0]
+
+    # ===== الاستيراد من الشيت =====
+
+    def backfill(self, youtube_columns, chatgpt_columns, resolve_username=None, row_offset=0):
+        """استيراد المشتريات القديمة من أعمدة الشيت (مرة واحدة، الحسابات المسجلة في نفس الصف تُتجاهل)
+
+        youtube_columns: (الإيميل، الحالة، معلومات المستخدم) للأعمدة A, C, D
+        chatgpt_columns: (الإيميل، الحالة) للأعمدة F, H
+        row_offset: بداية أرقام الصفوف العامة للورقة (الأوراق الإضافية)
+        """
+        purchases = []
+
+        email_col, status_col, info_col = youtube_columns
+        for i in range(1, len(email_col)):
+            status = status_col[i].strip() if i < len(status_col) else ''
+            info = info_col[i].strip() if i < len(info_col) else ''
+            if not email_col[i].strip() or not status.startswith("مُستخدم"):
+                continue
+            match = _YOUTUBE_INFO_RE.match(info)
+            purchases.append((
+                int(match.group(1)) if match else None,
+                match.group(2) if match else None,
+                "youtube", i + 1 + row_offset, email_col[i].strip(), ""
+            ))
+
+        email_col, status_col = chatgpt_columns
+        for i in range(1, len(email_col)):
+            status = status_col[i].strip() if i < len(status_col) else ''
+            match = _CHATGPT_STATUS_RE.match(status)
+            if not email_col[i].strip() or not match:
+                continue
+            username, user_id, purchased_at = match.groups()
+            if user_id is None and username and resolve_username:
+                user_id = resolve_username(username)
+            purchases.append((
+                int(user_id) if user_id else None, username,
+                "chatgpt", i + 1 + row_offset, email_col[i].strip(), purchased_at
+            ))
+
+        return self.transactions.run(lambda connection: connection.executemany(
+            "INSERT OR IGNORE INTO purchases (user_id, username, product, row, email, purchased_at, source) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'backfill')",
+            purchases
+        ).rowcount)
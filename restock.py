@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+
+from gspread.utils import rowcol_to_a1
+
+from inventory import product_columns
+from sheet_shards import shard_offset
+
+# الفواصل المدعومة بين الإيميل وكلمة المرور (email:password أو CSV أو TSV)
+_SEPARATOR_RE = re.compile(r"[:,;\t|]")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def parse_account_line(line):
+    """استخراج (الإيميل، كلمة المرور) من سطر، أو None إذا كان السطر غير صالح"""
+    line = line.strip()
+    match = _SEPARATOR_RE.search(line)
+    if not match:
+        return None
+    email = line[:match.start()].strip().strip('"\'')
+    password = line[match.end():].strip()
+    if match.group() != ':':
+        # في CSV كلمة المرور هي العمود الثاني فقط
+        password = re.split(r"[,;\t|]", password, maxsplit=1)[0].strip()
+    password = password.strip('"\'')
+    if not password or not _EMAIL_RE.match(email):
+        return None
+    return email, password
+
+
+class Restocker:
+    """إضافة حسابات من ملف إلى أعمدة منتج في الشيت بدفعات كبيرة بدون تحميل الملف كاملاً"""
+
+    def __init__(self, bot, product, batch_size=5000):
+        self.bot = bot
+        self.product = product
+        self.batch_size = batch_size
+
+        self.index = bot.credentials
+        self.seen = set()  # إيميلات الملف التي لم تُكتب بعد
+        self.shard = 0
+        self.next_row = 2  # داخل الورقة المختارة
+        self.lines = 0
+        self.added = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    def prepare(self):
+        """إعادة بناء فهرس الإيميلات من الشيت (مرور واحد) واختيار الورقة الأقل صفوفاً للمنتج"""
+        self.bot.refresh_credential_index()
+        self.shard = min(
+            range(self.bot.shard_count()),
+            key=lambda shard: (self.index.last_row(self.product, shard), shard)
+        )
+        self.next_row = self.index.last_row(self.product, self.shard) + 1
+
+    @property
+    def product_columns(self):
+        return product_columns(self.product)
+
+    def batches(self, stream):
+        """المرور على أسطر الملف وإرجاع دفعات [[email, password], ...] جديدة وصالحة"""
+        batch = []
+        for line in stream:
+            self.lines += 1
+            if not line.strip():
+                continue
+            account = parse_account_line(line)
+            if account is None:
+                # سطر العناوين في CSV ليس خطأ
+                if self.lines > 1 or not line.lower().lstrip('"\'').startswith("email"):
+                    self.invalid += 1
+                continue
+            # الإيميل موجود في أي منتج أو تكرر في نفس الملف
+            key = account[0].lower()
+            if key in self.seen or self.index.contains(key):
+                self.duplicates += 1
+                continue
+            self.seen.add(key)
+            batch.append(list(account))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def write(self, batch):
+        """كتابة دفعة في الصفوف التالية بطلب واحد"""
+        email_col, password_col, _ = self.product_columns
+        first_row = self.next_row
+        last_row = first_row + len(batch) - 1
+
+        worksheet = self.bot.shards[self.shard]
+        with self.bot.claim_lock:
+            row_count = getattr(worksheet, 'row_count', None)
+            if row_count is not None and last_row > row_count:
+                worksheet.add_rows(last_row - row_count)
+            worksheet.update(
+                f"{rowcol_to_a1(first_row, email_col)}:{rowcol_to_a1(last_row, password_col)}",
+                batch
+            )
+            self.bot.read_cache.invalidate()
+
+        for offset, (email, _) in enumerate(batch):
+            self.index.add(self.product, shard_offset(self.shard) + first_row + offset, email)
+            self.seen.discard(email.lower())
+        self.next_row = last_row + 1
+        self.added += len(batch)
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from user_database import UserDatabase
+
+logger = logging.getLogger(__name__)
+
+# الحقول التي لها أعمدة خاصة وتُعدل بعمليات SQL ذرية؛ الباقي يُحفظ كـ JSON
+_COLUMN_FIELDS = ("credits", "total_purchases", "is_banned")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    credits INTEGER NOT NULL DEFAULT 0,
+    total_purchases INTEGER NOT NULL DEFAULT 0,
+    is_banned INTEGER NOT NULL DEFAULT 0,
+    profile TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_version ON users (version);
+
+CREATE TABLE IF NOT EXISTS leases (
+    product TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (product, row)
+);
+
+CREATE TABLE IF NOT EXISTS leader (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS updates (
+    update_id INTEGER PRIMARY KEY,
+    partition INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS updates_partition ON updates (partition, update_id);
+"""
+
+
+def connect(path, schema=SCHEMA):
+    """اتصال SQLite مشترك بين العمليات (WAL + انتظار الأقفال بدل الفشل)"""
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=30000")
+    connection.executescript(schema)
+    return connection
+
+
+class Transactions:
+    """معاملات BEGIN IMMEDIATE على اتصال واحد محمي بقفل (للاستخدام من عدة خيوط)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.RLock()
+
+    def run(self, work):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self.connection)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+            return result
+
+    def query(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+
+def _next_version(connection):
+    connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+    return connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+
+class SharedUserDatabase(UserDatabase):
+    """قاعدة مستخدمين مشتركة بين عدة عمليات عبر SQLite
+
+    الكريدت والمشتريات والحظر تُعدل بعمليات SQL ذرية، وبقية بيانات المستخدم تُكتب
+    عند الحفظ. كل عملية تحتفظ بنسخة محلية للفهارس وتُحدثها بـ sync() من الصفوف
+    التي تغير إصدارها.
+    """
+
+    def __init__(self, store_file="bot_store.sqlite3", import_file="users.json"):
+        self.import_file = import_file
+        self.transactions = Transactions(connect(store_file))
+        self.synced_version = 0
+        self._dirty = set()
+        super().__init__(store_file)
+
+    # ===== التحويل بين الصف والقاموس =====
+
+    @staticmethod
+    def _row_to_user(credits, total_purchases, is_banned, profile):
+        user = json.loads(profile)
+        user["credits"] = credits
+        user["total_purchases"] = total_purchases
+        user["is_banned"] = bool(is_banned)
+        return user
+
+    @staticmethod
+    def _profile(user):
+        return json.dumps({key: value for key, value in user.items() if key not in _COLUMN_FIELDS},
+                          ensure_ascii=False)
+
+    def _insert_users(self, connection, users):
+        version = _next_version(connection)
+        connection.executemany(
+            "INSERT OR IGNORE INTO users (user_id, credits, total_purchases, is_banned, profile, version) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (user_id, user.get("credits", 0), user.get("total_purchases", 0),
+                 int(user.get("is_banned", False)), self._profile(user), version)
+                for user_id, user in users.items()
+            ]
+        )
+
+    # ===== التحميل والحفظ =====
+
+    def load_database(self):
+        """تحميل جميع المستخدمين من SQLite (مع استيراد users.json أول مرة)"""
+        empty = self.transactions.query("SELECT COUNT(*) FROM users")[0][0] == 0
+        if empty and self.import_file and os.path.exists(self.import_file):
+            with open(self.import_file, 'r', encoding='utf-8') as f:
+                users = json.load(f)
+            self.transactions.run(lambda connection: self._insert_users(connection, users))
+            logger.info("📥 تم استيراد %s مستخدم من %s إلى التخزين المشترك", len(users), self.import_file)
+
+        rows = self.transactions.query(
+            "SELECT user_id, credits, total_purchases, is_banned, profile, version FROM users"
+        )
+        self.synced_version = max((row[5] for row in rows), default=0)
+        return {row[0]: self._row_to_user(*row[1:5]) for row in rows}
+
+    def save_database(self):
+        """كتابة بيانات المستخدمين المعدلة محلياً (بدون لمس الكريدت)"""
+        with self.transactions.lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return True
+
+        def write(connection):
+            version = _next_version(connection)
+            connection.executemany(
+                "UPDATE users SET profile = ?, version = ? WHERE user_id = ?",
+                [(self._profile(self.users[user_id]), version, user_id) for user_id in dirty if user_id in self.users]
+            )
+
+        try:
+            self.transactions.run(write)
+            return True
+        except sqlite3.Error as e:
+            logger.error("خطأ في حفظ قاعدة البيانات المشتركة: %s", e)
+            with self.transactions.lock:
+                self._dirty |= dirty
+            return False
+
+    def sync(self):
+        """جلب المستخدمين الذين عدلتهم عمليات أخرى منذ آخر مزامنة"""
+        rows = self.transactions.query(
+            "SELECT user_id, credits, total_purchases, is_banned, profile, version FROM users WHERE version > ?",
+            (self.synced_version,)
+        )
+        for user_id, credits, total_purchases, is_banned, profile, version in rows:
+            self._apply_row(user_id, credits, total_purchases, is_banned,
+                            None if user_id in self._dirty else profile)
+            self.synced_version = max(self.synced_version, version)
+        return len(rows)
+
+    def _apply_row(self, user_id, credits, total_purchases, is_banned, profile=None):
+        """تحديث النسخة المحلية والفهارس من صف في قاعدة البيانات"""
+        if profile is not None or user_id not in self.users:
+            user = self._row_to_user(credits, total_purchases, is_banned, profile or "{}")
+            old_username = self.users.get(user_id, {}).get("username")
+            if old_username and self.username_index.get(old_username.lower()) == user_id:
+                del self.username_index[old_username.lower()]
+            if user.get("username"):
+                self.username_index[user["username"].lower()] = user_id
+            self.users[user_id] = user
+        else:
+            user = self.users[user_id]
+            user["credits"] = credits
+            user["total_purchases"] = total_purchases
+            user["is_banned"] = bool(is_banned)
+
+        if is_banned:
+            self.banned_ids.add(int(user_id))
+        else:
+            self.banned_ids.discard(int(user_id))
+        self.index.refresh(user_id, user)
+        return user
+
+    def _fetch(self, user_id):
+        rows = self.transactions.query(
+            "SELECT credits, total_purchases, is_banned, profile FROM users WHERE user_id = ?", (user_id,)
+        )
+        return rows[0] if rows else None
+
+    # ===== العمليات =====
+
+    def get_user(self, user_id, give_welcome_credits=False):
+        """الحصول على بيانات المستخدم (وإنشاؤه في التخزين المشترك إن لم يوجد)"""
+        user_id = str(user_id)
+        is_new_user = False
+
+        if user_id not in self.users:
+            row = self._fetch(user_id)
+            if row is None:
+                now = datetime.now().isoformat()
+                user = {
+                    "credits": 100 if give_welcome_credits else 0,
+                    "total_purchases": 0,
+                    "join_date": now,
+                    "last_activity": now,
+                    "username": "",
+                    "first_name": "",
+                    "is_banned": False,
+                    "is_new": True,  # علامة للمستخدم الجديد
+                    "welcome_credits_given": give_welcome_credits
+                }
+                self.transactions.run(lambda connection: self._insert_users(connection, {user_id: user}))
+                # عملية أخرى ربما أنشأته في نفس اللحظة: القيمة المخزنة هي المرجع
+                row = self._fetch(user_id)
+                is_new_user = json.loads(row[3]).get("is_new", False)
+            self._apply_row(user_id, *row)
+
+        # تحديث آخر نشاط (يُكتب مع الحفظ التالي)
+        self.users[user_id]["last_activity"] = datetime.now().isoformat()
+        self._dirty.add(user_id)
+        self.index.refresh(user_id, self.users[user_id])
+        return self.users[user_id], is_new_user
+
+    def _update_columns(self, user_id, assignments, parameters, condition="", condition_parameters=()):
+        """تعديل ذري لأعمدة مستخدم؛ يرجع الصف الجديد أو None إذا لم يتحقق الشرط"""
+        user_id = str(user_id)
+        self.get_user(user_id)
+
+        def work(connection):
+            version = _next_version(connection)
+            cursor = connection.execute(
+                f"UPDATE users SET {assignments}, version = ? WHERE user_id = ?{condition}",
+                (*parameters, version, user_id, *condition_parameters)
+            )
+            if cursor.rowcount == 0:
+                return None
+            return connection.execute(
+                "SELECT credits, total_purchases, is_banned FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+        row = self.transactions.run(work)
+        if row is not None:
+            self._apply_row(user_id, *row)
+        return row
+
+    def get_credits(self, user_id):
+        """الكريدت من التخزين المشترك (قد تكون عملية أخرى عدلته)"""
+        user_id = str(user_id)
+        self.get_user(user_id)
+        row = self._fetch(user_id)
+        self._apply_row(user_id, *row[:3])
+        return row[0]
+
+    def add_credits(self, user_id, amount):
+        """إضافة كريدت للمستخدم بعملية ذرية"""
+        return self._update_columns(user_id, "credits = credits + ?", (amount,))[0]
+
+    def deduct_credits(self, user_id, amount):
+        """خصم كريدت فقط إذا كان الرصيد كافياً (في نفس المعاملة)"""
+        row = self._update_columns(
+            user_id, "credits = credits - ?, total_purchases = total_purchases + 1", (amount,),
+            " AND credits >= ?", (amount,)
+        )
+        return row is not None
+
+    def set_credits(self, user_id, amount):
+        """تعيين كريدت المستخدم"""
+        self._update_columns(user_id, "credits = ?", (amount,))
+        return amount
+
+    def ban_user(self, user_id):
+        """حظر المستخدم"""
+        self._update_columns(user_id, "is_banned = ?", (1,))
+
+    def unban_user(self, user_id):
+        """إلغاء حظر المستخدم"""
+        self._update_columns(user_id, "is_banned = ?", (0,))
+
+    def get_all_users(self):
+        """جميع المستخدمين بعد مزامنة تعديلات العمليات الأخرى"""
+        self.sync()
+        return self.users
+
+
+class RowLeases:
+    """حجز صفوف الشيت لعملية واحدة لمدة محددة حتى لا تُسلم نفس الصفوف مرتين"""
+
+    def __init__(self, store_file="bot_store.sqlite3", owner=None, ttl=600):
+        self.transactions = Transactions(connect(store_file))
+        self.owner = owner or f"pid-{os.getpid()}"
+        self.ttl = ttl
+
+    def acquire(self, product, candidates, count):
+        """حجز أول count صف من المرشحين غير المحجوزين لعملية أخرى"""
+        now = time.time()
+
+        def work(connection):
+            connection.execute("DELETE FROM leases WHERE product = ? AND expires_at < ?", (product, now))
+            leased = []
+            for account in candidates:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO leases (product, row, owner, expires_at) VALUES (?, ?, ?, ?)",
+                    (product, account['row'], self.owner, now + self.ttl)
+                )
+                if cursor.rowcount:
+                    leased.append(account)
+                    if len(leased) >= count:
+                        break
+            return leased
+
+        return self.transactions.run(work)
+
+    def release(self, product, rows):
+        """إلغاء حجز صفوف لم تُستخدم"""
+        self.transactions.run(lambda connection: connection.executemany(
+            "DELETE FROM leases WHERE product = ? AND row = ? AND owner = ?",
+            [(product, row, self.owner) for row in rows]
+        ))
+
+    def active_rows(self, product):
+        """صفوف المنتج المحجوزة حالياً لأي عملية"""
+        rows = self.transactions.query(
+            "SELECT row FROM leases WHERE product = ? AND expires_at >= ?", (product, time.time())
+        )
+        return {row for (row,) in rows}
+
+    def compact(self):
+        """حذف الحجوزات المنتهية وضغط ملف WAL"""
+        deleted = self.transactions.run(lambda connection: connection.execute(
+            "DELETE FROM leases WHERE expires_at < ?", (time.time(),)
+        ).rowcount)
+        self.transactions.query("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+
+class LeaderElection:
+    """انتخاب قائد واحد بين العمليات بصف حجز له مدة صلاحية يجدده القائد دورياً"""
+
+    def __init__(self, store_file="bot_store.sqlite3", owner=None, ttl=15, name="singleton-jobs"):
+        self.transactions = Transactions(connect(store_file))
+        self.owner = owner or f"pid-{os.getpid()}"
+        self.ttl = ttl
+        self.name = name
+        self._leader_until = 0.0
+
+    @property
+    def is_leader(self):
+        """قائد فقط إذا لم تنته صلاحية آخر تجديد محلياً (هامش أمان قبل أن يأخذها غيره)"""
+        return time.time() < self._leader_until
+
+    def try_acquire(self):
+        """تجديد القيادة أو أخذها إذا انتهت صلاحية القائد السابق"""
+        now = time.time()
+
+        def work(connection):
+            cursor = connection.execute(
+                "INSERT INTO leader (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leader.owner = excluded.owner OR leader.expires_at < ?",
+                (self.name, self.owner, now + self.ttl, now)
+            )
+            return cursor.rowcount > 0
+
+        acquired = self.transactions.run(work)
+        # التوقف عن العمل كقائد قبل انتهاء الصلاحية بثلث المدة
+        self._leader_until = now + self.ttl * 2 / 3 if acquired else 0.0
+        return acquired
+
+    def release(self):
+        """التنازل عن القيادة عند الإيقاف حتى تنتقل فوراً لعملية أخرى"""
+        self._leader_until = 0.0
+        self.transactions.run(lambda connection: connection.execute(
+            "DELETE FROM leader WHERE name = ? AND owner = ?", (self.name, self.owner)
+        ))
+
+
+def partition_for(update_data, partitions):
+    """رقم القسم للتحديث: حسب المستخدم حتى تُعالج تحديثات نفس المستخدم بالترتيب في عملية واحدة"""
+    for key in ("message", "edited_message", "callback_query", "my_chat_member", "inline_query"):
+        sender = (update_data.get(key) or {}).get("from")
+        if sender:
+            return sender["id"] % partitions
+    return update_data["update_id"] % partitions
+
+
+class UpdateQueue:
+    """طابور تحديثات تلقرام مقسم على العمليات"""
+
+    def __init__(self, store_file="bot_store.sqlite3", partitions=1):
+        self.transactions = Transactions(connect(store_file))
+        self.partitions = partitions
+
+    def enqueue(self, updates_data):
+        """إضافة تحديثات (قواميس) مرة واحدة فقط لكل update_id"""
+        self.transactions.run(lambda connection: connection.executemany(
+            "INSERT OR IGNORE INTO updates (update_id, partition, payload) VALUES (?, ?, ?)",
+            [
+                (data["update_id"], partition_for(data, self.partitions), json.dumps(data, ensure_ascii=False))
+                for data in updates_data
+            ]
+        ))
+
+    def claim(self, partition, limit=50):
+        """أخذ تحديثات القسم وحذفها في نفس المعاملة (تُعالج مرة واحدة على الأكثر)"""
+
+        def work(connection):
+            rows = connection.execute(
+                "SELECT update_id, payload FROM updates WHERE partition = ? ORDER BY update_id LIMIT ?",
+                (partition, limit)
+            ).fetchall()
+            if rows:
+                connection.executemany("DELETE FROM updates WHERE update_id = ?", [(row[0],) for row in rows])
+            return [json.loads(payload) for _, payload in rows]
+
+        return self.transactions.run(work)
+
+    def pending(self):
+        return self.transactions.query("SELECT COUNT(*) FROM updates")[0][0]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class _InFlightCall:
+    """طلب قراءة جارٍ يشترك فيه كل من يطلب نفس المفتاح"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlightCache:
+    """دمج القراءات المتطابقة المتزامنة في طلب واحد مع ذاكرة مؤقتة قصيرة"""
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._results = {}  # المفتاح -> (وقت الانتهاء، القيمة)
+        self._inflight = {}  # المفتاح -> _InFlightCall
+
+        # عدادات لمعرفة مدى فعالية الدمج
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, loader):
+        """جلب القيمة من الذاكرة أو انتظار طلب جارٍ أو تنفيذ طلب جديد"""
+        with self._lock:
+            cached = self._results.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.hits += 1
+                return cached[1]
+
+            call = self._inflight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._inflight[key] = call
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = loader()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # لا نحفظ النتيجة إذا تم إبطال المفتاح أثناء القراءة
+                if self._inflight.get(key) is call:
+                    del self._inflight[key]
+                    if call.error is None and self.ttl > 0:
+                        self._results[key] = (time.monotonic() + self.ttl, call.value)
+            call.event.set()
+
+        return call.value
+
+    def invalidate(self, key=None):
+        """إبطال مفتاح محدد أو جميع المفاتيح بعد أي كتابة على الشيت"""
+        with self._lock:
+            if key is None:
+                self._results.clear()
+                self._inflight.clear()
+            else:
+                self._results.pop(key, None)
+                self._inflight.pop(key, None)
+
+    def get_stats(self):
+        """الحصول على إحصائيات الذاكرة المؤقتة"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "cached_keys": len(self._results)
+        }
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# رقم الصف العام = رقم الورقة * SHARD_ROW_SPAN + رقم الصف داخلها
+# (أكبر من أقصى عدد صفوف في Google Sheets، فالورقة الأولى تحتفظ بأرقام صفوفها كما هي)
+SHARD_ROW_SPAN = 10_000_000
+
+_A1_RE = re.compile(r"^([A-Za-z]+)(\d+)$")
+
+
+def shard_offset(shard):
+    return shard * SHARD_ROW_SPAN
+
+
+def split_row(row):
+    """(رقم الورقة، رقم الصف داخلها) من رقم الصف العام"""
+    return divmod(row, SHARD_ROW_SPAN)
+
+
+def parse_shards(spec):
+    """قائمة الأوراق الإضافية من SHEET_SHARDS: "spreadsheet_id[:worksheet],..."
+
+    معرف فارغ (":Sheet2") يعني ورقة أخرى في الجدول الأساسي
+    """
+    shards = []
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        spreadsheet_id, _, title = entry.partition(":")
+        shards.append((spreadsheet_id.strip() or None, title.strip() or None))
+    return shards
+
+
+def _local_range(range_name):
+    """تحويل نطاق A1 بأرقام صفوف عامة إلى (رقم الورقة، النطاق داخلها)"""
+    shard = None
+    parts = []
+    for cell in range_name.split(":"):
+        match = _A1_RE.match(cell)
+        if not match:
+            raise ValueError(f"نطاق غير مدعوم في الأوراق المقسمة: {range_name}")
+        cell_shard, row = split_row(int(match.group(2)))
+        if shard is not None and cell_shard != shard:
+            raise ValueError(f"النطاق يمتد على أكثر من ورقة: {range_name}")
+        shard = cell_shard
+        parts.append(f"{match.group(1)}{row}")
+    return shard, ":".join(parts)
+
+
+class ShardedWorksheet:
+    """واجهة ورقة واحدة فوق عدة أوراق: الكتابات تُوجه للورقة حسب رقم الصف العام
+
+    باقي العمليات (القراءة، التشخيص) تخص الورقة الأولى
+    """
+
+    def __init__(self, worksheets):
+        self.shards = list(worksheets)
+
+    def __getattr__(self, name):
+        return getattr(self.shards[0], name)
+
+    def update_cell(self, row, col, value):
+        shard, local_row = split_row(row)
+        return self.shards[shard].update_cell(local_row, col, value)
+
+    def update(self, range_name, values, **kwargs):
+        shard, local_range = _local_range(range_name)
+        return self.shards[shard].update(local_range, values, **kwargs)
+
+    def batch_update(self, data, **kwargs):
+        """تقسيم الكتابات على الأوراق: طلب واحد لكل ورقة بالتوازي"""
+        groups = {}
+        for entry in data:
+            shard, local_range = _local_range(entry['range'])
+            groups.setdefault(shard, []).append({**entry, 'range': local_range})
+        return map_parallel(lambda shard: self.shards[shard].batch_update(groups[shard], **kwargs), list(groups))
+
+
+def map_parallel(function, items):
+    """تنفيذ الدالة على كل عنصر في خيوط متوازية (بدون خيوط لعنصر واحد)"""
+    if len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=len(items)) as executor:
+        return list(executor.map(function, items))
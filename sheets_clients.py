@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import gspread
+import requests
+from google.auth.exceptions import RefreshError
+from gspread.exceptions import APIError
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# عناوين Google APIs التي يستخدمها gspread
+GOOGLE_API_HOSTS = ("https://sheets.googleapis.com", "https://www.googleapis.com")
+
+# الحقول المطلوبة في ملف حساب الخدمة
+SERVICE_ACCOUNT_FIELDS = ('type', 'project_id', 'private_key_id', 'private_key', 'client_email')
+
+
+class EndpointSession(requests.Session):
+    """جلسة تعيد توجيه طلبات Google APIs إلى خادم بديل (مثل محاكي Sheets المحلي)"""
+
+    def __init__(self, endpoint):
+        super().__init__()
+        self.endpoint = endpoint.rstrip("/")
+
+    def request(self, method, url, *args, **kwargs):
+        for host in GOOGLE_API_HOSTS:
+            if url.startswith(host):
+                url = self.endpoint + url[len(host):]
+                break
+        return super().request(method, url, *args, **kwargs)
+
+
+def build_endpoint_client(endpoint):
+    """عميل gspread بدون مصادقة يتصل بخادم بديل"""
+    return gspread.Client(auth=None, session=EndpointSession(endpoint))
+
+
+def parse_service_account_info(text):
+    """تحليل بيانات حساب خدمة من نص JSON أو JSON مُرمز بـ base64"""
+    text = text.strip()
+    if not text.startswith('{'):
+        text = base64.b64decode(text).decode('utf-8')
+    info = json.loads(text)
+
+    missing_fields = [field for field in SERVICE_ACCOUNT_FIELDS if field not in info]
+    if missing_fields:
+        raise ValueError(f"حقول مفقودة: {missing_fields}")
+    return info
+
+
+class _PooledClientSlot:
+    """عميل gspread واحد في المجموعة مع طلباته خلال آخر دقيقة وحالته"""
+
+    def __init__(self, client, name, quota_per_minute):
+        self.client = client
+        self.name = name
+        self.quota_per_minute = quota_per_minute
+        self.calls = deque()
+        self.throttled_until = 0.0
+        self.failed = False
+
+    def remaining(self, now):
+        """الحصة المتبقية في نافذة الدقيقة الحالية"""
+        while self.calls and self.calls[0] <= now - 60:
+            self.calls.popleft()
+        return self.quota_per_minute - len(self.calls)
+
+
+class PooledClient(gspread.Client):
+    """عميل gspread يوزع الطلبات على عدة حسابات خدمة لمضاعفة حصة Sheets API بالدقيقة
+
+    كل طلب يذهب للعميل صاحب أكبر حصة متبقية؛ العميل الذي يرجع 429 يُستبعد لفترة التهدئة
+    والعميل الذي فشلت مصادقته (401 أو تعذر تجديد رمز الدخول) يُستبعد نهائياً
+    """
+
+    def __init__(self, clients, quota_per_minute=60, cooldown=60):
+        super().__init__(auth=None)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.slots = [
+            _PooledClientSlot(client, name, quota_per_minute)
+            for name, client in clients
+        ]
+
+    def set_timeout(self, timeout):
+        super().set_timeout(timeout)
+        for slot in self.slots:
+            slot.client.set_timeout(timeout)
+
+    def active_clients(self):
+        now = time.monotonic()
+        return [slot.name for slot in self.slots if not slot.failed and slot.throttled_until <= now]
+
+    def _acquire(self, tried):
+        """اختيار العميل صاحب أكبر حصة متبقية؛ يرجع (العميل، مدة الانتظار)
+
+        إذا كانت كل العملاء مهدأة يرجع الأقرب لانتهاء التهدئة مع المدة المتبقية لها بدون تسجيل طلب عليه
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [slot for slot in self.slots if not slot.failed and slot not in tried]
+            if not candidates:
+                return None, 0
+            ready = [slot for slot in candidates if slot.throttled_until <= now]
+            if not ready:
+                slot = min(candidates, key=lambda slot: slot.throttled_until)
+                return slot, slot.throttled_until - now
+            slot = max(ready, key=lambda slot: slot.remaining(now))
+            slot.calls.append(now)
+            return slot, 0
+
+    def _throttle(self, slot, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        try:
+            cooldown = float(retry_after) if retry_after else self.cooldown
+        except ValueError:
+            cooldown = self.cooldown
+        with self._lock:
+            slot.throttled_until = time.monotonic() + cooldown
+        metrics.inc("sheets_client_throttled_total", client=slot.name)
+        logger.warning("⏳ حساب الخدمة %s تجاوز حصته، يُستبعد لمدة %.0f ثانية", slot.name, cooldown)
+
+    def _fail(self, slot, error):
+        with self._lock:
+            slot.failed = True
+        metrics.inc("sheets_client_failures_total", client=slot.name)
+        logger.error("❌ تم استبعاد حساب الخدمة %s بعد فشل المصادقة: %s", slot.name, error)
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        """تنفيذ الطلب على أفضل عميل متاح وإعادة المحاولة على عميل آخر عند 429 أو فشل المصادقة
+
+        الطلب المرفوض بهذه الأخطاء لم يُنفذ، لذلك إعادته آمنة حتى للكتابة؛ باقي الأخطاء (مثل 403 لنطاق محمي
+        أو جدول غير مشارك مع الحساب) تخص الطلب نفسه وتُرجع للمستدعي بدون استبعاد العميل
+
+        إذا كانت كل العملاء مهدأة ينتظر حتى تنتهي أقرب تهدئة بدل إرسال طلب سيُرفض بـ 429
+        (الطلبات تعمل دائماً خارج حلقة الأحداث لذلك الانتظار لا يوقف البوت)
+        """
+        tried = set()
+        last_error = None
+        while True:
+            slot, wait = self._acquire(tried)
+            if slot is None:
+                if last_error is not None:
+                    raise last_error
+                raise gspread.exceptions.GSpreadException("لا يوجد حساب خدمة صالح للاتصال بـ Google Sheets")
+            if wait > 0:
+                # الانتظار خارج القفل ثم إعادة الاختيار لأن حالة العملاء قد تتغير خلاله
+                time.sleep(wait)
+                continue
+            tried.add(slot)
+            metrics.inc("sheets_client_requests_total", client=slot.name)
+
+            try:
+                return slot.client.request(
+                    method, endpoint, params=params, data=data, json=json, files=files, headers=headers
+                )
+            except APIError as e:
+                status = e.response.status_code
+                if status == 429 or (status == 403 and "rateLimitExceeded" in e.response.text):
+                    self._throttle(slot, e.response)
+                elif status == 401:
+                    self._fail(slot, e)
+                else:
+                    raise
+                last_error = e
+            except RefreshError as e:
+                # مفتاح محذوف أو حساب معطل: لا يمكن الحصول على رمز دخول
+                self._fail(slot, e)
+                last_error = e
+
+
+def build_client_pool(credentials, quota_per_minute=60, cooldown=60):
+    """عميل واحد لحساب خدمة واحد، أو مجموعة عملاء لعدة حسابات
+
+    credentials: [(اسم الحساب، Credentials)]
+    """
+    if len(credentials) == 1:
+        return gspread.authorize(credentials[0][1])
+    return PooledClient(
+        [(name, gspread.authorize(credential)) for name, credential in credentials],
+        quota_per_minute=quota_per_minute,
+        cooldown=cooldown
+    )
@@ -1,8 +1,37 @@
 import os
+import asyncio
+import re
+import csv
+import io
+import itertools
+import json
+import math
 import logging
+import multiprocessing
 import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 from user_database import UserDatabase
+from sheet_cache import SingleFlightCache
+from account_pool import AccountPool
+from inventory import PRODUCTS, RESERVED_STATUS, iter_available_rows, product_columns, count_rows
+from metrics import metrics, instrument_handler, InstrumentedWorksheet, instrument_database, start_metrics_server
+from profiling import ProfilerController
+from sheets_clients import build_endpoint_client, build_client_pool, parse_service_account_info
+from traffic_recorder import TrafficRecorder
+from log_pipeline import setup_logging
+from throttle import UserThrottle, command_name
+from shared_store import SharedUserDatabase, RowLeases, UpdateQueue, LeaderElection
+from purchase_ledger import PurchaseLedger
+from restock import Restocker
+from credential_index import CredentialIndex, index_columns
+from inventory_snapshot import InventorySnapshot, SNAPSHOT_COLUMNS
+from sheet_shards import ShardedWorksheet, parse_shards, shard_offset, map_parallel
+from update_dedupe import UpdateDeduplicator, update_keys
+from purchase_journal import PurchaseJournal, INTENT, RESERVED, DELIVERED, COMPENSATED, FAILED, FINAL_STATES
 
 # التحقق من إصدار Python
 if sys.version_info < (3, 8):
@@ -11,8 +40,9 @@ if sys.version_info < (3, 8):
     sys.exit(1)
 
 try:
-    from telegram import Update
-    from telegram.ext import Application, CommandHandler, ContextTypes
+    from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+    from telegram.error import TelegramError
+    from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, ContextTypes, ApplicationHandlerStop, filters
 except ImportError as e:
     print("❌ خطأ في استيراد مكتبة telegram:")
     print(f"   {e}")
@@ -21,6 +51,7 @@ except ImportError as e:
 
 try:
     import gspread
+    from gspread.utils import rowcol_to_a1
     from google.oauth2.service_account import Credentials
 except ImportError as e:
     print("❌ خطأ في استيراد مكتبات Google:")
@@ -31,10 +62,12 @@ except ImportError as e:
 # تحميل المتغيرات البيئية
 load_dotenv()
 
-# إعداد التسجيل
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+# إعداد التسجيل عبر طابور وخيط خلفي حتى لا تؤخر الكتابة معالجة التحديثات
+# (النص المعتاد وكل السجلات افتراضياً؛ LOG_FORMAT=json و LOG_SAMPLE_RATE=0.01 مثلاً للتفعيل)
+setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    log_format=os.getenv('LOG_FORMAT', 'text'),
+    sample_rate=float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
 )
 logger = logging.getLogger(__name__)
 
@@ -42,10 +75,13 @@ logger = logging.getLogger(__name__)
 bot_instance = None
 
 class TelegramAccountBot:
-    def __init__(self):
+    def __init__(self, sheet=None, user_db=None, pool_file="account_pool.json", journal_file=None,
+                 dedupe_file=None, leader=None):
         self.bot_token = os.getenv('BOT_TOKEN') or os.getenv('TELEGRAM_BOT_TOKEN')
         self.sheet_id = os.getenv('GOOGLE_SHEET_ID')
         self.credentials_file = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
+        # عنوان خادم Bot API بديل (مثل الخادم الوهمي في benchmarks أو خادم Bot API محلي)
+        self.telegram_api_url = os.getenv('TELEGRAM_API_URL')
 
         # إذا لم يتم العثور على ملف credentials، استخدم متغير البيئة مباشرة
         if not os.path.exists(self.credentials_file):
@@ -59,10 +95,104 @@ class TelegramAccountBot:
         ]
 
         # إعداد قاعدة بيانات المستخدمين
-        self.user_db = UserDatabase()
+        self.user_db = user_db or UserDatabase()
+        instrument_database(self.user_db)
 
-        # إعداد Google Sheets
-        self.setup_google_sheets()
+        # ذاكرة مؤقتة لدمج قراءات الشيت المتطابقة المتزامنة
+        self.read_cache = SingleFlightCache(ttl=float(os.getenv('SHEET_CACHE_TTL', '5')))
+
+        # عدادات الإحصائيات المخزنة لأوامر التشخيص
+        self.stats_cache = SingleFlightCache(ttl=float(os.getenv('STATS_CACHE_TTL', '60')))
+
+        # سجل المشتريات المحلي (من اشترى ماذا) للسجل والاسترداد
+        self.ledger = PurchaseLedger(os.getenv('PURCHASE_LEDGER_FILE', 'purchases.sqlite3'))
+
+        # سجل مراحل عمليات الشراء لإكمالها أو التراجع عنها بعد توقف مفاجئ
+        self.journal = PurchaseJournal(
+            journal_file or os.getenv('PURCHASE_JOURNAL_FILE', 'purchase_journal.sqlite3')
+        )
+
+        # التحديثات المعالجة مسبقاً (تلقرام قد يعيد إرسالها بعد إعادة التشغيل أو انقطاع الشبكة)
+        self.dedupe = UpdateDeduplicator(
+            dedupe_file or os.getenv('UPDATE_DEDUPE_FILE', 'update_dedupe.sqlite3'),
+            max_entries=int(os.getenv('UPDATE_DEDUPE_SIZE', '10000')),
+            ttl=float(os.getenv('UPDATE_DEDUPE_TTL', '86400'))
+        )
+
+        # حد معدل الأوامر لكل مستخدم (THROTTLE_RATE=0 يعطله)
+        self.throttle = UserThrottle(
+            rate=float(os.getenv('THROTTLE_RATE', '0.5')),
+            burst=int(os.getenv('THROTTLE_BURST', '10'))
+        )
+
+        # فهرس الإيميلات في كل المنتجات لكشف الحسابات المكررة (يُبنى من الشيت في الخلفية)
+        self.credentials = CredentialIndex()
+
+        # حجز الصفوف وانتخاب القائد في التخزين المشترك عند التشغيل بعدة عمليات (None = عملية واحدة)
+        self.leases = None
+        self.leader = leader
+
+        # قفل يمنع حجز نفس الصف من مسارين مختلفين (الشراء المباشر وتعبئة المخزون)
+        self.claim_lock = threading.Lock()
+
+        # مخزون الحسابات المحجوزة مسبقاً للتسليم الفوري (معطل افتراضياً، ACCOUNT_POOL_SIZE > 0 لتفعيله)
+        # عند التفعيل يكتب البوت "محجوز" في عمود الحالة للحسابات المحجوزة: هذه الحسابات ما زالت متاحة للبيع
+        # ولا يجب تعديلها يدوياً، وعند أول تعبئة تُمسح علامة الحجز من الصفوف التي لا يملكها أي مخزون
+        self.account_pool = AccountPool(
+            self,
+            pool_file=pool_file,
+            min_size=int(os.getenv('ACCOUNT_POOL_SIZE', '0')),
+            max_size=int(os.getenv('ACCOUNT_POOL_MAX', '100')),
+            refill_interval=int(os.getenv('ACCOUNT_POOL_INTERVAL', '30'))
+        )
+
+        # نسخة المخزون المحفوظة من آخر تشغيل (تُخدم منها القراءات حتى التحقق من الشيت)
+        self.snapshot = InventorySnapshot(os.getenv('INVENTORY_SNAPSHOT_FILE', 'inventory_snapshot.json.gz'))
+
+        # إعداد Google Sheets (أو استخدام ورقة جاهزة مثل ورقة الاختبار)
+        self.sheets_endpoint = os.getenv('GOOGLE_SHEETS_ENDPOINT')
+        self.sheets_connecting = False
+        # أوراق المخزون (الأولى هي الأساسية) وعدد الحسابات المتاحة في كل منها من آخر إحصائية
+        self.shards = []
+        self.shard_available = {product: {} for product in PRODUCTS}
+        if sheet is not None:
+            self.gc = None
+            self.shards = [InstrumentedWorksheet(sheet)]
+            self.sheet = self.shards[0]
+        elif self.snapshot.load():
+            # تشغيل دافئ: البوت يعمل من النسخة المحلية والاتصال بالشيت يتم في الخلفية
+            logger.info("⚡ تم تحميل نسخة المخزون المحفوظة (مراجعة %s)، الاتصال بالشيت في الخلفية", self.snapshot.revision)
+            self.gc = None
+            self.sheet = None
+            self.sheets_connecting = True
+            threading.Thread(target=self.connect_sheets_in_background, name="sheets-connect", daemon=True).start()
+        else:
+            self.connect_sheets()
+
+    def connect_sheets(self):
+        """الاتصال بالشيت عبر الخادم البديل أو Google Sheets"""
+        if self.sheets_endpoint:
+            self.setup_sheets_endpoint(self.sheets_endpoint)
+        else:
+            self.setup_google_sheets()
+
+    def connect_sheets_in_background(self):
+        """الاتصال بالشيت ثم التحقق من النسخة المحلية مقابل مراجعته"""
+        try:
+            self.connect_sheets()
+        finally:
+            self.sheets_connecting = False
+        try:
+            if self.leader is not None:
+                # عدة عمليات: تنزيل الأعمدة وحفظ النسخة المشتركة مهمة القائد فقط (save_inventory_snapshot)
+                self.snapshot.reload()
+                self.snapshot.warm = False
+                self.stats_cache.invalidate()
+                logger.info("✅ تم الاتصال بالشيت، نسخة المخزون المشتركة يتحقق منها القائد")
+            else:
+                self.refresh_inventory_snapshot()
+        except Exception as e:
+            logger.error("خطأ في التحقق من نسخة المخزون: %s", e)
 
     def is_admin(self, username, user_id=None):
         """التحقق من صلاحيات الأدمن"""
@@ -102,62 +232,26 @@ class TelegramAccountBot:
                 os.getenv('SERVICE_ACCOUNT_KEY')
             )
 
-            logger.info(f"🔍 البحث عن credentials...")
-            logger.info(f"📁 مسار الملف المحلي: {self.credentials_file}")
-            logger.info(f"🌐 GOOGLE_CREDENTIALS موجود: {bool(os.getenv('GOOGLE_CREDENTIALS'))}")
-            logger.info(f"🌐 CREDENTIALS موجود: {bool(os.getenv('CREDENTIALS'))}")
-            logger.info(f"🌐 GOOGLE_SERVICE_ACCOUNT موجود: {bool(os.getenv('GOOGLE_SERVICE_ACCOUNT'))}")
-            logger.info(f"🌐 SERVICE_ACCOUNT_KEY موجود: {bool(os.getenv('SERVICE_ACCOUNT_KEY'))}")
-            logger.info(f"📄 ملف credentials.json موجود: {os.path.exists(self.credentials_file) if self.credentials_file else False}")
-
-            # طباعة جميع متغيرات البيئة التي تحتوي على "CRED" أو "GOOGLE"
-            env_vars = {k: v[:50] + "..." if len(v) > 50 else v for k, v in os.environ.items()
-                       if 'CRED' in k.upper() or 'GOOGLE' in k.upper()}
-            logger.info(f"🔍 متغيرات البيئة ذات الصلة: {env_vars}")
-
-            # طباعة أول 100 حرف من credentials للتأكد
+            # لا تُسجل قيم credentials أو متغيرات البيئة: يكفي معرفة المصدر
             if google_credentials:
-                logger.info(f"📝 أول 100 حرف من credentials: {google_credentials[:100]}...")
+                logger.info("🔍 تم العثور على credentials في متغير البيئة")
             else:
-                logger.error("❌ لم يتم العثور على أي متغير credentials")
+                logger.info("🔍 لا توجد credentials في متغيرات البيئة، سيتم تجربة الملف المحلي: %s", self.credentials_file)
 
             if google_credentials:
                 try:
-                    # استخدام credentials من متغير البيئة
-                    import json
+                    # استخدام credentials من متغير البيئة (JSON أو base64)
                     logger.info("🔄 محاولة تحليل JSON...")
-
-                    # تنظيف المحتوى من أي مسافات أو أحرف غير مرغوبة
-                    google_credentials = google_credentials.strip()
-
-                    # إذا كان المحتوى مُرمز بـ base64، فك الترميز
-                    if not google_credentials.startswith('{'):
-                        try:
-                            import base64
-                            logger.info("🔄 محاولة فك ترميز base64...")
-                            google_credentials = base64.b64decode(google_credentials).decode('utf-8')
-                            logger.info("✅ تم فك ترميز base64 بنجاح")
-                        except Exception as base64_error:
-                            logger.error(f"❌ فشل فك ترميز base64: {base64_error}")
-
-                    creds_dict = json.loads(google_credentials)
+                    creds_dict = parse_service_account_info(google_credentials)
                     logger.info("✅ تم تحليل JSON بنجاح")
 
-                    # التحقق من وجود الحقول المطلوبة
-                    required_fields = ['type', 'project_id', 'private_key_id', 'private_key', 'client_email']
-                    missing_fields = [field for field in required_fields if field not in creds_dict]
-                    if missing_fields:
-                        logger.error(f"❌ حقول مفقودة في credentials: {missing_fields}")
-                        raise ValueError(f"حقول مفقودة: {missing_fields}")
-
                     credentials = Credentials.from_service_account_info(creds_dict, scopes=scopes)
                     logger.info("✅ تم تحميل credentials من متغير البيئة بنجاح")
                 except json.JSONDecodeError as e:
-                    logger.error(f"❌ خطأ في تحليل JSON: {e}")
-                    logger.error(f"❌ المحتوى الذي فشل في التحليل: {google_credentials[:200]}...")
+                    logger.error("❌ خطأ في تحليل JSON: %s", e)
                     raise
                 except Exception as e:
-                    logger.error(f"❌ خطأ في تحليل credentials من متغير البيئة: {e}")
+                    logger.error("❌ خطأ في تحليل credentials من متغير البيئة: %s", e)
                     raise
             elif self.credentials_file and os.path.exists(self.credentials_file):
                 # استخدام ملف credentials.json المحلي
@@ -169,104 +263,375 @@ class TelegramAccountBot:
                     )
                     logger.info("✅ تم تحميل credentials من الملف المحلي بنجاح")
                 except Exception as e:
-                    logger.error(f"❌ خطأ في تحميل الملف المحلي: {e}")
+                    logger.error("❌ خطأ في تحميل الملف المحلي: %s", e)
                     raise
             else:
                 logger.error("❌ لم يتم العثور على credentials في أي مكان")
-                logger.error(f"❌ متغيرات البيئة المتاحة: {list(os.environ.keys())}")
                 raise FileNotFoundError("لم يتم العثور على credentials في متغير البيئة أو الملف المحلي")
 
-            # إنشاء عميل gspread
+            # حسابات خدمة إضافية لمضاعفة حصة الطلبات بالدقيقة
+            credentials_pool = [(credentials.service_account_email, credentials)]
+            credentials_pool.extend(self.load_extra_credentials(scopes))
+
+            # إنشاء عميل gspread (أو مجموعة عملاء تتوزع عليهم الطلبات)
             logger.info("🔄 محاولة إنشاء عميل gspread...")
-            self.gc = gspread.authorize(credentials)
-            logger.info("✅ تم إنشاء عميل gspread بنجاح")
+            self.gc = build_client_pool(
+                credentials_pool,
+                quota_per_minute=int(os.getenv('SHEETS_CLIENT_QUOTA', '60')),
+                cooldown=int(os.getenv('SHEETS_CLIENT_COOLDOWN', '60'))
+            )
+            if len(credentials_pool) > 1:
+                logger.info("✅ تم إنشاء %s عميل gspread تتوزع عليهم الطلبات", len(credentials_pool))
+            else:
+                logger.info("✅ تم إنشاء عميل gspread بنجاح")
 
             # فتح الشيت
-            logger.info(f"🔄 محاولة فتح الشيت بالمعرف: {self.sheet_id}")
-            self.sheet = self.gc.open_by_key(self.sheet_id).sheet1
+            logger.info("🔄 محاولة فتح الشيت بالمعرف: %s", self.sheet_id)
+            # تغليف الورقة لقياس كل استدعاء لـ Sheets API
+            self.open_shards(self.gc.open_by_key(self.sheet_id))
 
             logger.info("✅ تم الاتصال بـ Google Sheets بنجاح")
 
         except Exception as e:
-            logger.error(f"خطأ في الاتصال بـ Google Sheets: {e}")
+            logger.error("خطأ في الاتصال بـ Google Sheets: %s", e)
             self.gc = None
             self.sheet = None
-    
-    def find_available_account(self):
-        """البحث عن أول حساب فارغ في الشيت"""
+
+    def load_extra_credentials(self, scopes):
+        """حسابات الخدمة الإضافية من GOOGLE_CREDENTIALS_2, _3, ... ومن ملفات GOOGLE_CREDENTIALS_FILES
+
+        الحساب الذي لا يمكن تحميله يُتخطى ولا يوقف الاتصال
+        """
+        sources = []
+        index = 2
+        while os.getenv(f'GOOGLE_CREDENTIALS_{index}'):
+            sources.append((f'GOOGLE_CREDENTIALS_{index}', os.getenv(f'GOOGLE_CREDENTIALS_{index}')))
+            index += 1
+        for path in (os.getenv('GOOGLE_CREDENTIALS_FILES') or '').split(','):
+            if path.strip():
+                sources.append((path.strip(), None))
+
+        extra = []
+        for source, value in sources:
+            try:
+                if value is not None:
+                    credentials = Credentials.from_service_account_info(parse_service_account_info(value), scopes=scopes)
+                else:
+                    credentials = Credentials.from_service_account_file(source, scopes=scopes)
+                extra.append((credentials.service_account_email, credentials))
+            except Exception as e:
+                logger.error("❌ خطأ في تحميل حساب الخدمة الإضافي %s: %s", source, e)
+        return extra
+
+    def setup_sheets_endpoint(self, endpoint):
+        """الاتصال بخادم Sheets بديل بدون مصادقة (مثل المحاكي المحلي في benchmarks)"""
         try:
-            if not self.sheet:
-                return None
+            logger.info("🔄 محاولة الاتصال بخادم Sheets البديل: %s", endpoint)
+            self.gc = build_endpoint_client(endpoint)
+            self.open_shards(self.gc.open_by_key(self.sheet_id or 'emulator'))
+            logger.info("✅ تم الاتصال بخادم Sheets البديل بنجاح")
+        except Exception as e:
+            logger.error("خطأ في الاتصال بخادم Sheets البديل: %s", e)
+            self.gc = None
+            self.sheet = None
+    
+    def open_shards(self, spreadsheet):
+        """فتح الورقة الأساسية والأوراق الإضافية من SHEET_SHARDS (بنفس تخطيط الأعمدة)"""
+        spreadsheets = {spreadsheet.id: spreadsheet}
+        worksheets = [InstrumentedWorksheet(spreadsheet.sheet1)]
+        for spreadsheet_id, title in parse_shards(os.getenv('SHEET_SHARDS')):
+            spreadsheet_id = spreadsheet_id or spreadsheet.id
+            if spreadsheet_id not in spreadsheets:
+                spreadsheets[spreadsheet_id] = self.gc.open_by_key(spreadsheet_id)
+            shard_spreadsheet = spreadsheets[spreadsheet_id]
+            worksheets.append(InstrumentedWorksheet(
+                shard_spreadsheet.worksheet(title) if title else shard_spreadsheet.sheet1
+            ))
+        if len(worksheets) > 1:
+            logger.info("📚 المخزون موزع على %s ورقة", len(worksheets))
+
+        self.shards = worksheets
+        self.sheet = worksheets[0] if len(worksheets) == 1 else ShardedWorksheet(worksheets)
+
+    def read_columns(self, *columns, fresh=False, shard=0):
+        """قراءة أعمدة من ورقة مع دمج الطلبات المتطابقة المتزامنة في طلب واحد
+
+        القراءات غير الحديثة (الإحصائيات وفهرس الإيميلات) قد تُخدم من النسخة المحلية؛ مسارات البيع تقرأ
+        دائماً fresh=True لأنها تكتب بأرقام الصفوف وقد يكون الشيت تغير أو أُعيد ترتيبه بعد حفظ النسخة
+        """
+        if not fresh and self.serves_from_snapshot() and self.snapshot.has(columns, shard):
+            return self.snapshot.read(columns, self.locally_taken_rows(), shard)
+
+        key = columns if shard == 0 else (shard, columns)
+        if fresh:
+            self.read_cache.invalidate(key)
 
-            # قراءة الأعمدة مباشرة لتجنب مشكلة العناوين المكررة
-            email_col = self.sheet.col_values(1)  # العمود A
-            password_col = self.sheet.col_values(2)  # العمود B
-            status_col = self.sheet.col_values(3)  # العمود C
+        columns_data = self.read_cache.get(
+            key,
+            lambda: [self.shards[shard].col_values(column) for column in columns]
+        )
+        # نسخة مستقلة لأن المستدعين يعدلون القوائم (extend)
+        return [list(column_data) for column_data in columns_data]
 
-            # التأكد من أن القوائم لها نفس الطول
-            max_len = max(len(email_col), len(password_col), len(status_col))
-            email_col.extend([''] * (max_len - len(email_col)))
-            password_col.extend([''] * (max_len - len(password_col)))
-            status_col.extend([''] * (max_len - len(status_col)))
+    @property
+    def is_follower(self):
+        """عملية غير قائدة عند التشغيل بعدة عمليات"""
+        return self.leader is not None and not self.leader.is_leader
 
-            # البحث عن أول حساب متاح (بدون حالة في العمود الثالث)
-            for i in range(1, len(email_col)):  # البداية من الصف 2 (index 1)
-                email = email_col[i].strip() if email_col[i] else ''
-                password = password_col[i].strip() if password_col[i] else ''
-                status = status_col[i].strip() if status_col[i] else ''
+    def serves_from_snapshot(self):
+        """هل تُخدم القراءات غير الحديثة من النسخة المحلية
 
-                if email and password and not status:
-                    return {
-                        'row': i + 1,  # رقم الصف الفعلي في الشيت
-                        'email': email,
-                        'password': password
-                    }
+        قبل التحقق منها بعد إعادة التشغيل، وفي العمليات غير القائدة من النسخة التي يحفظها القائد
+        (القائد وحده يقرأ الشيت للإحصائيات وفهرس الإيميلات). القراءة من الذاكرة فقط: إعادة تحميل
+        الملف تتم في مهمة reload_inventory_snapshot
+        """
+        return self.snapshot.warm or (self.is_follower and bool(self.snapshot.columns))
+
+    def locally_taken_rows(self):
+        """الصفوف المعروف محلياً أنها بيعت أو حُجزت {product: {row: status}}"""
+        taken = {product: {} for product in PRODUCTS}
+        for product in PRODUCTS:
+            for row in self.account_pool.reserved_rows(product):
+                taken[product][row] = RESERVED_STATUS
+            # المبيعات المسجلة قبل حفظ النسخة تظهر فيها أصلاً
+            for row in self.ledger.rows(product, self.snapshot.ledger_id):
+                taken[product][row] = "مُستخدم"
+        for product, account in self.journal.open_accounts():
+            taken[product][account['row']] = "مُستخدم"
+        return taken
+
+    def sheet_revision(self):
+        """وقت آخر تعديل لكل جداول المخزون من Drive، أو None إذا لم يكن متاحاً (مثل ورقة الاختبار)"""
+        spreadsheets = {}
+        for worksheet in self.shards:
+            spreadsheet = getattr(worksheet, 'spreadsheet', None)
+            if spreadsheet is None or not hasattr(spreadsheet, 'get_lastUpdateTime'):
+                return None
+            spreadsheets[spreadsheet.id] = spreadsheet
+        revisions = map_parallel(lambda spreadsheet: spreadsheet.get_lastUpdateTime(), list(spreadsheets.values()))
+        return "|".join(revisions)
 
-            return None
+    def refresh_inventory_snapshot(self):
+        """مقارنة النسخة المحلية بمراجعة الشيت وتنزيل الأعمدة فقط عند تغيرها"""
+        if not self.sheet:
+            return False
+        revision = self.sheet_revision()
+        changed = revision is None or revision != self.snapshot.revision
+        if changed:
+            # المراجعة وآخر عملية في السجل تُقرأ قبل الأعمدة: أي تعديل بينهما يظهر كتغيير في المرة القادمة
+            ledger_id = self.ledger.last_id()
+            shard_columns = map_parallel(
+                lambda shard: self.read_columns(*SNAPSHOT_COLUMNS, fresh=True, shard=shard),
+                list(range(self.shard_count()))
+            )
+            self.snapshot.save({
+                (shard, column): values
+                for shard, columns in enumerate(shard_columns)
+                for column, values in zip(SNAPSHOT_COLUMNS, columns)
+            }, revision, ledger_id)
+        if self.snapshot.warm:
+            self.snapshot.warm = False
+            self.stats_cache.invalidate()
+            logger.info("✅ تم التحقق من نسخة المخزون (%s)", 'تم تحديثها' if changed else 'مطابقة للشيت')
+        return changed
+
+    def used_cells(self, product, row_number, user_id, username=None, first_name=None, timestamp=None):
+        """الخلايا التي تُكتب في الشيت عند استخدام حساب [(row, col, value)]"""
+        if product == 'chatgpt':
+            user_info = f"@{username}" if username and username != "غير محدد" else f"User_{user_id}"
+            timestamp = timestamp or self.get_current_time()
+            return [(row_number, 8, f"مُستخدم - {user_info} - {timestamp}")]  # العمود H للحالة
+
+        user_info = str(user_id)
+        if username:
+            user_info += f" (@{username})"
+        if first_name:
+            user_info += f" - {first_name}"
+        return [(row_number, 3, "مُستخدم"), (row_number, 4, user_info)]  # عمود الحالة وعمود User ID
+
+    def cleared_cells(self, product, row_number):
+        """الخلايا التي تُمسح لإرجاع حساب للمخزون المتاح [(row, col, '')]"""
+        if product == 'chatgpt':
+            return [(row_number, 8, '')]
+        return [(row_number, 3, ''), (row_number, 4, '')]
+
+    def write_account_cells(self, product, accounts, cells):
+        """كتابة خلايا حسابات في الشيت بطلب واحد وإزالتها من المخزون المحلي"""
+        with self.claim_lock:
+            self.sheet.batch_update([
+                {'range': rowcol_to_a1(row, col), 'values': [[value]]}
+                for row, col, value in cells
+            ])
+            self.read_cache.invalidate()
+            self.account_pool.discard(product, [account['row'] for account in accounts])
+
+    def ensure_accounts_marked(self, entry):
+        """كتابة حالة حسابات عملية من السجل كمُستخدمة (تكرار الكتابة آمن)"""
+        self.write_account_cells(entry['product'], entry['accounts'], [
+            cell
+            for account in entry['accounts']
+            for cell in self.used_cells(entry['product'], account['row'], entry['user_id'],
+                                        entry['username'], entry['first_name'], entry['timestamp'])
+        ])
+
+    def release_accounts(self, product, accounts):
+        """إرجاع حسابات لم يُخصم ثمنها للمخزون المتاح بمسح حالتها في الشيت"""
+        self.write_account_cells(product, accounts, [
+            cell for account in accounts for cell in self.cleared_cells(product, account['row'])
+        ])
+        self.credentials.unclaim(accounts)
+        if self.leases is not None:
+            self.leases.release(product, [account['row'] for account in accounts])
+
+    def cancel_purchase(self, journal_id, product, accounts):
+        """التراجع عن عملية شراء بدون خصم: إرجاع حساباتها وإنهاؤها في السجل"""
+        self.release_accounts(product, accounts)
+        self.journal.finish(journal_id, COMPENSATED)
+        logger.warning("↩️ تم التراجع عن عملية الشراء %s وإرجاع %s حساب للمخزون", journal_id, len(accounts))
+
+    def settle_purchase(self, journal_id, product, accounts, user_id, username=None, timestamp=None):
+        """خصم ثمن الحسابات المحجوزة وتسجيله؛ إذا لم يكفِ الرصيد تُرجع الحسابات ويرجع False"""
+        if not self.deduct_user_credits(user_id, len(accounts)):
+            self.cancel_purchase(journal_id, product, accounts)
+            return False
+        # توقف البوت بين الخصم وهذه النقطة هو النافذة الوحيدة التي قد يتكرر فيها الخصم عند الاستعادة
+        self.journal.debited(journal_id)
+        self.record_purchases(product, accounts, user_id, username, timestamp)
+        return True
 
+    def record_purchases(self, product, accounts, user_id, username=None, timestamp=None):
+        """تسجيل الحسابات المسلمة في سجل المشتريات (خطأ السجل لا يفشل عملية الشراء)"""
+        try:
+            self.ledger.record(
+                user_id,
+                username if username and username != "غير محدد" else None,
+                product,
+                accounts,
+                timestamp or self.get_current_time()
+            )
         except Exception as e:
-            logger.error(f"خطأ في البحث عن الحسابات: {e}")
-            return None
+            logger.error("خطأ في تسجيل المشتريات في السجل: %s", e)
 
-    def find_multiple_accounts(self, count):
-        """البحث عن عدة حسابات متاحة من الشيت"""
-        try:
-            if not self.sheet:
-                return []
+    def lease_accounts(self, product, candidates, count):
+        """أخذ أول count حساب من المرشحين؛ مع عدة عمليات لا يؤخذ إلا ما نجح حجزه في التخزين المشترك
+
+        الإيميل الذي بيع أو حُجز من صف آخر (حساب مكرر في الشيت) يُتخطى
+        """
+        candidates = self.credentials.unclaimed(candidates)
+        if self.leases is None:
+            accounts = list(itertools.islice(candidates, count))
+        else:
+            accounts = self.leases.acquire(product, candidates, count)
+        self.credentials.claim(accounts)
+        return accounts
+
+    def refresh_credential_index(self, fresh=True):
+        """إعادة بناء فهرس الإيميلات من قراءة حديثة للشيت (أو من النسخة المحلية مع fresh=False)"""
+        self.credentials.build(index_columns(self, fresh))
+
+    def take_pooled_accounts(self, product, count, user_id, username=None, first_name=None, timestamp=None,
+                             journal_id=None):
+        """أخذ حسابات من المخزون المحجوز مسبقاً بدون أي طلب للشيت، أو None"""
+        timestamp = timestamp or self.get_current_time()
+        return self.account_pool.take(
+            product,
+            count,
+            lambda account: self.used_cells(product, account['row'], user_id, username, first_name, timestamp),
+            on_taken=lambda accounts: self.journal.reserve(journal_id, accounts)
+        )
+
+    def claim_emails(self, count, user_id, username=None, timestamp=None, journal_id=None):
+        """البحث عن حسابات شات جي بي تي من الأعمدة F, G, H وتحديثها كمُستخدمة"""
+        with self.claim_lock:
+            # فلترة الإيميلات المتاحة في الأعمدة F, G, H (التي لا تحتوي على حالة في العمود H)
+            selected_emails = self.lease_accounts('chatgpt', self.iter_available_accounts('chatgpt', fresh=True), count)
+
+            if not selected_emails:
+                return selected_emails
+            # تسجيل الحجز قبل الكتابة: الكتابة الجزئية تُكمل أو يُتراجع عنها من السجل
+            self.journal.reserve(journal_id, selected_emails)
+
+            # تحديث حالة الإيميلات إلى "مُستخدم" بطلب واحد
+            try:
+                self.sheet.batch_update([
+                    {'range': rowcol_to_a1(row, col), 'values': [[value]]}
+                    for email_data in selected_emails
+                    for row, col, value in self.used_cells('chatgpt', email_data['row'], user_id, username,
+                                                           timestamp=timestamp)
+                ])
+            finally:
+                # إبطال القراءات المخزنة حتى لا تُعطى الإيميلات مرة أخرى
+                self.read_cache.invalidate()
+
+        return selected_emails
+
+    def claim_accounts(self, count, user_id, username=None, first_name=None, journal_id=None):
+        """حجز حسابات يوتيوب من الشيت وتحديثها كمُستخدمة تحت قفل الحجز (accounts, success)
+
+        تُستدعى من خيط منفصل: انتظار القفل أثناء تعبئة المخزون لا يوقف حلقة البوت
+        """
+        with self.claim_lock:
+            if count == 1:
+                account = self.find_available_account()
+                accounts = [account] if account else []
+            else:
+                accounts = self.find_multiple_accounts(count)
+            if not accounts:
+                return accounts, False
 
-            # قراءة الأعمدة مباشرة لتجنب مشكلة العناوين المكررة
-            email_col = self.sheet.col_values(1)  # العمود A
-            password_col = self.sheet.col_values(2)  # العمود B
-            status_col = self.sheet.col_values(3)  # العمود C
+            self.journal.reserve(journal_id, accounts)
+            if count == 1:
+                success = self.mark_account_as_used(accounts[0]['row'], user_id, username, first_name)
+            else:
+                success = self.mark_multiple_accounts_as_used(accounts, user_id, username, first_name)
+        return accounts, success
+
+    def read_row_range(self, start_row, end_row, first_col='A', last_col='C'):
+        """قراءة نطاق محدد من الصفوف بطلب واحد صغير بدلاً من تحميل الأعمدة كاملة"""
+        width = ord(last_col) - ord(first_col) + 1
+        values = self.sheet.get(f"{first_col}{start_row}:{last_col}{end_row}")
+
+        rows = []
+        for i in range(end_row - start_row + 1):
+            row_values = list(values[i]) if i < len(values) else []
+            row_values.extend([''] * (width - len(row_values)))
+            rows.append(row_values)
+        return rows
+
+    def get_cached_stats(self):
+        """الإحصائيات من العدادات المخزنة بدون قراءة الشيت في كل مرة"""
+        return self.stats_cache.get('stats', self.get_stats)
 
-            # التأكد من أن القوائم لها نفس الطول
-            max_len = max(len(email_col), len(password_col), len(status_col))
-            email_col.extend([''] * (max_len - len(email_col)))
-            password_col.extend([''] * (max_len - len(password_col)))
-            status_col.extend([''] * (max_len - len(status_col)))
+    def find_available_account(self):
+        """البحث عن أول حساب فارغ في الشيت"""
+        accounts = self.find_multiple_accounts(1)
+        return accounts[0] if accounts else None
 
-            available_accounts = []
+    def shard_count(self):
+        return max(len(self.shards), 1)
 
-            # البحث عن الحسابات المتاحة
-            for i in range(1, len(email_col)):  # البداية من الصف 2 (index 1)
-                if len(available_accounts) >= count:
-                    break
+    def shards_by_load(self, product):
+        """ترتيب الأوراق: الأكثر حسابات متاحة (الأقل استهلاكاً) أولاً حسب آخر إحصائية"""
+        available = self.shard_available[product]
+        return sorted(range(self.shard_count()), key=lambda shard: (-available.get(shard, 0), shard))
 
-                email = email_col[i].strip() if email_col[i] else ''
-                password = password_col[i].strip() if password_col[i] else ''
-                status = status_col[i].strip() if status_col[i] else ''
+    def iter_available_accounts(self, product, skip_rows=None, fresh=False):
+        """الحسابات المتاحة لمنتج في كل الأوراق؛ الورقة التالية لا تُقرأ إلا إذا لم تكفِ السابقة"""
+        for shard in self.shards_by_load(product):
+            columns = self.read_columns(*product_columns(product), fresh=fresh, shard=shard)
+            yield from iter_available_rows(*columns, skip_rows, row_offset=shard_offset(shard))
 
-                if email and password and not status:
-                    available_accounts.append({
-                        'row': i + 1,  # رقم الصف الفعلي في الشيت
-                        'email': email,
-                        'password': password
-                    })
+    def find_multiple_accounts(self, count):
+        """البحث عن عدة حسابات متاحة من الشيت"""
+        try:
+            if not self.sheet:
+                return []
 
-            return available_accounts
+            # الحسابات المتاحة (بدون حالة في العمود C) بدءاً من الصف 2 في كل ورقة
+            return self.lease_accounts('youtube', self.iter_available_accounts('youtube', fresh=True), count)
 
         except Exception as e:
-            logger.error(f"خطأ في البحث عن الحسابات المتعددة: {e}")
+            logger.error("خطأ في البحث عن الحسابات: %s", e)
             return []
     
     def mark_account_as_used(self, row_number, user_id, username=None, first_name=None):
@@ -292,11 +657,14 @@ class TelegramAccountBot:
                 # إذا لم يكن هناك عمود رابع، لا بأس
                 pass
 
-            logger.info(f"تم تحديث الحساب في الصف {row_number} كمُستخدم للمستخدم {user_info}")
+            # إبطال القراءات المخزنة حتى لا يُعطى الحساب مرة أخرى
+            self.read_cache.invalidate()
+
+            logger.info("تم تحديث الحساب في الصف %s كمُستخدم للمستخدم %s", row_number, user_info, extra={"sampled": True})
             return True
 
         except Exception as e:
-            logger.error(f"خطأ في تحديث الحساب: {e}")
+            logger.error("خطأ في تحديث الحساب: %s", e)
             return False
 
     def mark_multiple_accounts_as_used(self, accounts, user_id, username=None, first_name=None):
@@ -326,41 +694,26 @@ class TelegramAccountBot:
                     # إذا لم يكن هناك عمود رابع، لا بأس
                     pass
 
-            logger.info(f"تم تحديث {len(accounts)} حساب كمُستخدم للمستخدم {user_info}")
+            # إبطال القراءات المخزنة حتى لا تُعطى الحسابات مرة أخرى
+            self.read_cache.invalidate()
+
+            logger.info("تم تحديث %d حساب كمُستخدم للمستخدم %s", len(accounts), user_info, extra={"sampled": True})
             return True
 
         except Exception as e:
-            logger.error(f"خطأ في تحديث الحسابات المتعددة: {e}")
+            # قد تكون بعض الصفوف حُدثت قبل الخطأ
+            self.read_cache.invalidate()
+            logger.error("خطأ في تحديث الحسابات المتعددة: %s", e)
             return False
 
     def count_available_accounts(self):
         """عد الحسابات المتاحة"""
-        try:
-            if not self.sheet:
-                return 0
-
-            all_records = self.sheet.get_all_records()
-            count = 0
-
-            for record in all_records:
-                # محاولة قراءة البيانات بأسماء مختلفة للعناوين
-                status = record.get('Status', record.get('status', '')).strip()
-                email = record.get('Gmail', record.get('email', '')).strip()
-                password = record.get('Password', record.get('password', '')).strip()
-
-                if not status and email and password:
-                    count += 1
-
-            return count
-
-        except Exception as e:
-            logger.error(f"خطأ في عد الحسابات: {e}")
-            return 0
+        return self.get_stats()['available_accounts']
 
     def get_stats(self):
         """جلب إحصائيات الحسابات"""
         try:
-            if not self.sheet:
+            if not self.sheet and not self.snapshot.warm:
                 return {
                     'available_accounts': 0,
                     'available_emails': 0,
@@ -370,55 +723,23 @@ class TelegramAccountBot:
                     'total_emails': 0
                 }
 
-            # إحصائيات حسابات يوتيوب (الأعمدة A, B, C)
-            youtube_email_col = self.sheet.col_values(1)  # العمود A
-            youtube_password_col = self.sheet.col_values(2)  # العمود B
-            youtube_status_col = self.sheet.col_values(3)  # العمود C
-
-            # إحصائيات حسابات شات جي بي تي (الأعمدة F, G, H)
-            chatgpt_email_col = self.sheet.col_values(6)  # العمود F
-            chatgpt_password_col = self.sheet.col_values(7)  # العمود G
-            chatgpt_status_col = self.sheet.col_values(8)  # العمود H
-
-            # حساب إحصائيات يوتيوب
-            available_youtube = 0
-            used_youtube = 0
-
-            max_len_youtube = max(len(youtube_email_col), len(youtube_password_col), len(youtube_status_col))
-            youtube_email_col.extend([''] * (max_len_youtube - len(youtube_email_col)))
-            youtube_password_col.extend([''] * (max_len_youtube - len(youtube_password_col)))
-            youtube_status_col.extend([''] * (max_len_youtube - len(youtube_status_col)))
-
-            for i in range(1, len(youtube_email_col)):  # البداية من الصف 2
-                email = youtube_email_col[i].strip() if youtube_email_col[i] else ''
-                password = youtube_password_col[i].strip() if youtube_password_col[i] else ''
-                status = youtube_status_col[i].strip() if youtube_status_col[i] else ''
-
-                if email and password:
-                    if status:
-                        used_youtube += 1
-                    else:
-                        available_youtube += 1
-
-            # حساب إحصائيات شات جي بي تي
-            available_chatgpt = 0
-            used_chatgpt = 0
-
-            max_len_chatgpt = max(len(chatgpt_email_col), len(chatgpt_password_col), len(chatgpt_status_col))
-            chatgpt_email_col.extend([''] * (max_len_chatgpt - len(chatgpt_email_col)))
-            chatgpt_password_col.extend([''] * (max_len_chatgpt - len(chatgpt_password_col)))
-            chatgpt_status_col.extend([''] * (max_len_chatgpt - len(chatgpt_status_col)))
-
-            for i in range(1, len(chatgpt_email_col)):  # البداية من الصف 2
-                email = chatgpt_email_col[i].strip() if chatgpt_email_col[i] else ''
-                password = chatgpt_password_col[i].strip() if chatgpt_password_col[i] else ''
-                status = chatgpt_status_col[i].strip() if chatgpt_status_col[i] else ''
-
-                if email and password:
-                    if status:
-                        used_chatgpt += 1
-                    else:
-                        available_chatgpt += 1
+            # كل ورقة تُعد في خيط منفصل بالتوازي: (المتاح، المُستخدم، عدد الصفوف) لكل منتج
+            shard_counts = map_parallel(
+                lambda shard: {
+                    product: count_rows(*self.read_columns(*product_columns(product), shard=shard))
+                    for product in PRODUCTS
+                },
+                list(range(self.shard_count()))
+            )
+            for product in PRODUCTS:
+                self.shard_available[product] = {
+                    shard: counts[product][0] for shard, counts in enumerate(shard_counts)
+                }
+
+            available_youtube = sum(counts['youtube'][0] for counts in shard_counts)
+            used_youtube = sum(counts['youtube'][1] for counts in shard_counts)
+            available_chatgpt = sum(counts['chatgpt'][0] for counts in shard_counts)
+            used_chatgpt = sum(counts['chatgpt'][1] for counts in shard_counts)
 
             return {
                 'available_accounts': available_youtube,
@@ -427,6 +748,9 @@ class TelegramAccountBot:
                 'used_emails': used_chatgpt,
                 'total_accounts': available_youtube + used_youtube,
                 'total_emails': available_chatgpt + used_chatgpt,
+                # عدد الصفوف مع صف العناوين في الورقة الأساسية (صفحات التشخيص)
+                'youtube_rows': shard_counts[0]['youtube'][2],
+                'chatgpt_rows': shard_counts[0]['chatgpt'][2],
                 # للتوافق مع الكود القديم
                 'available': available_youtube + available_chatgpt,
                 'used': used_youtube + used_chatgpt,
@@ -434,7 +758,7 @@ class TelegramAccountBot:
             }
 
         except Exception as e:
-            logger.error(f"خطأ في جلب الإحصائيات: {e}")
+            logger.error("خطأ في جلب الإحصائيات: %s", e)
             return {
                 'available_accounts': 0,
                 'available_emails': 0,
@@ -452,6 +776,205 @@ class TelegramAccountBot:
         from datetime import datetime
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+# محلل الأداء عند الطلب (/profile)
+profiler = ProfilerController(scoped_classes=(TelegramAccountBot, UserDatabase))
+
+# أقصى طول لرسالة تلقرام (4096) مع هامش للتنسيق
+MESSAGE_LIMIT = 4000
+# الطلبات الأكبر من هذا العدد تُسلم كملف بدلاً من الرسائل
+DOCUMENT_THRESHOLD = 20
+
+def build_accounts_file(accounts):
+    """كتابة الحسابات في ملف CSV داخل الذاكرة بدون ملفات مؤقتة"""
+    buffer = io.BytesIO()
+    text_stream = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+    writer = csv.writer(text_stream)
+    writer.writerow(['email', 'password'])
+    for account in accounts:
+        writer.writerow([account['email'], account['password']])
+    text_stream.flush()
+    text_stream.detach()
+    buffer.seek(0)
+    return buffer
+
+async def send_accounts_file(update: Update, accounts, file_prefix):
+    """إرسال الحسابات كملف CSV"""
+    filename = f"{file_prefix}_{update.effective_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    await update.message.reply_document(
+        document=build_accounts_file(accounts),
+        filename=filename,
+        caption=f"📎 ملف الحسابات ({len(accounts)} حساب)"
+    )
+
+async def deliver_accounts(update: Update, waiting_message, accounts, header, footer, account_icon, file_prefix):
+    """تسليم الحسابات: رسالة واحدة للطلبات الصغيرة، رسائل مقسمة للمتوسطة، وملف للكبيرة
+
+    الحسابات مدفوعة بالفعل، لذلك أي فشل في الرسائل يتحول إلى إرسال ملف
+    """
+    if len(accounts) > DOCUMENT_THRESHOLD:
+        try:
+            await waiting_message.edit_text(
+                header + "\n📎 **البيانات في الملف المرفق**\n" + footer,
+                parse_mode='Markdown'
+            )
+        except Exception as e:
+            logger.error("خطأ في تحديث رسالة الشراء: %s", e)
+        await send_accounts_file(update, accounts, file_prefix)
+        return
+
+    entries = [
+        f"\n**حساب {i}:**\n{account_icon} `{account['email']}`\n🔐 `{account['password']}`\n"
+        for i, account in enumerate(accounts, 1)
+    ]
+
+    try:
+        full_message = header + "".join(entries) + footer
+        if len(full_message) <= MESSAGE_LIMIT:
+            await waiting_message.edit_text(full_message, parse_mode='Markdown')
+            return
+
+        # تقسيم الحسابات على عدة رسائل حسب الطول
+        await waiting_message.edit_text(header + footer, parse_mode='Markdown')
+        chunk = ""
+        for entry in entries:
+            if len(chunk) + len(entry) > MESSAGE_LIMIT:
+                await update.message.reply_text(chunk, parse_mode='Markdown')
+                chunk = ""
+            chunk += entry
+        if chunk:
+            await update.message.reply_text(chunk, parse_mode='Markdown')
+
+    except Exception as e:
+        logger.error("خطأ في إرسال الحسابات كرسائل، سيتم إرسالها كملف: %s", e)
+        await send_accounts_file(update, accounts, file_prefix)
+
+async def rebuild_credential_index(context: ContextTypes.DEFAULT_TYPE):
+    """مهمة دورية لإعادة بناء فهرس الإيميلات (يلتقط الصفوف المضافة يدوياً للشيت)"""
+    if bot_instance.serves_from_snapshot():
+        # عند التشغيل الدافئ وفي العمليات غير القائدة يُبنى الفهرس من النسخة المحلية بدون تنزيل الأعمدة
+        await asyncio.to_thread(bot_instance.refresh_credential_index, False)
+    elif bot_instance.sheet:
+        await asyncio.to_thread(bot_instance.refresh_credential_index)
+
+async def save_inventory_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """مهمة دورية لحفظ نسخة المخزون إذا تغيرت مراجعة الشيت"""
+    await asyncio.to_thread(bot_instance.refresh_inventory_snapshot)
+
+async def reload_inventory_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """مهمة دورية للعمليات غير القائدة: تحميل النسخة التي حفظها القائد إذا تغير ملفها"""
+    if bot_instance.is_follower:
+        await asyncio.to_thread(bot_instance.snapshot.reload)
+
+async def refill_account_pool(context: ContextTypes.DEFAULT_TYPE):
+    """مهمة خلفية لكتابة الحسابات المُسلمة وإعادة تعبئة المخزون"""
+    await asyncio.to_thread(bot_instance.account_pool.refill)
+
+def schedule_pool_refill(context: ContextTypes.DEFAULT_TYPE, product):
+    """جدولة تعبئة فورية للمخزون عند انخفاضه بدون انتظار المهمة الدورية"""
+    if bot_instance.account_pool.enabled and bot_instance.account_pool.needs_refill(product):
+        context.application.create_task(refill_account_pool(context))
+
+def sheets_unavailable_message():
+    """رسالة عدم توفر الشيت: جاري الاتصال بعد تشغيل دافئ أو خطأ في الاتصال"""
+    if bot_instance.sheets_connecting:
+        return "⏳ جاري الاتصال بـ Google Sheets بعد إعادة التشغيل، يرجى المحاولة بعد لحظات."
+    return "❌ خطأ في الاتصال بـ Google Sheets"
+
+# رد الشراء عندما ينفد الرصيد بين التحقق والخصم (طلبان متزامنان لنفس المستخدم)
+INSUFFICIENT_AFTER_RESERVE = "❌ رصيدك لم يعد كافياً لإتمام الطلب. لم يتم خصم أي كريدت وأُعيدت الحسابات للمخزون."
+
+async def send_recovered_accounts(telegram_bot, entry):
+    """تسليم حسابات عملية مستعادة في رسالة جديدة (رسالة الانتظار الأصلية غير معروفة)"""
+    accounts = entry['accounts']
+    icon = "🤖" if entry['product'] == 'chatgpt' else "📧"
+    header = (
+        f"✅ تم إكمال طلب الشراء المعلق: {len(accounts)} حساب {PRODUCTS[entry['product']]['name']}\n"
+        f"🕐 وقت الطلب: {entry['timestamp']}\n"
+    )
+
+    if len(accounts) > DOCUMENT_THRESHOLD:
+        await telegram_bot.send_document(
+            chat_id=entry['chat_id'],
+            document=build_accounts_file(accounts),
+            filename=f"{entry['product']}_{entry['user_id']}_{entry['id']}.csv",
+            caption=header
+        )
+        return
+
+    chunk = header
+    for i, account in enumerate(accounts, 1):
+        account_entry = f"\n**حساب {i}:**\n{icon} `{account['email']}`\n🔐 `{account['password']}`\n"
+        if len(chunk) + len(account_entry) > MESSAGE_LIMIT:
+            await telegram_bot.send_message(chat_id=entry['chat_id'], text=chunk, parse_mode='Markdown')
+            chunk = ""
+        chunk += account_entry
+    if chunk:
+        await telegram_bot.send_message(chat_id=entry['chat_id'], text=chunk, parse_mode='Markdown')
+
+async def recover_purchase(telegram_bot, journal_id):
+    """إكمال عملية شراء غير منتهية أو التراجع عنها حسب آخر مرحلة مسجلة؛ يرجع الحالة النهائية"""
+    journal = bot_instance.journal
+    entry = await asyncio.to_thread(journal.get, journal_id)
+    if entry is None or entry['state'] in FINAL_STATES:
+        return entry and entry['state']
+
+    if entry['state'] == INTENT or not entry['accounts']:
+        # لم يُحجز أي حساب ولم يُخصم شيء
+        await asyncio.to_thread(journal.finish, journal_id, FAILED)
+        return FAILED
+
+    if entry['state'] == RESERVED:
+        settled = await asyncio.to_thread(
+            bot_instance.settle_purchase, journal_id, entry['product'], entry['accounts'],
+            entry['user_id'], entry['username'], entry['timestamp']
+        )
+        if not settled:
+            await telegram_bot.send_message(
+                chat_id=entry['chat_id'],
+                text="⚠️ لم يكتمل طلب الشراء المعلق لعدم كفاية الرصيد. لم يتم خصم أي كريدت."
+            )
+            return COMPENSATED
+    else:
+        # تم الخصم: قد يكون التوقف حدث قبل التسجيل في سجل المشتريات
+        bot_instance.record_purchases(
+            entry['product'], entry['accounts'], entry['user_id'], entry['username'], entry['timestamp']
+        )
+
+    await asyncio.to_thread(bot_instance.ensure_accounts_marked, entry)
+    await send_recovered_accounts(telegram_bot, entry)
+    await asyncio.to_thread(journal.finish, journal_id, DELIVERED)
+    logger.info("♻️ تم إكمال عملية الشراء المعلقة %s (%s حساب)", journal_id, len(entry['accounts']))
+    return DELIVERED
+
+async def finish_failed_purchase(telegram_bot, waiting_message, journal_id):
+    """بعد خطأ غير متوقع في الشراء: إكمال العملية أو التراجع عنها ثم إبلاغ المستخدم"""
+    state = None
+    if journal_id is not None:
+        try:
+            state = await recover_purchase(telegram_bot, journal_id)
+        except Exception as e:
+            logger.error("تعذر استعادة عملية الشراء %s، ستُستعاد عند إعادة التشغيل: %s", journal_id, e)
+
+    try:
+        if state == DELIVERED:
+            await waiting_message.edit_text("⚠️ حدث خطأ أثناء التسليم، تم إرسال الحسابات في رسالة منفصلة.")
+        elif state != COMPENSATED:
+            await waiting_message.edit_text("❌ حدث خطأ غير متوقع. يرجى المحاولة لاحقاً.")
+    except Exception as e:
+        logger.error("خطأ في تحديث رسالة الشراء: %s", e)
+
+async def recover_unfinished_purchases(context: ContextTypes.DEFAULT_TYPE):
+    """مهمة عند التشغيل: إكمال أو التراجع عن عمليات الشراء التي قطعها توقف البوت"""
+    entries = await asyncio.to_thread(bot_instance.journal.unfinished)
+    for entry in entries:
+        try:
+            await recover_purchase(context.bot, entry['id'])
+        except Exception as e:
+            logger.error("تعذر استعادة عملية الشراء %s: %s", entry['id'], e)
+    if entries:
+        logger.info("♻️ تمت معالجة %s عملية شراء غير منتهية من السجل", len(entries))
+    await asyncio.to_thread(bot_instance.journal.prune)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """أمر البداية"""
     user_id = update.effective_user.id
@@ -532,6 +1055,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📧 `/email10` - شراء 10 إيميلات دفعة واحدة
 
 📊 `/stats` - عرض إحصائيات الحسابات
+🧾 `/history` - سجل مشترياتك
 ❓ `/help` - عرض هذه المساعدة
 
 💡 **كيفية الاستخدام:**
@@ -569,7 +1093,8 @@ async def buy_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
     first_name = update.effective_user.first_name or "غير محدد"
 
     # استخراج العدد من الأمر (مثل /buy5 أو /buy10)
-    command_text = update.message.text.strip()
+    # بدون @اسم_البوت الذي يُضاف للأوامر في المجموعات
+    command_text = update.message.text.strip().split('@', 1)[0]
     count = 1  # افتراضي: حساب واحد
 
     # التحقق من وجود رقم في الأمر
@@ -603,12 +1128,38 @@ async def buy_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         waiting_message = await update.message.reply_text(f"🔍 جاري البحث عن {count} حساب يوتيوب متاح...")
 
+    journal_id = None
     try:
+        # تسجيل نية الشراء قبل أي تعديل على الشيت أو الكريدت
+        journal_id = await asyncio.to_thread(
+            bot_instance.journal.begin,
+            'youtube', count, user_id, update.effective_chat.id, username, first_name, bot_instance.get_current_time()
+        )
+
+        # محاولة التسليم الفوري من المخزون المحجوز مسبقاً (حفظ ملف المخزون يتم في خيط)
+        pooled_accounts = await asyncio.to_thread(
+            bot_instance.take_pooled_accounts, 'youtube', count, user_id, username, first_name, journal_id=journal_id
+        )
+        schedule_pool_refill(context, 'youtube')
+
+        if not pooled_accounts and not bot_instance.sheet:
+            await asyncio.to_thread(bot_instance.journal.finish, journal_id, FAILED)
+            await waiting_message.edit_text(sheets_unavailable_message())
+            return
+
         if count == 1:
-            # شراء حساب واحد (الطريقة القديمة)
-            account = bot_instance.find_available_account()
+            if pooled_accounts:
+                account = pooled_accounts[0]
+                success = True
+            else:
+                # شراء حساب واحد (الطريقة القديمة) في خيط حتى لا يوقف انتظار قفل الحجز البوت كاملاً
+                accounts, success = await asyncio.to_thread(
+                    bot_instance.claim_accounts, 1, user_id, username, first_name, journal_id
+                )
+                account = accounts[0] if accounts else None
 
             if not account:
+                await asyncio.to_thread(bot_instance.journal.finish, journal_id, FAILED)
                 available_count = bot_instance.count_available_accounts()
                 await waiting_message.edit_text(
                     f"❌ عذراً، لا توجد حسابات متاحة حالياً.\n"
@@ -617,11 +1168,13 @@ async def buy_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return
 
-            success = bot_instance.mark_account_as_used(account['row'], user_id, username, first_name)
-
             if success:
                 # خصم الكريدت
-                bot_instance.deduct_user_credits(user_id, 1)
+                if not await asyncio.to_thread(
+                    bot_instance.settle_purchase, journal_id, 'youtube', [account], user_id, username
+                ):
+                    await waiting_message.edit_text(INSUFFICIENT_AFTER_RESERVE)
+                    return
                 remaining_credits = bot_instance.user_db.get_credits(user_id)
 
                 account_message = f"""
@@ -642,15 +1195,24 @@ async def buy_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🕐 **وقت الشراء:** {bot_instance.get_current_time()}
                 """
                 await waiting_message.edit_text(account_message, parse_mode='Markdown')
-                logger.info(f"تم إعطاء حساب للمستخدم {user_id} (@{username}) - {first_name} - خصم 1 كريدت")
+                await asyncio.to_thread(bot_instance.journal.finish, journal_id, DELIVERED)
+                logger.info("تم إعطاء حساب للمستخدم %s (@%s) - %s - خصم 1 كريدت", user_id, username, first_name,
+                            extra={"user_id": user_id, "command": "buy", "product": "youtube", "count": 1})
             else:
+                await asyncio.to_thread(bot_instance.cancel_purchase, journal_id, 'youtube', [account])
                 await waiting_message.edit_text("❌ حدث خطأ في تحديث الحساب. يرجى المحاولة مرة أخرى.")
 
         else:
             # شراء عدة حسابات
-            accounts = bot_instance.find_multiple_accounts(count)
+            if pooled_accounts:
+                accounts = pooled_accounts
+            else:
+                accounts, success = await asyncio.to_thread(
+                    bot_instance.claim_accounts, count, user_id, username, first_name, journal_id
+                )
 
             if not accounts:
+                await asyncio.to_thread(bot_instance.journal.finish, journal_id, FAILED)
                 available_count = bot_instance.count_available_accounts()
                 await waiting_message.edit_text(
                     f"❌ عذراً، لا توجد حسابات متاحة حالياً.\n"
@@ -667,22 +1229,19 @@ async def buy_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 # المتابعة مع الحسابات المتاحة
 
-            success = bot_instance.mark_multiple_accounts_as_used(accounts, user_id, username, first_name)
-
-            if success:
+            if pooled_accounts or success:
                 # خصم الكريدت
-                bot_instance.deduct_user_credits(user_id, len(accounts))
+                if not await asyncio.to_thread(
+                    bot_instance.settle_purchase, journal_id, 'youtube', accounts, user_id, username
+                ):
+                    await waiting_message.edit_text(INSUFFICIENT_AFTER_RESERVE)
+                    return
                 remaining_credits = bot_instance.user_db.get_credits(user_id)
 
-                # إنشاء رسالة الحسابات
-                accounts_text = ""
-                for i, account in enumerate(accounts, 1):
-                    accounts_text += f"\n**حساب {i}:**\n📧 `{account['email']}`\n🔐 `{account['password']}`\n"
-
-                accounts_message = f"""
+                accounts_header = f"""
 ✅ تم العثور على {len(accounts)} حساب يوتيوب لك!
-
-{accounts_text}
+"""
+                accounts_footer = f"""
 💰 **تم خصم {len(accounts)} كريدت - رصيدك الحالي: {remaining_credits} كريدت**
 
 ⚠️ **ملاحظة مهمة:**
@@ -694,14 +1253,19 @@ async def buy_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🆔 **معرف المستخدم:** `{user_id}`
 🕐 **وقت الشراء:** {bot_instance.get_current_time()}
                 """
-                await waiting_message.edit_text(accounts_message, parse_mode='Markdown')
-                logger.info(f"تم إعطاء {len(accounts)} حساب للمستخدم {user_id} (@{username}) - {first_name} - خصم {len(accounts)} كريدت")
+                await deliver_accounts(
+                    update, waiting_message, accounts, accounts_header, accounts_footer, "📧", "youtube"
+                )
+                await asyncio.to_thread(bot_instance.journal.finish, journal_id, DELIVERED)
+                logger.info("تم إعطاء %d حساب للمستخدم %s (@%s) - %s - خصم %d كريدت", len(accounts), user_id, username, first_name, len(accounts),
+                            extra={"user_id": user_id, "command": "buy", "product": "youtube", "count": len(accounts)})
             else:
+                await asyncio.to_thread(bot_instance.cancel_purchase, journal_id, 'youtube', accounts)
                 await waiting_message.edit_text("❌ حدث خطأ في تحديث الحسابات. يرجى المحاولة مرة أخرى.")
 
     except Exception as e:
-        logger.error(f"خطأ في أمر الشراء: {e}")
-        await waiting_message.edit_text("❌ حدث خطأ غير متوقع. يرجى المحاولة لاحقاً.")
+        logger.error("خطأ في أمر الشراء: %s", e)
+        await finish_failed_purchase(context.bot, waiting_message, journal_id)
 
 async def buy_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """أمر شراء حساب شات جي بي تي من الأعمدة F, G, H"""
@@ -710,7 +1274,8 @@ async def buy_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     first_name = update.effective_user.first_name or "غير محدد"
 
     # استخراج العدد من الأمر (مثل /email5 أو /email10)
-    command_text = update.message.text.strip()
+    # بدون @اسم_البوت الذي يُضاف للأوامر في المجموعات
+    command_text = update.message.text.strip().split('@', 1)[0]
     count = 1  # افتراضي: إيميل واحد
 
     # التحقق من وجود رقم في الأمر
@@ -744,64 +1309,58 @@ async def buy_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         waiting_message = await update.message.reply_text(f"🔍 جاري البحث عن {count} حساب شات جي بي تي متاح...")
 
+    journal_id = None
     try:
-        # الحصول على البيانات من الشيت
-        if not bot_instance.sheet:
-            await waiting_message.edit_text("❌ خطأ في الاتصال بـ Google Sheets")
-            return
+        timestamp = bot_instance.get_current_time()
 
-        # قراءة الأعمدة F, G, H (الإيميلات الجديدة)
-        email_col = bot_instance.sheet.col_values(6)  # العمود F
-        password_col = bot_instance.sheet.col_values(7)  # العمود G
-        status_col = bot_instance.sheet.col_values(8)  # العمود H
-
-        # التأكد من أن القوائم لها نفس الطول
-        max_len = max(len(email_col), len(password_col), len(status_col))
-        email_col.extend([''] * (max_len - len(email_col)))
-        password_col.extend([''] * (max_len - len(password_col)))
-        status_col.extend([''] * (max_len - len(status_col)))
-
-        # فلترة الإيميلات المتاحة (التي لا تحتوي على حالة في العمود H)
-        available_emails = []
-        for i in range(1, len(email_col)):  # البداية من الصف 2 (index 1)
-            if email_col[i].strip() and password_col[i].strip() and not status_col[i].strip():
-                available_emails.append({
-                    'row': i + 1,  # رقم الصف الفعلي في الشيت
-                    'email': email_col[i].strip(),
-                    'password': password_col[i].strip()
-                })
+        # تسجيل نية الشراء قبل أي تعديل على الشيت أو الكريدت
+        journal_id = await asyncio.to_thread(
+            bot_instance.journal.begin,
+            'chatgpt', count, user_id, update.effective_chat.id, username, first_name, timestamp
+        )
+
+        # محاولة التسليم الفوري من المخزون المحجوز مسبقاً (حفظ ملف المخزون يتم في خيط)
+        selected_emails = await asyncio.to_thread(
+            bot_instance.take_pooled_accounts, 'chatgpt', count, user_id, username, first_name, timestamp, journal_id
+        )
+        schedule_pool_refill(context, 'chatgpt')
+
+        if not selected_emails:
+            # الحصول على البيانات من الشيت
+            if not bot_instance.sheet:
+                await asyncio.to_thread(bot_instance.journal.finish, journal_id, FAILED)
+                await waiting_message.edit_text(sheets_unavailable_message())
+                return
+
+            selected_emails = await asyncio.to_thread(
+                bot_instance.claim_emails, count, user_id, username, timestamp, journal_id
+            )
 
-        if len(available_emails) == 0:
+        if len(selected_emails) == 0:
+            await asyncio.to_thread(bot_instance.journal.finish, journal_id, FAILED)
             await waiting_message.edit_text(
                 f"❌ عذراً، لا توجد حسابات شات جي بي تي متاحة حالياً.\n"
                 f"⏰ يرجى المحاولة لاحقاً أو التواصل مع الإدارة."
             )
             return
 
-        if len(available_emails) < count:
+        if len(selected_emails) < count:
             # إعطاء الإيميلات المتاحة بدلاً من رفض الطلب
             await waiting_message.edit_text(
-                f"⚠️ تم العثور على {len(available_emails)} حساب شات جي بي تي فقط من أصل {count} مطلوب.\n"
-                f"✅ سيتم إعطاؤك جميع الحسابات المتاحة ({len(available_emails)} حساب)..."
+                f"⚠️ تم العثور على {len(selected_emails)} حساب شات جي بي تي فقط من أصل {count} مطلوب.\n"
+                f"✅ سيتم إعطاؤك جميع الحسابات المتاحة ({len(selected_emails)} حساب)..."
             )
-            count = len(available_emails)  # تحديث العدد للإيميلات المتاحة
-
-        # أخذ العدد المطلوب من الإيميلات
-        selected_emails = available_emails[:count]
-
-        # تحديث حالة الإيميلات إلى "مُستخدم"
-        user_info = f"@{username}" if username != "غير محدد" else f"User_{user_id}"
-        timestamp = bot_instance.get_current_time()
-        status_text = f"مُستخدم - {user_info} - {timestamp}"
-
-        for email_data in selected_emails:
-            bot_instance.sheet.update_cell(email_data['row'], 8, status_text)  # العمود H للحالة
+            count = len(selected_emails)  # تحديث العدد للإيميلات المتاحة
 
         # إرسال الإيميلات للمستخدم
         if count == 1:
             email_data = selected_emails[0]
             # خصم الكريدت
-            bot_instance.deduct_user_credits(user_id, 1)
+            if not await asyncio.to_thread(
+                bot_instance.settle_purchase, journal_id, 'chatgpt', [email_data], user_id, username, timestamp
+            ):
+                await waiting_message.edit_text(INSUFFICIENT_AFTER_RESERVE)
+                return
             remaining_credits = bot_instance.user_db.get_credits(user_id)
 
             email_message = f"""
@@ -822,21 +1381,22 @@ async def buy_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🕐 **وقت الشراء:** {timestamp}
             """
             await waiting_message.edit_text(email_message, parse_mode='Markdown')
-            logger.info(f"تم إعطاء إيميل للمستخدم {user_id} (@{username}) - {first_name}")
+            await asyncio.to_thread(bot_instance.journal.finish, journal_id, DELIVERED)
+            logger.info("تم إعطاء إيميل للمستخدم %s (@%s) - %s", user_id, username, first_name,
+                        extra={"user_id": user_id, "command": "email", "product": "chatgpt", "count": 1})
         else:
             # خصم الكريدت
-            bot_instance.deduct_user_credits(user_id, len(selected_emails))
+            if not await asyncio.to_thread(
+                bot_instance.settle_purchase, journal_id, 'chatgpt', selected_emails, user_id, username, timestamp
+            ):
+                await waiting_message.edit_text(INSUFFICIENT_AFTER_RESERVE)
+                return
             remaining_credits = bot_instance.user_db.get_credits(user_id)
 
-            # إنشاء رسالة الحسابات
-            emails_text = ""
-            for i, email_data in enumerate(selected_emails, 1):
-                emails_text += f"\n**حساب {i}:**\n🤖 `{email_data['email']}`\n🔐 `{email_data['password']}`\n"
-
-            emails_message = f"""
+            emails_header = f"""
 ✅ تم العثور على {len(selected_emails)} حساب شات جي بي تي لك!
-
-{emails_text}
+"""
+            emails_footer = f"""
 💰 **تم خصم {len(selected_emails)} كريدت - رصيدك الحالي: {remaining_credits} كريدت**
 
 ⚠️ **ملاحظة مهمة:**
@@ -848,12 +1408,16 @@ async def buy_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🆔 **معرف المستخدم:** `{user_id}`
 🕐 **وقت الشراء:** {timestamp}
             """
-            await waiting_message.edit_text(emails_message, parse_mode='Markdown')
-            logger.info(f"تم إعطاء {len(selected_emails)} إيميل للمستخدم {user_id} (@{username}) - {first_name}")
+            await deliver_accounts(
+                update, waiting_message, selected_emails, emails_header, emails_footer, "🤖", "chatgpt"
+            )
+            await asyncio.to_thread(bot_instance.journal.finish, journal_id, DELIVERED)
+            logger.info("تم إعطاء %d إيميل للمستخدم %s (@%s) - %s", len(selected_emails), user_id, username, first_name,
+                        extra={"user_id": user_id, "command": "email", "product": "chatgpt", "count": len(selected_emails)})
 
     except Exception as e:
-        logger.error(f"خطأ في أمر شراء الإيميل: {e}")
-        await waiting_message.edit_text("❌ حدث خطأ غير متوقع. يرجى المحاولة لاحقاً.")
+        logger.error("خطأ في أمر شراء الإيميل: %s", e)
+        await finish_failed_purchase(context.bot, waiting_message, journal_id)
 
 async def credits_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """أمر عرض الكريدت"""
@@ -976,9 +1540,11 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🤖 **حسابات شات جي بي تي متاحة:** {stats['available_emails']}
 
 💳 **أوامر إدارة الكريدت:**
-• `/addcredits [user_id] [amount]` - إضافة كريدت مخصص
-• `/give100 [user_id]` - إعطاء 100 كريدت لمستخدم
-• `/resetuser [user_id]` - تصفير كريدت مستخدم محدد
+• `/addcredits [user_id|@username] [amount]` - إضافة كريدت مخصص
+• `/give100 [user_id|@username]` - إعطاء 100 كريدت لمستخدم
+• `/resetuser [user_id|@username]` - تصفير كريدت مستخدم محدد
+• `/ban [user_id|@username]` - حظر مستخدم
+• `/unban [user_id|@username]` - إلغاء حظر مستخدم
 • `/resetall` - تصفير كريدت جميع المستخدمين
 • `/resetallconfirm` - تأكيد التصفير الجماعي
 • `/giveall100` - إعطاء 100 كريدت لجميع المستخدمين
@@ -986,10 +1552,20 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 📊 **أوامر الإحصائيات والإدارة:**
 • `/adminstats` - إحصائيات مفصلة للأدمن
-• `/allusers` - عرض جميع المستخدمين
+• `/metrics` - مقاييس الأداء وزمن الاستجابة
+• `/profile [N|Ts|stop]` - تحليل الأداء لعدد تحديثات أو ثواني
+• `/allusers` - تصفح المستخدمين صفحة بصفحة
+• `/finduser [اسم]` - البحث عن مستخدم بالاسم
+• `/topusers [credits|total_purchases] [k]` - أعلى المستخدمين
+• `/purchases [user_id|@username]` - مشتريات مستخدم
+• `/whobought [email|youtube:صف]` - معرفة مشتري حساب
+• `/refund [رقم العملية]` - استرداد كريدت عملية شراء
+• `/backfillledger` - استيراد المشتريات القديمة من الشيت
+• `/restock [youtube|chatgpt]` - إضافة حسابات من ملف TXT/CSV
+• `/duplicates` - الإيميلات المكررة في الشيت
 • `/stats` - إحصائيات عامة للحسابات
-• `/debug` - فحص البيانات (20 صف)
-• `/debugall` - فحص جميع البيانات (100 صف)
+• `/debug` - فحص البيانات (آخر صفحة)
+• `/debugall` - تصفح جميع البيانات صفحة بصفحة
 
 📢 **أوامر التواصل:**
 • `/broadcast [message]` - إرسال رسالة لجميع المستخدمين
@@ -1012,136 +1588,125 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(admin_panel, parse_mode='Markdown')
 
     except Exception as e:
-        logger.error(f"خطأ في لوحة تحكم الأدمن: {e}")
+        logger.error("خطأ في لوحة تحكم الأدمن: %s", e)
         await update.message.reply_text(
             "❌ حدث خطأ في تحميل لوحة التحكم.\n"
             "يرجى المحاولة لاحقاً أو استخدام الأوامر المنفصلة.",
             parse_mode='Markdown'
         )
 
-async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """أمر تشخيصي لفحص البيانات"""
-    try:
-        if not bot_instance.sheet:
-            await update.message.reply_text("❌ خطأ في الاتصال بـ Google Sheets")
-            return
-
-        # قراءة الأعمدة مباشرة
-        email_col = bot_instance.sheet.col_values(1)  # العمود A
-        password_col = bot_instance.sheet.col_values(2)  # العمود B
-        status_col = bot_instance.sheet.col_values(3)  # العمود C
-
-        debug_message = f"""
-🔍 **تشخيص البيانات:**
-
-📊 **عدد الإيميلات في العمود A:** {len(email_col)}
-📊 **عدد كلمات المرور في العمود B:** {len(password_col)}
-📊 **عدد الحالات في العمود C:** {len(status_col)}
-
-📋 **جميع البيانات من الأعمدة المباشرة:**
-"""
-
-        # عرض جميع البيانات
-        max_len = max(len(email_col), len(password_col), len(status_col))
+# عدد الصفوف في كل صفحة من صفحات التشخيص
+DEBUG_PAGE_SIZE = 30
 
-        # عرض إحصائيات سريعة
-        available_count = 0
-        used_count = 0
+def build_debug_page(page):
+    """بناء صفحة تشخيص من قراءة نطاق واحد صغير (A{n}:C{m})"""
+    stats = bot_instance.get_cached_stats()
 
-        for i in range(1, max_len):  # تجاهل الصف الأول (العناوين)
-            email = email_col[i].strip() if i < len(email_col) and email_col[i] else ''
-            password = password_col[i].strip() if i < len(password_col) and password_col[i] else ''
-            status = status_col[i].strip() if i < len(status_col) and status_col[i] else ''
+    data_rows = max(stats.get('youtube_rows', 0) - 1, 0)  # بدون صف العناوين
+    total_pages = max(1, math.ceil(data_rows / DEBUG_PAGE_SIZE))
+    page = min(max(page, 1), total_pages)
 
-            if email and password:
-                if status:
-                    used_count += 1
-                else:
-                    available_count += 1
+    start_row = 2 + (page - 1) * DEBUG_PAGE_SIZE  # تجاهل الصف الأول (العناوين)
+    end_row = start_row + DEBUG_PAGE_SIZE - 1
+    rows = bot_instance.read_row_range(start_row, end_row) if data_rows else []
 
-        debug_message += f"""
+    debug_message = f"""
+🔍 **تشخيص البيانات - الصفحة {page}/{total_pages}**
 
 📊 **الإحصائيات:**
-🟢 متاح: {available_count}
-🔴 مُستخدم: {used_count}
-📈 المجموع: {available_count + used_count}
+🟢 متاح: {stats['available_accounts']}
+🔴 مُستخدم: {stats['used_accounts']}
+📈 المجموع: {stats['total_accounts']}
 
-📋 **آخر 20 صف من البيانات:**
+📋 **الصفوف {start_row} إلى {min(end_row, data_rows + 1)} من أصل {data_rows + 1}:**
 """
 
-        # عرض آخر 20 صف
-        start_index = max(1, max_len - 20)  # البداية من آخر 20 صف أو من الصف 1
-        for i in range(start_index, max_len):
-            email = email_col[i] if i < len(email_col) else 'فارغ'
-            password = password_col[i] if i < len(password_col) else 'فارغ'
-            status = status_col[i] if i < len(status_col) else 'فارغ'
+    for offset, (email, password, status) in enumerate(rows):
+        row_number = start_row + offset
+        if row_number > data_rows + 1:
+            break
 
-            # تقصير كلمة المرور للعرض
-            display_password = password[:8] + "..." if len(password) > 8 else password
-            display_status = status[:10] + "..." if len(status) > 10 else status
+        # تقصير البيانات للعرض
+        display_email = email[:25] + "..." if len(email) > 25 else email or 'فارغ'
+        display_password = password[:10] + "..." if len(password) > 10 else password or 'فارغ'
+        display_status = status[:15] + "..." if len(status) > 15 else status or 'فارغ'
 
-            debug_message += f"\nصف {i+1}: `{email}` | `{display_password}` | `{display_status}`"
+        debug_message += f"\nصف {row_number}: `{display_email}` | `{display_password}` | `{display_status}`"
 
-        await update.message.reply_text(debug_message, parse_mode='Markdown')
+    # أزرار التنقل بين الصفحات
+    navigation = []
+    if page > 1:
+        navigation.append(InlineKeyboardButton("⏮", callback_data="debug:1"))
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"debug:{page - 1}"))
+    navigation.append(InlineKeyboardButton(f"🔄 {page}/{total_pages}", callback_data=f"debug:{page}"))
+    if page < total_pages:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"debug:{page + 1}"))
+        navigation.append(InlineKeyboardButton("⏭", callback_data=f"debug:{total_pages}"))
 
-    except Exception as e:
-        logger.error(f"خطأ في أمر التشخيص: {e}")
-        await update.message.reply_text(f"❌ خطأ في التشخيص: {str(e)}")
+    return debug_message, InlineKeyboardMarkup([navigation])
 
-async def debug_all_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """أمر تشخيصي لفحص جميع البيانات (حتى 100 صف)"""
+async def send_debug_page(update: Update, page):
+    """إرسال صفحة تشخيص جديدة"""
     try:
         if not bot_instance.sheet:
             await update.message.reply_text("❌ خطأ في الاتصال بـ Google Sheets")
             return
 
-        # قراءة الأعمدة مباشرة
-        email_col = bot_instance.sheet.col_values(1)  # العمود A
-        password_col = bot_instance.sheet.col_values(2)  # العمود B
-        status_col = bot_instance.sheet.col_values(3)  # العمود C
+        debug_message, keyboard = await asyncio.to_thread(build_debug_page, page)
+        await update.message.reply_text(debug_message, parse_mode='Markdown', reply_markup=keyboard)
 
-        max_len = max(len(email_col), len(password_col), len(status_col))
+    except Exception as e:
+        logger.error("خطأ في أمر التشخيص: %s", e)
+        await update.message.reply_text(f"❌ خطأ في التشخيص: {str(e)}")
 
-        # تقسيم البيانات إلى رسائل متعددة (كل رسالة 30 صف)
-        rows_per_message = 30
-        total_messages = (max_len - 1 + rows_per_message - 1) // rows_per_message  # تقريب للأعلى
+async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر تشخيصي لفحص البيانات (آخر صفحة)"""
+    user_id = update.effective_user.id
+    username = update.effective_user.username or ""
 
-        for msg_num in range(total_messages):
-            start_row = 1 + (msg_num * rows_per_message)  # تجاهل الصف الأول (العناوين)
-            end_row = min(start_row + rows_per_message, max_len)
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
 
-            debug_message = f"""
-🔍 **البيانات الكاملة - الجزء {msg_num + 1}/{total_messages}**
-📊 **الصفوف {start_row} إلى {end_row - 1} من أصل {max_len - 1}**
+    # صفحة كبيرة جداً تُقص تلقائياً إلى آخر صفحة
+    await send_debug_page(update, sys.maxsize)
 
-"""
+async def debug_all_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر تشخيصي لتصفح جميع البيانات صفحة بصفحة"""
+    user_id = update.effective_user.id
+    username = update.effective_user.username or ""
+
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
 
-            for i in range(start_row, end_row):
-                email = email_col[i] if i < len(email_col) else 'فارغ'
-                password = password_col[i] if i < len(password_col) else 'فارغ'
-                status = status_col[i] if i < len(status_col) else 'فارغ'
+    await send_debug_page(update, 1)
 
-                # تقصير البيانات للعرض
-                display_email = email[:25] + "..." if len(email) > 25 else email
-                display_password = password[:10] + "..." if len(password) > 10 else password
-                display_status = status[:15] + "..." if len(status) > 15 else status
+async def debug_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """التنقل بين صفحات التشخيص عبر الأزرار"""
+    query = update.callback_query
 
-                debug_message += f"صف {i+1}: `{display_email}` | `{display_password}` | `{display_status}`\n"
+    if not bot_instance.is_admin(query.from_user.username or "", query.from_user.id):
+        await query.answer("❌ هذا الأمر متاح للأدمن فقط!", show_alert=True)
+        return
 
-            await update.message.reply_text(debug_message, parse_mode='Markdown')
+    await query.answer()
 
-            # توقف قصير بين الرسائل
-            import asyncio
-            await asyncio.sleep(1)
+    try:
+        page = int(query.data.split(':', 1)[1])
+        debug_message, keyboard = await asyncio.to_thread(build_debug_page, page)
+        await query.edit_message_text(debug_message, parse_mode='Markdown', reply_markup=keyboard)
 
     except Exception as e:
-        logger.error(f"خطأ في أمر التشخيص الكامل: {e}")
-        await update.message.reply_text(f"❌ خطأ في التشخيص: {str(e)}")
+        # تجاهل خطأ عدم تغيّر الرسالة عند الضغط على التحديث
+        if "not modified" not in str(e):
+            logger.error("خطأ في صفحة التشخيص: %s", e)
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """أمر عرض الإحصائيات"""
     try:
-        stats = bot_instance.get_stats()
+        # القراءة في خيط منفصل حتى تشترك الطلبات المتزامنة في نفس القراءة
+        stats = await asyncio.to_thread(bot_instance.get_stats)
 
         stats_message = f"""
 📊 **إحصائيات الحسابات**
@@ -1158,7 +1723,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(stats_message, parse_mode='Markdown')
 
     except Exception as e:
-        logger.error(f"خطأ في أمر الإحصائيات: {e}")
+        logger.error("خطأ في أمر الإحصائيات: %s", e)
         await update.message.reply_text("❌ حدث خطأ في جلب الإحصائيات.")
 
 async def add_credits_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1178,16 +1743,20 @@ async def add_credits_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text(
                 "❌ **صيغة الأمر غير صحيحة!**\n\n"
                 "📝 **الاستخدام الصحيح:**\n"
-                "`/addcredits [user_id] [amount]`\n\n"
+                "`/addcredits [user_id|@username] [amount]`\n\n"
                 "**مثال:**\n"
                 "`/addcredits 123456789 10`",
                 parse_mode='Markdown'
             )
             return
 
-        target_user_id = int(args[1])
+        target_user_id = bot_instance.user_db.resolve_user_id(args[1])
         amount = int(args[2])
 
+        if target_user_id is None:
+            await update.message.reply_text(f"❌ لم يتم العثور على المستخدم {args[1]}")
+            return
+
         if amount <= 0:
             await update.message.reply_text("❌ المبلغ يجب أن يكون أكبر من صفر!")
             return
@@ -1203,7 +1772,7 @@ async def add_credits_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             parse_mode='Markdown'
         )
 
-        logger.info(f"الأدمن {username} أضاف {amount} كريدت للمستخدم {target_user_id}")
+        logger.info("الأدمن %s أضاف %s كريدت للمستخدم %s", username, amount, target_user_id)
 
     except ValueError:
         await update.message.reply_text("❌ يرجى إدخال أرقام صحيحة!")
@@ -1226,7 +1795,7 @@ async def give_100_credits_command(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text(
                 "❌ **صيغة الأمر غير صحيحة!**\n\n"
                 "📝 **الاستخدام الصحيح:**\n"
-                "`/give100 [user_id]`\n\n"
+                "`/give100 [user_id|@username]`\n\n"
                 "**مثال:**\n"
                 "`/give100 123456789`\n\n"
                 "💡 **سيتم إعطاء 100 كريدت للمستخدم تلقائياً**",
@@ -1234,13 +1803,17 @@ async def give_100_credits_command(update: Update, context: ContextTypes.DEFAULT
             )
             return
 
-        target_user_id = int(args[1])
+        target_user_id = bot_instance.user_db.resolve_user_id(args[1])
+
+        if target_user_id is None:
+            await update.message.reply_text(f"❌ لم يتم العثور على المستخدم {args[1]}")
+            return
 
         # إضافة 100 كريدت
         new_balance = bot_instance.user_db.add_credits(target_user_id, 100)
 
         # الحصول على معلومات المستخدم
-        user_data = bot_instance.user_db.get_user(target_user_id)
+        user_data, _ = bot_instance.user_db.get_user(target_user_id)
         username_target = user_data.get('username', 'غير محدد')
         first_name_target = user_data.get('first_name', 'غير محدد')
 
@@ -1269,7 +1842,7 @@ async def give_100_credits_command(update: Update, context: ContextTypes.DEFAULT
         except Exception:
             await update.message.reply_text("⚠️ تم إضافة الكريدت ولكن لم يتم إرسال الإشعار للمستخدم")
 
-        logger.info(f"الأدمن {username} أعطى 100 كريدت للمستخدم {target_user_id}")
+        logger.info("الأدمن %s أعطى 100 كريدت للمستخدم %s", username, target_user_id)
 
     except ValueError:
         await update.message.reply_text("❌ يرجى إدخال معرف مستخدم صحيح!")
@@ -1339,7 +1912,7 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
 
-        logger.info(f"الأدمن {username} أرسل رسالة جماعية لـ {success_count} مستخدم")
+        logger.info("الأدمن %s أرسل رسالة جماعية لـ %s مستخدم", username, success_count)
 
     except Exception as e:
         await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
@@ -1438,13 +2011,71 @@ async def give_all_100_credits_confirm_command(update: Update, context: ContextT
             parse_mode='Markdown'
         )
 
-        logger.info(f"الأدمن {username} أعطى 100 كريدت لـ {success_count} مستخدم")
+        logger.info("الأدمن %s أعطى 100 كريدت لـ %s مستخدم", username, success_count)
 
     except Exception as e:
         await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
 
+# عدد المستخدمين في كل صفحة من صفحات /allusers
+USERS_PAGE_SIZE = 15
+
+# حقول ترتيب المستخدمين مع عناوينها
+USER_SORT_LABELS = {
+    'credits': '💰 الكريدت',
+    'total_purchases': '🛒 المشتريات',
+    'join_date': '📅 الانضمام',
+    'last_activity': '🕐 النشاط'
+}
+
+def format_user_entry(number, user_id, user_data):
+    """سطر عرض مستخدم واحد"""
+    credits = user_data.get('credits', 0)
+    username_user = user_data.get('username') or 'غير محدد'
+    first_name = user_data.get('first_name') or 'غير محدد'
+    total_purchases = user_data.get('total_purchases', 0)
+
+    return (
+        f"**{number}.** {first_name}\n"
+        f"   📱 @{username_user}\n"
+        f"   🆔 `{user_id}`\n"
+        f"   💰 {credits} كريدت | 🛒 {total_purchases} مشتريات\n\n"
+    )
+
+def build_users_page(sort_field, page):
+    """بناء صفحة من المستخدمين من الفهرس المرتب"""
+    total_users = bot_instance.user_db.get_user_count()
+    total_pages = max(1, math.ceil(total_users / USERS_PAGE_SIZE))
+    page = min(max(page, 1), total_pages)
+
+    message = f"👥 **مستخدمو البوت ({total_users} مستخدم)**\n"
+    message += f"📊 **الترتيب حسب:** {USER_SORT_LABELS[sort_field]} - الصفحة {page}/{total_pages}\n\n"
+
+    first_number = (page - 1) * USERS_PAGE_SIZE + 1
+    users_page = bot_instance.user_db.get_users_page(sort_field, page, USERS_PAGE_SIZE)
+    for number, (user_id, user_data) in enumerate(users_page, first_number):
+        message += format_user_entry(number, user_id, user_data)
+
+    # أزرار الترتيب
+    sort_buttons = [
+        InlineKeyboardButton(
+            ("✅ " if field == sort_field else "") + label,
+            callback_data=f"users:{field}:1"
+        )
+        for field, label in USER_SORT_LABELS.items()
+    ]
+
+    # أزرار التنقل بين الصفحات
+    navigation = []
+    if page > 1:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"users:{sort_field}:{page - 1}"))
+    navigation.append(InlineKeyboardButton(f"🔄 {page}/{total_pages}", callback_data=f"users:{sort_field}:{page}"))
+    if page < total_pages:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"users:{sort_field}:{page + 1}"))
+
+    return message, InlineKeyboardMarkup([sort_buttons[:2], sort_buttons[2:], navigation])
+
 async def show_all_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """أمر عرض جميع المستخدمين (للأدمن فقط)"""
+    """أمر تصفح المستخدمين صفحة بصفحة (للأدمن فقط)"""
     username = update.effective_user.username or ""
     user_id = update.effective_user.id
 
@@ -1454,47 +2085,41 @@ async def show_all_users_command(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     try:
-        all_users = bot_instance.user_db.get_all_users()
-
-        if not all_users:
+        if not bot_instance.user_db.get_user_count():
             await update.message.reply_text("❌ لا يوجد مستخدمين في قاعدة البيانات!")
             return
 
-        # إحصائيات سريعة
-        total_users = len(all_users)
-        total_credits = sum(user.get('credits', 0) for user in all_users.values())
-        users_with_credits = sum(1 for user in all_users.values() if user.get('credits', 0) > 0)
+        message, keyboard = build_users_page('credits', 1)
+        await update.message.reply_text(message, parse_mode='Markdown', reply_markup=keyboard)
+
+    except Exception as e:
+        await update.message.reply_text(f"❌ خطأ في عرض المستخدمين: {str(e)}")
 
-        message = f"👥 **جميع مستخدمي البوت ({total_users} مستخدم)**\n\n"
-        message += f"💰 **إجمالي الكريدت:** {total_credits}\n"
-        message += f"💳 **مستخدمين لديهم كريدت:** {users_with_credits}\n\n"
+async def users_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """التنقل بين صفحات المستخدمين وتغيير الترتيب عبر الأزرار"""
+    query = update.callback_query
 
-        # عرض تفاصيل كل مستخدم
-        for i, (user_id, user_data) in enumerate(all_users.items(), 1):
-            credits = user_data.get('credits', 0)
-            username_user = user_data.get('username', 'غير محدد')
-            first_name = user_data.get('first_name', 'غير محدد')
-            total_purchases = user_data.get('total_purchases', 0)
+    if not bot_instance.is_admin(query.from_user.username or "", query.from_user.id):
+        await query.answer("❌ هذا الأمر متاح للأدمن فقط!", show_alert=True)
+        return
 
-            message += f"**{i}.** {first_name}\n"
-            message += f"   📱 @{username_user}\n"
-            message += f"   🆔 `{user_id}`\n"
-            message += f"   💰 {credits} كريدت\n"
-            message += f"   🛒 {total_purchases} مشتريات\n\n"
+    await query.answer()
 
-            # تقسيم الرسالة إذا كانت طويلة
-            if len(message) > 3500:
-                await update.message.reply_text(message, parse_mode='Markdown')
-                message = ""
+    try:
+        _, sort_field, page = query.data.split(':')
+        if sort_field not in USER_SORT_LABELS:
+            return
 
-        if message:
-            await update.message.reply_text(message, parse_mode='Markdown')
+        message, keyboard = build_users_page(sort_field, int(page))
+        await query.edit_message_text(message, parse_mode='Markdown', reply_markup=keyboard)
 
     except Exception as e:
-        await update.message.reply_text(f"❌ خطأ في عرض المستخدمين: {str(e)}")
+        # تجاهل خطأ عدم تغيّر الرسالة عند الضغط على التحديث
+        if "not modified" not in str(e):
+            logger.error("خطأ في صفحة المستخدمين: %s", e)
 
-async def reset_all_users_credits_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """أمر تصفير كريدت جميع المستخدمين (للأدمن فقط)"""
+async def find_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر البحث عن مستخدم ببادئة الاسم أو اسم المستخدم (للأدمن فقط)"""
     username = update.effective_user.username or ""
     user_id = update.effective_user.id
 
@@ -1503,36 +2128,475 @@ async def reset_all_users_credits_command(update: Update, context: ContextTypes.
         await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
         return
 
-    try:
-        all_users = bot_instance.user_db.get_all_users()
+    args = update.message.text.split(maxsplit=1)
+    if len(args) != 2:
+        await update.message.reply_text(
+            "❌ **صيغة الأمر غير صحيحة!**\n\n"
+            "📝 **الاستخدام الصحيح:**\n"
+            "`/finduser [بداية الاسم أو @username]`\n\n"
+            "**مثال:**\n"
+            "`/finduser @ahm`",
+            parse_mode='Markdown'
+        )
+        return
 
-        if not all_users:
-            await update.message.reply_text("❌ لا يوجد مستخدمين في قاعدة البيانات!")
-            return
+    results = bot_instance.user_db.search_users(args[1].strip(), limit=USERS_PAGE_SIZE)
+    if not results:
+        await update.message.reply_text("❌ لم يتم العثور على مستخدمين بهذا الاسم")
+        return
 
-        # حساب المستخدمين الذين لديهم كريدت
-        users_with_credits = []
-        total_credits = 0
+    message = f"🔍 **نتائج البحث ({len(results)}):**\n\n"
+    for number, (found_user_id, user_data) in enumerate(results, 1):
+        message += format_user_entry(number, found_user_id, user_data)
 
-        for user_id, user_data in all_users.items():
-            credits = user_data.get('credits', 0)
-            if credits > 0:
-                users_with_credits.append({
-                    'user_id': user_id,
-                    'credits': credits,
-                    'name': user_data.get('first_name', 'غير محدد')
-                })
-                total_credits += credits
+    await update.message.reply_text(message, parse_mode='Markdown')
 
-        if not users_with_credits:
-            await update.message.reply_text("✅ جميع المستخدمين لديهم 0 كريدت بالفعل!")
-            return
+async def top_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر عرض أعلى المستخدمين حسب الكريدت أو المشتريات (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
 
-        # رسالة تأكيد
-        confirm_message = f"⚠️ **تأكيد تصفير الكريدت**\n\n"
-        confirm_message += f"👥 **عدد المستخدمين:** {len(users_with_credits)}\n"
-        confirm_message += f"💰 **إجمالي الكريدت:** {total_credits}\n\n"
-        confirm_message += "**المستخدمين الذين سيتم تصفيرهم:**\n"
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    try:
+        # /topusers [credits|total_purchases] [k]
+        args = update.message.text.split()
+        field = args[1] if len(args) > 1 else 'credits'
+        k = int(args[2]) if len(args) > 2 else 10
+
+        if field not in ('credits', 'total_purchases') or not 1 <= k <= 50:
+            await update.message.reply_text(
+                "❌ **صيغة الأمر غير صحيحة!**\n\n"
+                "📝 **الاستخدام الصحيح:**\n"
+                "`/topusers [credits|total_purchases] [1-50]`",
+                parse_mode='Markdown'
+            )
+            return
+
+        message = f"🏆 **أعلى {k} مستخدمين حسب {USER_SORT_LABELS[field]}:**\n\n"
+        for number, (top_user_id, user_data) in enumerate(bot_instance.user_db.top_users(field, k), 1):
+            message += format_user_entry(number, top_user_id, user_data)
+
+        await update.message.reply_text(message, parse_mode='Markdown')
+
+    except ValueError:
+        await update.message.reply_text("❌ يرجى إدخال أرقام صحيحة!")
+    except Exception as e:
+        await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
+
+# عدد المشتريات المعروضة في /history و /purchases
+HISTORY_LIMIT = 15
+
+def format_purchase(purchase):
+    """سطر واحد لعملية شراء من السجل"""
+    product = PRODUCTS[purchase['product']]['name']
+    purchased_at = purchase['purchased_at'] or 'قبل السجل'
+    line = f"#{purchase['id']} | {product} | `{purchase['email']}` | {purchased_at}"
+    if purchase['refunded_at']:
+        line += " | ↩️ مُسترد"
+    return line + "\n"
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر عرض آخر مشتريات المستخدم"""
+    user_id = update.effective_user.id
+
+    try:
+        purchases = await asyncio.to_thread(bot_instance.ledger.user_history, user_id, HISTORY_LIMIT)
+        if not purchases:
+            await update.message.reply_text("📭 لا توجد مشتريات مسجلة لك بعد.\n💡 استخدم /buy أو /email للشراء")
+            return
+
+        summary = await asyncio.to_thread(bot_instance.ledger.user_summary, user_id)
+        message = "🧾 **سجل مشترياتك:**\n\n"
+        for product, count in summary.items():
+            message += f"• {PRODUCTS[product]['name']}: {count}\n"
+        message += f"\n📋 **آخر {len(purchases)} عملية:**\n"
+        for purchase in purchases:
+            message += format_purchase(purchase)
+
+        await update.message.reply_text(message, parse_mode='Markdown')
+
+    except Exception as e:
+        logger.error("خطأ في عرض سجل المشتريات: %s", e)
+        await update.message.reply_text("❌ حدث خطأ في تحميل السجل. يرجى المحاولة لاحقاً.")
+
+async def purchases_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر عرض مشتريات مستخدم محدد (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    args = update.message.text.split()
+    if len(args) != 2:
+        await update.message.reply_text(
+            "❌ **صيغة الأمر غير صحيحة!**\n\n"
+            "📝 **الاستخدام الصحيح:**\n"
+            "`/purchases [user_id|@username]`",
+            parse_mode='Markdown'
+        )
+        return
+
+    try:
+        target_user_id = bot_instance.user_db.resolve_user_id(args[1])
+        if target_user_id is None:
+            await update.message.reply_text(f"❌ لم يتم العثور على المستخدم {args[1]}")
+            return
+
+        purchases = await asyncio.to_thread(bot_instance.ledger.user_history, target_user_id, HISTORY_LIMIT)
+        if not purchases:
+            await update.message.reply_text(f"📭 لا توجد مشتريات مسجلة للمستخدم `{target_user_id}`", parse_mode='Markdown')
+            return
+
+        message = f"🧾 **مشتريات المستخدم** `{target_user_id}` **(آخر {len(purchases)}):**\n\n"
+        for purchase in purchases:
+            message += format_purchase(purchase)
+        message += "\n💡 للاسترداد: `/refund [رقم العملية]`"
+        await update.message.reply_text(message, parse_mode='Markdown')
+
+    except ValueError:
+        await update.message.reply_text("❌ معرف المستخدم يجب أن يكون رقماً أو @username")
+    except Exception as e:
+        await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
+
+async def who_bought_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر معرفة مشتري حساب بالإيميل أو بصف الشيت (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    args = update.message.text.split()
+    if len(args) != 2:
+        await update.message.reply_text(
+            "❌ **صيغة الأمر غير صحيحة!**\n\n"
+            "📝 **الاستخدام الصحيح:**\n"
+            "`/whobought [email]`\n"
+            "`/whobought youtube:15` أو `/whobought chatgpt:15` (رقم الصف)",
+            parse_mode='Markdown'
+        )
+        return
+
+    try:
+        product, _, row = args[1].partition(':')
+        if product in PRODUCTS and row.isdigit():
+            purchases = await asyncio.to_thread(bot_instance.ledger.find_by_row, product, int(row))
+        else:
+            purchases = await asyncio.to_thread(bot_instance.ledger.find_by_email, args[1])
+
+        if not purchases:
+            await update.message.reply_text("📭 لا توجد عملية شراء مسجلة لهذا الحساب")
+            return
+
+        message = "🔎 **نتيجة البحث:**\n\n"
+        for purchase in purchases:
+            buyer = f"@{purchase['username']}" if purchase['username'] else "غير محدد"
+            message += format_purchase(purchase)
+            message += f"👤 المشتري: `{purchase['user_id']}` ({buyer}) | صف {purchase['row']}\n\n"
+        await update.message.reply_text(message, parse_mode='Markdown')
+
+    except Exception as e:
+        await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
+
+async def refund_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر استرداد كريدت عملية شراء (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    args = update.message.text.split()
+    if len(args) != 2 or not args[1].lstrip('#').isdigit():
+        await update.message.reply_text(
+            "❌ **صيغة الأمر غير صحيحة!**\n\n"
+            "📝 **الاستخدام الصحيح:**\n"
+            "`/refund [رقم العملية]`\n\n"
+            "💡 **رقم العملية من** `/purchases` **أو** `/whobought`",
+            parse_mode='Markdown'
+        )
+        return
+
+    try:
+        purchase_id = int(args[1].lstrip('#'))
+        purchase = await asyncio.to_thread(
+            bot_instance.ledger.mark_refunded, purchase_id, bot_instance.get_current_time()
+        )
+        if purchase is None:
+            existing = await asyncio.to_thread(bot_instance.ledger.get, purchase_id)
+            if existing is None:
+                await update.message.reply_text(f"❌ العملية #{purchase_id} غير موجودة")
+            else:
+                await update.message.reply_text(f"⚠️ العملية #{purchase_id} مستردة بالفعل ({existing['refunded_at']})")
+            return
+
+        if purchase['user_id'] is None:
+            await update.message.reply_text(f"⚠️ تم تعليم العملية #{purchase_id} كمستردة لكن المشتري غير معروف، لم يُضف كريدت")
+            return
+
+        new_balance = bot_instance.user_db.add_credits(purchase['user_id'], 1)
+        await update.message.reply_text(
+            f"↩️ **تم استرداد العملية #{purchase_id}**\n\n"
+            f"👤 **المستخدم:** `{purchase['user_id']}`\n"
+            f"📧 **الحساب:** `{purchase['email']}`\n"
+            f"💳 **الرصيد الجديد:** {new_balance} كريدت",
+            parse_mode='Markdown'
+        )
+        logger.info("الأدمن %s استرد العملية #%s للمستخدم %s", username, purchase_id, purchase['user_id'])
+
+        try:
+            await context.bot.send_message(
+                chat_id=purchase['user_id'],
+                text=f"↩️ **تم استرداد 1 كريدت** للحساب `{purchase['email']}`\n"
+                     f"💳 **رصيدك الحالي:** {new_balance} كريدت",
+                parse_mode='Markdown'
+            )
+        except Exception:
+            await update.message.reply_text("⚠️ لم يتم إرسال الإشعار للمستخدم")
+
+    except Exception as e:
+        await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
+
+def backfill_ledger():
+    """استيراد المشتريات القديمة من أعمدة الشيت A, C, D و F, H في كل الأوراق"""
+    imported = 0
+    for shard in range(bot_instance.shard_count()):
+        email_col, status_col, info_col = bot_instance.read_columns(1, 3, 4, fresh=True, shard=shard)
+        chatgpt_email_col, chatgpt_status_col = bot_instance.read_columns(6, 8, fresh=True, shard=shard)
+        imported += bot_instance.ledger.backfill(
+            (email_col, status_col, info_col),
+            (chatgpt_email_col, chatgpt_status_col),
+            resolve_username=bot_instance.user_db.get_user_id_by_username,
+            row_offset=shard_offset(shard)
+        )
+    return imported
+
+async def backfill_ledger_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر استيراد المشتريات القديمة من الشيت إلى السجل (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    if not bot_instance.sheet:
+        await update.message.reply_text("❌ خطأ في الاتصال بـ Google Sheets")
+        return
+
+    waiting_message = await update.message.reply_text("🔄 جاري استيراد المشتريات القديمة من الشيت...")
+    try:
+        imported = await asyncio.to_thread(backfill_ledger)
+        total = await asyncio.to_thread(bot_instance.ledger.count)
+        await waiting_message.edit_text(
+            f"✅ تم استيراد {imported} عملية شراء جديدة\n"
+            f"🧾 إجمالي العمليات في السجل: {total}"
+        )
+        logger.info("الأدمن %s استورد %s عملية شراء من الشيت", username, imported)
+    except Exception as e:
+        logger.error("خطأ في استيراد المشتريات: %s", e)
+        await waiting_message.edit_text(f"❌ حدث خطأ في الاستيراد: {str(e)}")
+
+# حد تنزيل الملفات في Bot API
+RESTOCK_MAX_FILE_SIZE = 20 * 1024 * 1024
+# أقل فترة بين تحديثات رسالة التقدم (حد تعديل الرسائل في تلقرام)
+RESTOCK_PROGRESS_INTERVAL = 2
+
+def restock_product_from(text):
+    """المنتج من نص الأمر (/restock youtube)، أو None"""
+    parts = (text or "").split()
+    if len(parts) >= 2 and parts[0].startswith("/restock") and parts[1].lower() in PRODUCTS:
+        return parts[1].lower()
+    return None
+
+async def restock_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر تجهيز إضافة حسابات من ملف (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    product = restock_product_from(update.message.text)
+    if product is None:
+        await update.message.reply_text(
+            "❌ **الاستخدام:** `/restock youtube` أو `/restock chatgpt`\n\n"
+            "ثم أرسل ملف TXT أو CSV فيه سطر لكل حساب:\n"
+            "`email:password` أو `email,password`\n\n"
+            "💡 يمكن أيضاً إرسال الملف مباشرة مع الأمر في وصف الملف",
+            parse_mode='Markdown'
+        )
+        return
+
+    context.user_data['restock_product'] = product
+    await update.message.reply_text(
+        f"📎 أرسل الآن ملف حسابات {PRODUCTS[product]['name']} (TXT أو CSV)\n"
+        f"سيتم تجاهل الحسابات الموجودة مسبقاً والأسطر غير الصالحة."
+    )
+
+async def restock_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """استلام ملف الحسابات من الأدمن وإضافته للشيت بدفعات مع عرض التقدم"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # الملفات من غير الأدمن أو بدون أمر /restock تُتجاهل
+    if not bot_instance.is_admin(username, user_id):
+        return
+    product = restock_product_from(update.message.caption) or context.user_data.pop('restock_product', None)
+    if product is None:
+        return
+
+    document = update.message.document
+    if document.file_size and document.file_size > RESTOCK_MAX_FILE_SIZE:
+        await update.message.reply_text("❌ حجم الملف أكبر من 20 ميجابايت، قسّمه إلى عدة ملفات.")
+        return
+    if not bot_instance.sheet:
+        await update.message.reply_text("❌ خطأ في الاتصال بـ Google Sheets")
+        return
+
+    progress_message = await update.message.reply_text("📥 جاري تنزيل الملف...")
+    restocker = Restocker(bot_instance, product, batch_size=int(os.getenv('RESTOCK_BATCH_SIZE', '5000')))
+    last_progress = time.monotonic()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            # التنزيل للقرص ثم القراءة سطراً بسطر بدلاً من تحميل الملف في الذاكرة
+            path = os.path.join(directory, "restock.txt")
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+            await asyncio.to_thread(restocker.prepare)
+
+            with open(path, encoding='utf-8-sig', errors='replace', newline='') as stream:
+                batches = restocker.batches(stream)
+                while True:
+                    batch = await asyncio.to_thread(next, batches, None)
+                    if batch is None:
+                        break
+                    await asyncio.to_thread(restocker.write, batch)
+
+                    if time.monotonic() - last_progress >= RESTOCK_PROGRESS_INTERVAL:
+                        last_progress = time.monotonic()
+                        try:
+                            await progress_message.edit_text(
+                                f"⏳ جاري الإضافة... تمت إضافة {restocker.added} حساب "
+                                f"(تمت قراءة {restocker.lines} سطر)"
+                            )
+                        except Exception as e:
+                            logger.error("خطأ في تحديث رسالة التقدم: %s", e)
+    except Exception as e:
+        logger.error("خطأ في إضافة الحسابات من الملف: %s", e)
+        await progress_message.edit_text(
+            f"❌ توقفت الإضافة بعد {restocker.added} حساب: {str(e)}\n"
+            f"💡 إعادة إرسال نفس الملف تضيف الباقي فقط (المكرر يُتجاهل)."
+        )
+        return
+    finally:
+        bot_instance.stats_cache.invalidate()
+
+    await progress_message.edit_text(
+        f"✅ **تمت إضافة حسابات {PRODUCTS[product]['name']}**\n\n"
+        f"📄 الأسطر المقروءة: {restocker.lines}\n"
+        f"➕ حسابات جديدة: {restocker.added}\n"
+        f"🔁 مكررة (موجودة مسبقاً): {restocker.duplicates}\n"
+        f"⚠️ أسطر غير صالحة: {restocker.invalid}",
+        parse_mode='Markdown'
+    )
+    logger.info("الأدمن %s أضاف %s حساب %s من ملف", username, restocker.added, product)
+
+DUPLICATES_LIMIT = 30
+
+async def duplicates_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر عرض الإيميلات المكررة في الشيت عبر كل المنتجات (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    if not bot_instance.sheet:
+        await update.message.reply_text("❌ خطأ في الاتصال بـ Google Sheets")
+        return
+
+    waiting_message = await update.message.reply_text("🔍 جاري فحص الإيميلات المكررة...")
+    try:
+        await asyncio.to_thread(bot_instance.refresh_credential_index)
+        collisions = bot_instance.credentials.collisions()
+    except Exception as e:
+        logger.error("خطأ في فحص الإيميلات المكررة: %s", e)
+        await waiting_message.edit_text(f"❌ حدث خطأ في الفحص: {str(e)}")
+        return
+
+    if not collisions:
+        await waiting_message.edit_text(
+            f"✅ لا توجد إيميلات مكررة\n📧 تم فحص {len(bot_instance.credentials)} إيميل"
+        )
+        return
+
+    message = f"⚠️ **إيميلات مكررة: {len(collisions)}**\n\n"
+    for email, locations in sorted(collisions.items())[:DUPLICATES_LIMIT]:
+        places = "، ".join(f"{PRODUCTS[product]['name']} صف {row}" for product, row in locations)
+        message += f"• `{email}`\n  {places}\n"
+    if len(collisions) > DUPLICATES_LIMIT:
+        message += f"\n... و {len(collisions) - DUPLICATES_LIMIT} إيميل آخر"
+    message += "\n💡 النسخ المكررة لا تُباع مرتين: الصف الثاني يُتخطى بعد بيع الأول."
+    await waiting_message.edit_text(message, parse_mode='Markdown')
+
+async def reset_all_users_credits_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر تصفير كريدت جميع المستخدمين (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    try:
+        all_users = bot_instance.user_db.get_all_users()
+
+        if not all_users:
+            await update.message.reply_text("❌ لا يوجد مستخدمين في قاعدة البيانات!")
+            return
+
+        # حساب المستخدمين الذين لديهم كريدت
+        users_with_credits = []
+        total_credits = 0
+
+        for user_id, user_data in all_users.items():
+            credits = user_data.get('credits', 0)
+            if credits > 0:
+                users_with_credits.append({
+                    'user_id': user_id,
+                    'credits': credits,
+                    'name': user_data.get('first_name', 'غير محدد')
+                })
+                total_credits += credits
+
+        if not users_with_credits:
+            await update.message.reply_text("✅ جميع المستخدمين لديهم 0 كريدت بالفعل!")
+            return
+
+        # رسالة تأكيد
+        confirm_message = f"⚠️ **تأكيد تصفير الكريدت**\n\n"
+        confirm_message += f"👥 **عدد المستخدمين:** {len(users_with_credits)}\n"
+        confirm_message += f"💰 **إجمالي الكريدت:** {total_credits}\n\n"
+        confirm_message += "**المستخدمين الذين سيتم تصفيرهم:**\n"
 
         for user in users_with_credits[:10]:  # عرض أول 10 فقط
             confirm_message += f"• {user['name']}: {user['credits']} كريدت\n"
@@ -1602,7 +2666,7 @@ async def reset_user_credits_command(update: Update, context: ContextTypes.DEFAU
             await update.message.reply_text(
                 "❌ **صيغة الأمر غير صحيحة!**\n\n"
                 "📝 **الاستخدام الصحيح:**\n"
-                "`/resetuser [user_id]`\n\n"
+                "`/resetuser [user_id|@username]`\n\n"
                 "**مثال:**\n"
                 "`/resetuser 123456789`\n\n"
                 "💡 **سيتم تصفير كريدت المستخدم إلى 0**",
@@ -1610,7 +2674,11 @@ async def reset_user_credits_command(update: Update, context: ContextTypes.DEFAU
             )
             return
 
-        target_user_id = int(args[1])
+        target_user_id = bot_instance.user_db.resolve_user_id(args[1])
+
+        if target_user_id is None:
+            await update.message.reply_text(f"❌ لم يتم العثور على المستخدم {args[1]}")
+            return
 
         # التحقق من وجود المستخدم
         all_users = bot_instance.user_db.get_all_users()
@@ -1670,13 +2738,102 @@ async def reset_user_credits_command(update: Update, context: ContextTypes.DEFAU
         except Exception:
             await update.message.reply_text("⚠️ تم تصفير الكريدت ولكن لم يتم إرسال الإشعار للمستخدم")
 
-        logger.info(f"الأدمن {username} صفر كريدت المستخدم {target_user_id} من {old_credits} إلى 0")
+        logger.info("الأدمن %s صفر كريدت المستخدم %s من %s إلى 0", username, target_user_id, old_credits)
 
     except ValueError:
         await update.message.reply_text("❌ يرجى إدخال معرف مستخدم صحيح!")
     except Exception as e:
         await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
 
+async def ban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر حظر مستخدم (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    args = update.message.text.split()
+    if len(args) != 2:
+        await update.message.reply_text(
+            "❌ **صيغة الأمر غير صحيحة!**\n\n"
+            "📝 **الاستخدام الصحيح:**\n"
+            "`/ban [user_id|@username]`\n\n"
+            "**مثال:**\n"
+            "`/ban 123456789`",
+            parse_mode='Markdown'
+        )
+        return
+
+    try:
+        target_user_id = bot_instance.user_db.resolve_user_id(args[1])
+    except ValueError:
+        await update.message.reply_text("❌ معرف المستخدم يجب أن يكون رقماً أو @username")
+        return
+
+    if target_user_id is None:
+        await update.message.reply_text(f"❌ لم يتم العثور على المستخدم {args[1]}")
+        return
+
+    if target_user_id in bot_instance.admin_ids:
+        await update.message.reply_text("❌ لا يمكن حظر الأدمن!")
+        return
+
+    if bot_instance.user_db.is_banned(target_user_id):
+        await update.message.reply_text(f"✅ المستخدم `{target_user_id}` محظور بالفعل", parse_mode='Markdown')
+        return
+
+    bot_instance.user_db.ban_user(target_user_id)
+    await update.message.reply_text(
+        f"🚫 **تم حظر المستخدم بنجاح!**\n\n"
+        f"🆔 **معرف المستخدم:** `{target_user_id}`\n"
+        f"💡 **لإلغاء الحظر:** `/unban {target_user_id}`",
+        parse_mode='Markdown'
+    )
+    logger.info("الأدمن %s حظر المستخدم %s", username, target_user_id)
+
+async def unban_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر إلغاء حظر مستخدم (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    args = update.message.text.split()
+    if len(args) != 2:
+        await update.message.reply_text(
+            "❌ **صيغة الأمر غير صحيحة!**\n\n"
+            "📝 **الاستخدام الصحيح:**\n"
+            "`/unban [user_id|@username]`\n\n"
+            "**مثال:**\n"
+            "`/unban 123456789`",
+            parse_mode='Markdown'
+        )
+        return
+
+    try:
+        target_user_id = bot_instance.user_db.resolve_user_id(args[1])
+    except ValueError:
+        await update.message.reply_text("❌ معرف المستخدم يجب أن يكون رقماً أو @username")
+        return
+
+    if target_user_id is None or not bot_instance.user_db.is_banned(target_user_id):
+        await update.message.reply_text(f"✅ المستخدم {args[1]} غير محظور")
+        return
+
+    bot_instance.user_db.unban_user(target_user_id)
+    await update.message.reply_text(
+        f"✅ **تم إلغاء حظر المستخدم!**\n\n"
+        f"🆔 **معرف المستخدم:** `{target_user_id}`",
+        parse_mode='Markdown'
+    )
+    logger.info("الأدمن %s ألغى حظر المستخدم %s", username, target_user_id)
+
 async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """أمر إحصائيات الأدمن"""
     username = update.effective_user.username or ""
@@ -1716,9 +2873,438 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     except Exception as e:
         await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
 
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر عرض مقاييس الأداء (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    message = "📈 **مقاييس الأداء**\n\n⚙️ **الأوامر:**\n"
+    handlers = sorted(metrics.histogram_items("handler_seconds"), key=lambda item: -item[1].sum)
+    for labels, histogram in handlers:
+        errors = metrics.counter_value("handler_errors_total", handler=labels['handler'])
+        message += (
+            f"• `/{labels['handler']}`: {histogram.count} مرة | "
+            f"متوسط {histogram.sum / histogram.count * 1000:.0f}ms | "
+            f"p50 ≤ {histogram.quantile(0.5) * 1000:.0f}ms | "
+            f"p99 ≤ {histogram.quantile(0.99) * 1000:.0f}ms | "
+            f"أخطاء {errors}\n"
+        )
+
+    message += "\n📊 **استدعاءات Google Sheets:**\n"
+    sheets_calls = sorted(metrics.histogram_items("sheets_call_seconds"), key=lambda item: -item[1].sum)
+    for labels, histogram in sheets_calls:
+        errors = metrics.counter_value("sheets_call_errors_total", method=labels['method'])
+        message += (
+            f"• `{labels['method']}`: {histogram.count} مرة | "
+            f"إجمالي {histogram.sum:.1f}s | "
+            f"p99 ≤ {histogram.quantile(0.99) * 1000:.0f}ms | "
+            f"أخطاء {errors}\n"
+        )
+
+    message += "\n💾 **قاعدة البيانات:**\n"
+    for _, histogram in metrics.histogram_items("db_save_seconds"):
+        message += (
+            f"• الحفظ: {histogram.count} مرة | "
+            f"متوسط {histogram.sum / histogram.count * 1000:.1f}ms | "
+            f"البايتات المكتوبة: {metrics.counter_value('db_bytes_written_total')}\n"
+        )
+
+    # تقسيم الرسالة إذا كانت طويلة
+    for start in range(0, len(message), MESSAGE_LIMIT):
+        await update.message.reply_text(message[start:start + MESSAGE_LIMIT], parse_mode='Markdown')
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """أمر تحليل الأداء لعدد من التحديثات أو لمدة محددة (للأدمن فقط)"""
+    username = update.effective_user.username or ""
+    user_id = update.effective_user.id
+
+    # التحقق من صلاحيات الأدمن
+    if not bot_instance.is_admin(username, user_id):
+        await update.message.reply_text("❌ هذا الأمر متاح للأدمن فقط!")
+        return
+
+    args = update.message.text.split()
+    chat_id = update.effective_chat.id
+
+    if len(args) > 1 and args[1] == "stop":
+        if not profiler.active:
+            await update.message.reply_text("ℹ️ لا يوجد تحليل يعمل حالياً")
+            return
+        await profiler.finish()
+        return
+
+    try:
+        # /profile 50 -> 50 تحديث، /profile 30s -> 30 ثانية
+        updates, seconds = 100, None
+        if len(args) > 1:
+            if args[1].endswith("s"):
+                updates, seconds = None, min(int(args[1][:-1]), 600)
+            else:
+                updates = min(int(args[1]), 10000)
+    except ValueError:
+        await update.message.reply_text(
+            "❌ **صيغة الأمر غير صحيحة!**\n\n"
+            "📝 **الاستخدام الصحيح:**\n"
+            "`/profile [عدد التحديثات]` أو `/profile [ثواني]s` أو `/profile stop`\n\n"
+            "**مثال:**\n"
+            "`/profile 50` أو `/profile 30s`",
+            parse_mode='Markdown'
+        )
+        return
+
+    async def send_report(report, profile_bytes):
+        for start in range(0, len(report), MESSAGE_LIMIT):
+            await context.bot.send_message(chat_id=chat_id, text=report[start:start + MESSAGE_LIMIT], parse_mode='Markdown')
+        await context.bot.send_document(
+            chat_id=chat_id,
+            document=io.BytesIO(profile_bytes),
+            filename=f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof",
+            caption="📎 ملف التحليل الكامل (افتحه بـ pstats أو snakeviz)"
+        )
+
+    if not profiler.start(send_report, updates=updates, seconds=seconds):
+        await update.message.reply_text("⚠️ يوجد تحليل يعمل بالفعل. استخدم `/profile stop` لإيقافه", parse_mode='Markdown')
+        return
+
+    window = f"{seconds} ثانية" if seconds else f"{updates} تحديث"
+    await update.message.reply_text(f"🔬 **بدأ التحليل لمدة {window}**\nسيصلك التقرير عند الانتهاء.", parse_mode='Markdown')
+
+async def drop_duplicate_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تجاهل التحديثات المعاد إرسالها قبل أي وصول لقاعدة البيانات أو الشيت"""
+    # حفظ المفاتيح في SQLite كتابة على القرص لذلك تتم خارج حلقة الأحداث
+    if await asyncio.to_thread(bot_instance.dedupe.is_duplicate, update_keys(update)):
+        metrics.inc("duplicate_updates_total")
+        logger.warning("🔁 تم تجاهل تحديث مكرر %s", update.update_id)
+        raise ApplicationHandlerStop
+
+async def drop_banned_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تجاهل تحديثات المستخدمين المحظورين قبل أي كتابة في قاعدة البيانات أو قراءة من الشيت"""
+    user = update.effective_user
+    if user is not None and user.id in bot_instance.user_db.banned_ids:
+        metrics.inc("banned_updates_total")
+        raise ApplicationHandlerStop
+
+async def throttle_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """رفض الأوامر المتكررة بسرعة قبل وصولها لمعالجاتها (وقبل أي قراءة من الشيت)"""
+    user = update.effective_user
+    command = command_name(update)
+    if user is None or command is None or not bot_instance.throttle.enabled:
+        return
+    if bot_instance.is_admin(user.username or "", user.id):
+        return
+
+    allowed, retry_after, notify = bot_instance.throttle.check(user.id, command)
+    if allowed:
+        return
+
+    metrics.inc("throttled_total", command=command)
+    if notify:
+        warning = f"⏳ طلبات كثيرة! يرجى الانتظار {math.ceil(retry_after)} ثانية قبل تكرار الأمر."
+        if update.callback_query is not None:
+            await update.callback_query.answer(warning, show_alert=True)
+        elif update.effective_message is not None:
+            await update.effective_message.reply_text(warning)
+    elif update.callback_query is not None:
+        await update.callback_query.answer()
+
+    # إيقاف معالجة التحديث في المجموعات التالية
+    raise ApplicationHandlerStop
+
+def add_command(application, command, callback):
+    """تسجيل أمر مع قياس زمنه وعدد مرات استدعائه"""
+    application.add_handler(CommandHandler(command, instrument_handler(command, profiler.wrap(callback))))
+
+def add_numbered_command(application, command, callback):
+    """تسجيل أمر مع عدد ملتصق به (مثل /buy5 أو /buy5@BotName في المجموعات) لأن CommandHandler لا يطابقه"""
+    pattern = re.compile(rf"^/{command}\d+(?:@(\w+))?$")
+
+    async def numbered_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        mention = pattern.match(update.message.text.strip()).group(1)
+        if mention and mention.lower() != (context.bot.username or '').lower():
+            # أمر موجه لبوت آخر في نفس المجموعة
+            return
+        await callback(update, context)
+
+    application.add_handler(MessageHandler(
+        filters.Regex(pattern),
+        instrument_handler(f"{command}N", profiler.wrap(numbered_command))
+    ))
+
+def register_handlers(application):
+    """إضافة معالجات الأوامر"""
+    # حظر المستخدمين (فحص في الذاكرة) ثم التحديثات المكررة ثم حد معدل الأوامر في مجموعات تسبق معالجات الأوامر
+    # حتى لا تُكتب تحديثات المحظورين في ملف التكرار
+    application.add_handler(TypeHandler(Update, drop_banned_updates), group=-3)
+    application.add_handler(TypeHandler(Update, drop_duplicate_updates), group=-2)
+    application.add_handler(TypeHandler(Update, throttle_update), group=-1)
+
+    add_command(application, "start", start)
+    add_command(application, "help", help_command)
+    add_command(application, "buy", buy_account)
+    add_command(application, "email", buy_email)
+    add_numbered_command(application, "buy", buy_account)
+    add_numbered_command(application, "email", buy_email)
+    add_command(application, "credits", credits_command)
+    add_command(application, "contact", contact_command)
+    add_command(application, "admin", admin_command)
+    add_command(application, "debug", debug_command)
+    add_command(application, "debugall", debug_all_command)
+    add_command(application, "stats", stats_command)
+    application.add_handler(CallbackQueryHandler(instrument_handler("debug_page", profiler.wrap(debug_page_callback)), pattern=r"^debug:"))
+
+    # أوامر الأدمن
+    add_command(application, "addcredits", add_credits_command)
+    add_command(application, "give100", give_100_credits_command)
+    add_command(application, "giveall100", give_all_100_credits_command)
+    add_command(application, "giveall100confirm", give_all_100_credits_confirm_command)
+    add_command(application, "broadcast", broadcast_command)
+    add_command(application, "adminstats", admin_stats_command)
+    add_command(application, "allusers", show_all_users_command)
+    application.add_handler(CallbackQueryHandler(instrument_handler("users_page", profiler.wrap(users_page_callback)), pattern=r"^users:"))
+    add_command(application, "finduser", find_user_command)
+    add_command(application, "topusers", top_users_command)
+    add_command(application, "resetall", reset_all_users_credits_command)
+    add_command(application, "resetallconfirm", reset_all_users_credits_confirm_command)
+    add_command(application, "resetuser", reset_user_credits_command)
+    add_command(application, "ban", ban_user_command)
+    add_command(application, "unban", unban_user_command)
+    add_command(application, "history", history_command)
+    add_command(application, "purchases", purchases_command)
+    add_command(application, "whobought", who_bought_command)
+    add_command(application, "refund", refund_command)
+    add_command(application, "backfillledger", backfill_ledger_command)
+    add_command(application, "restock", restock_command)
+    add_command(application, "duplicates", duplicates_command)
+    application.add_handler(MessageHandler(filters.Document.ALL, instrument_handler("restock_document", profiler.wrap(restock_document))))
+    add_command(application, "metrics", metrics_command)
+    add_command(application, "profile", profile_command)
+
+def build_application(updater=True):
+    """إنشاء تطبيق تلقرام بمعالجات البوت ومهام الخلفية"""
+    builder = Application.builder().token(bot_instance.bot_token)
+    if bot_instance.telegram_api_url:
+        api_url = bot_instance.telegram_api_url.rstrip('/')
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+        logger.info("🔧 استخدام خادم Bot API: %s", api_url)
+    if not updater:
+        # العمليات العاملة تأخذ التحديثات من الطابور المشترك وليس من getUpdates
+        builder = builder.updater(None)
+    application = builder.build()
+
+    register_handlers(application)
+
+    # استعادة عمليات الشراء التي قطعها آخر توقف قبل أي تعبئة للمخزون
+    application.job_queue.run_once(recover_unfinished_purchases, when=0, name="purchase_recovery")
+
+    application.job_queue.run_repeating(
+        rebuild_credential_index,
+        interval=int(os.getenv('CREDENTIAL_INDEX_INTERVAL', '600')),
+        first=0,
+        name="credential_index"
+    )
+
+    # النسخة تُحفظ بعد التشغيل البارد ثم كلما تغير الشيت (التشغيل الدافئ يتحقق منها بعد الاتصال)
+    # عند التشغيل بعدة عمليات يحفظها القائد فقط وتقرأ منها العمليات الأخرى
+    snapshot_interval = int(os.getenv('INVENTORY_SNAPSHOT_INTERVAL', '300'))
+    run_singleton_repeating(
+        application,
+        save_inventory_snapshot,
+        interval=snapshot_interval,
+        # القائد يتحقق من النسخة المشتركة مبكراً لأن العمليات الأخرى لا تنزل الأعمدة
+        first=snapshot_interval if bot_instance.snapshot.warm and bot_instance.leader is None else 10,
+        name="inventory_snapshot"
+    )
+
+    # تعبئة مخزون الحسابات المحجوزة في الخلفية
+    if bot_instance.account_pool.enabled:
+        application.job_queue.run_repeating(
+            refill_account_pool,
+            interval=bot_instance.account_pool.refill_interval,
+            first=1,
+            name="account_pool_refill"
+        )
+
+    return application
+
+def run_singleton_repeating(application, callback, interval, name, first=None):
+    """مهمة دورية تعمل في عملية واحدة فقط (القائد) عند التشغيل بعدة عمليات"""
+
+    async def singleton_job(context: ContextTypes.DEFAULT_TYPE):
+        if bot_instance.leader is None or bot_instance.leader.is_leader:
+            await callback(context)
+
+    application.job_queue.run_repeating(singleton_job, interval=interval, first=first, name=name)
+
+async def leader_heartbeat(context: ContextTypes.DEFAULT_TYPE):
+    """تجديد القيادة أو أخذها إذا توقف القائد السابق"""
+    leader = bot_instance.leader
+    was_leader = leader.is_leader
+    try:
+        is_leader = await asyncio.to_thread(leader.try_acquire)
+    except Exception as e:
+        logger.error("خطأ في تجديد القيادة: %s", e)
+        return
+    if is_leader != was_leader:
+        logger.info("👑 %s %s", leader.owner, 'أصبح القائد' if is_leader else 'لم يعد القائد')
+
+async def compact_shared_store(context: ContextTypes.DEFAULT_TYPE):
+    """حذف حجوزات الصفوف المنتهية وضغط ملف التخزين المشترك (مهمة القائد فقط)"""
+    deleted = await asyncio.to_thread(bot_instance.leases.compact)
+    if deleted:
+        logger.info("🧹 تم حذف %s حجز منتهي من التخزين المشترك", deleted)
+
+async def sync_shared_store(context: ContextTypes.DEFAULT_TYPE):
+    """جلب تعديلات المستخدمين (الكريدت والحظر) التي قامت بها العمليات الأخرى"""
+    bot_instance.user_db.sync()
+
+async def consume_updates(application, update_queue, partition, poll_interval=0.05):
+    """معالجة تحديثات قسم هذه العملية من الطابور المشترك بالترتيب"""
+    while True:
+        batch = await asyncio.to_thread(update_queue.claim, partition)
+        if not batch:
+            await asyncio.sleep(poll_interval)
+            continue
+        for data in batch:
+            await application.process_update(Update.de_json(data, application.bot))
+
+def run_worker(index, workers, store_file):
+    """عملية عاملة: تعالج تحديثات مستخدمي قسمها بتخزين مشترك وحجز للصفوف"""
+    global bot_instance
+    # القائد يُنشأ قبل البوت: التحقق من النسخة المحلية في الخلفية يعرف أنه يعمل بعدة عمليات
+    leader_ttl = float(os.getenv('LEADER_TTL', '15'))
+    leader = LeaderElection(store_file, owner=f"worker-{index}-{os.getpid()}", ttl=leader_ttl)
+    bot_instance = TelegramAccountBot(
+        user_db=SharedUserDatabase(store_file),
+        pool_file=f"account_pool_{index}.json",
+        journal_file=f"purchase_journal_{index}.sqlite3",
+        dedupe_file=f"update_dedupe_{index}.sqlite3",
+        leader=leader
+    )
+    bot_instance.account_pool.pool_files = [f"account_pool_{worker}.json" for worker in range(workers)]
+    bot_instance.leases = RowLeases(
+        store_file,
+        owner=f"worker-{index}",
+        ttl=int(os.getenv('ROW_LEASE_TTL', '600'))
+    )
+
+    application = build_application(updater=False)
+    # العمليات غير القائدة تخدم الإحصائيات من نسخة القائد المحملة في الذاكرة
+    application.job_queue.run_repeating(
+        reload_inventory_snapshot,
+        interval=float(os.getenv('INVENTORY_SNAPSHOT_RELOAD_INTERVAL', '30')),
+        first=0,
+        name="inventory_snapshot_reload"
+    )
+    application.job_queue.run_repeating(
+        sync_shared_store,
+        interval=float(os.getenv('SHARED_STORE_SYNC_INTERVAL', '2')),
+        first=1,
+        name="shared_store_sync"
+    )
+
+    # التجديد كل ثلث المدة: إذا توقف القائد تنتقل القيادة خلال مدة واحدة على الأكثر
+    application.job_queue.run_repeating(leader_heartbeat, interval=leader_ttl / 3, first=0, name="leader_heartbeat")
+    run_singleton_repeating(
+        application,
+        compact_shared_store,
+        interval=int(os.getenv('SHARED_STORE_COMPACT_INTERVAL', '300')),
+        first=60,
+        name="shared_store_compact"
+    )
+
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        start_metrics_server(int(metrics_port) + index)
+
+    update_queue = UpdateQueue(store_file, workers)
+
+    async def serve():
+        async with application:
+            await application.start()
+            try:
+                await consume_updates(application, update_queue, index)
+            finally:
+                await application.stop()
+                # التنازل عن القيادة فوراً بدلاً من انتظار انتهاء صلاحيتها
+                await asyncio.to_thread(bot_instance.leader.release)
+
+    logger.info("🧵 العملية %s/%s تعمل", index + 1, workers)
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+async def receive_updates(bot_token, api_url, update_queue):
+    """استقبال التحديثات من تلقرام ووضعها في الطابور المشترك (عملية واحدة فقط تستدعي getUpdates)"""
+    if api_url:
+        bot = Bot(bot_token, base_url=f"{api_url.rstrip('/')}/bot")
+    else:
+        bot = Bot(bot_token)
+
+    async with bot:
+        await bot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+            except TelegramError as e:
+                logger.error("خطأ في استقبال التحديثات: %s", e)
+                await asyncio.sleep(1)
+                continue
+
+            if updates:
+                # الحفظ في الطابور قبل تأكيد الاستلام لتلقرام (offset) حتى لا يضيع أي تحديث
+                await asyncio.to_thread(update_queue.enqueue, [update.to_dict() for update in updates])
+                offset = updates[-1].update_id + 1
+
+def run_multi_process(workers):
+    """تشغيل عدة عمليات عاملة على نفس الجهاز مع عملية استقبال واحدة"""
+    bot_token = os.getenv('BOT_TOKEN') or os.getenv('TELEGRAM_BOT_TOKEN')
+    if not bot_token:
+        logger.error("لم يتم العثور على رمز البوت. تأكد من ملف .env")
+        return
+
+    store_file = os.getenv('SHARED_STORE_FILE', 'bot_store.sqlite3')
+    # إنشاء الجداول واستيراد users.json مرة واحدة قبل تشغيل العمليات
+    SharedUserDatabase(store_file)
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(index, workers, store_file), name=f"bot-worker-{index}", daemon=True)
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    print(f"🤖 البوت يعمل الآن بـ {workers} عمليات...")
+    print("⏹️ اضغط Ctrl+C لإيقاف البوت")
+
+    try:
+        asyncio.run(receive_updates(bot_token, os.getenv('TELEGRAM_API_URL'), UpdateQueue(store_file, workers)))
+    except KeyboardInterrupt:
+        logger.info("تم إيقاف البوت بواسطة المستخدم")
+        print("\n👋 تم إيقاف البوت بنجاح")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+
 def main():
     """تشغيل البوت"""
     global bot_instance
+
+    # عدة عمليات تتشارك المستخدمين والمخزون عبر SQLite (BOT_WORKERS > 1)
+    workers = int(os.getenv('BOT_WORKERS', '1'))
+    if workers > 1:
+        run_multi_process(workers)
+        return
+
     bot_instance = TelegramAccountBot()
 
     if not bot_instance.bot_token:
@@ -1726,31 +3312,26 @@ def main():
         return
 
     # إنشاء التطبيق
-    application = Application.builder().token(bot_instance.bot_token).build()
-
-    # إضافة معالجات الأوامر
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("buy", buy_account))
-    application.add_handler(CommandHandler("email", buy_email))
-    application.add_handler(CommandHandler("credits", credits_command))
-    application.add_handler(CommandHandler("contact", contact_command))
-    application.add_handler(CommandHandler("admin", admin_command))
-    application.add_handler(CommandHandler("debug", debug_command))
-    application.add_handler(CommandHandler("debugall", debug_all_command))
-    application.add_handler(CommandHandler("stats", stats_command))
+    application = build_application()
+
+    # تسجيل التحديثات الواردة بعد إخفاء الهوية لإعادة تشغيلها لاحقاً (اختياري)
+    recorder = None
+    record_file = os.getenv('TRAFFIC_RECORD_FILE')
+    if record_file:
+        recorder = TrafficRecorder(
+            record_file,
+            salt=os.getenv('TRAFFIC_RECORD_SALT'),
+            preserve_ids=bot_instance.admin_ids,
+            preserve_usernames=[bot_instance.admin_username]
+        )
+        # مجموعة سابقة لكل المعالجات حتى يُسجل التحديث قبل معالجته
+        application.add_handler(TypeHandler(Update, recorder.handle_update), group=-100)
+        logger.info("📼 تسجيل التحديثات في: %s", record_file)
 
-    # أوامر الأدمن
-    application.add_handler(CommandHandler("addcredits", add_credits_command))
-    application.add_handler(CommandHandler("give100", give_100_credits_command))
-    application.add_handler(CommandHandler("giveall100", give_all_100_credits_command))
-    application.add_handler(CommandHandler("giveall100confirm", give_all_100_credits_confirm_command))
-    application.add_handler(CommandHandler("broadcast", broadcast_command))
-    application.add_handler(CommandHandler("adminstats", admin_stats_command))
-    application.add_handler(CommandHandler("allusers", show_all_users_command))
-    application.add_handler(CommandHandler("resetall", reset_all_users_credits_command))
-    application.add_handler(CommandHandler("resetallconfirm", reset_all_users_credits_confirm_command))
-    application.add_handler(CommandHandler("resetuser", reset_user_credits_command))
+    # خادم مقاييس Prometheus (اختياري)
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
 
     # تشغيل البوت
     logger.info("تم تشغيل البوت...")
@@ -1763,6 +3344,9 @@ def main():
     except KeyboardInterrupt:
         logger.info("تم إيقاف البوت بواسطة المستخدم")
         print("\n👋 تم إيقاف البوت بنجاح")
+    finally:
+        if recorder:
+            recorder.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+import time
+
+# تكلفة كل أمر بالرموز حسب عدد قراءات/كتابات Sheets التي يسببها
+COMMAND_COSTS = {
+    "debug": 5,      # إحصائيات كاملة + قراءة نطاق
+    "debugall": 5,
+    "stats": 4,      # قراءة 6 أعمدة كاملة
+    "buy": 3,        # قراءة أعمدة + كتابة
+    "email": 3,
+    "debug_page": 3,  # أزرار التنقل في التشخيص
+}
+DEFAULT_COST = 1
+
+_COMMAND_RE = re.compile(r"^/(\w+?)\d*(?:@\w+)?(?:\s|$)")
+
+
+def command_name(update):
+    """اسم الأمر من نص الرسالة (/buy5 -> buy) أو من بيانات الزر، أو None"""
+    message = update.effective_message
+    if update.callback_query is not None:
+        data = update.callback_query.data or ""
+        return f"{data.split(':', 1)[0]}_page"
+    if message is not None and message.text:
+        match = _COMMAND_RE.match(message.text)
+        if match:
+            return match.group(1).lower()
+    return None
+
+
+class UserThrottle:
+    """دلو رموز لكل (مستخدم، أمر) بتكلفة مختلفة لكل أمر"""
+
+    def __init__(self, rate=0.5, burst=10, costs=None, max_buckets=50000):
+        self.rate = rate
+        self.burst = burst
+        self.costs = costs or COMMAND_COSTS
+        self.max_buckets = max_buckets
+
+        self._buckets = {}  # (user_id, command) -> [tokens, updated, notified]
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def cost(self, command):
+        return self.costs.get(command, DEFAULT_COST)
+
+    def check(self, user_id, command):
+        """استهلاك تكلفة الأمر؛ يرجع (مسموح، ثواني الانتظار، هل يجب إبلاغ المستخدم)"""
+        cost = min(self.cost(command), self.burst)
+        now = time.monotonic()
+        key = (user_id, command)
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._prune(now)
+                bucket = self._buckets[key] = [self.burst, now, False]
+
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                bucket[2] = False
+                return True, 0, False
+
+            self.rejected += 1
+            # رسالة تحذير واحدة فقط لكل فترة حظر، والباقي يُتجاهل بصمت
+            notify = not bucket[2]
+            bucket[2] = True
+            return False, (cost - bucket[0]) / self.rate, notify
+
+    def _prune(self, now):
+        """حذف الدلاء الممتلئة (مستخدمون غير نشطين)"""
+        full_after = self.burst / self.rate
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < full_after
+        }
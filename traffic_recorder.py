@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# مفاتيح تحتوي بيانات شخصية تُحذف أو تُستبدل
+_NAME_KEYS = ("first_name", "last_name")
+_DROP_KEYS = ("phone_number", "bio", "photo", "contact", "location")
+_FILE_KEYS = ("file_id", "file_unique_id")
+
+_MENTION_RE = re.compile(r"(?<![\w.])@(\w{3,})")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_LONG_NUMBER_RE = re.compile(r"\b\d{5,}\b")
+
+
+class TrafficRecorder:
+    """تسجيل التحديثات الواردة بعد إخفاء هوية المستخدمين في ملف JSONL يُضاف إليه فقط"""
+
+    def __init__(self, path, salt=None, preserve_ids=(), preserve_usernames=(), flush_every=50):
+        self.path = path
+        self.salt = (salt or os.urandom(16).hex()).encode("utf-8")
+        # معرفات الأدمن تبقى كما هي حتى تعمل أوامر الأدمن عند إعادة التشغيل
+        self.preserve_ids = {int(user_id) for user_id in preserve_ids}
+        self.preserve_usernames = {name for name in preserve_usernames if name}
+        self.flush_every = flush_every
+
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    # ===== إخفاء الهوية =====
+
+    def _digest(self, value):
+        return hmac.new(self.salt, str(value).encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def pseudonym_id(self, user_id):
+        """معرف رقمي ثابت لنفس المستخدم داخل التسجيل"""
+        user_id = int(user_id)
+        if user_id in self.preserve_ids:
+            return user_id
+        sign = -1 if user_id < 0 else 1
+        return sign * (10 ** 9 + int(self._digest(user_id)[:12], 16) % 10 ** 9)
+
+    def pseudonym_username(self, username):
+        if username in self.preserve_usernames:
+            return username
+        return f"u{self._digest(username.lower())[:10]}"
+
+    def anonymize_text(self, text):
+        """إخفاء الإيميلات والمعرفات والأرقام الطويلة داخل النص مع الإبقاء على الأمر"""
+        text = _EMAIL_RE.sub("user@example.com", text)
+        text = _MENTION_RE.sub(lambda match: "@" + self.pseudonym_username(match.group(1)), text)
+        return _LONG_NUMBER_RE.sub(lambda match: str(self.pseudonym_id(match.group(0))), text)
+
+    def anonymize(self, data):
+        """نسخة من قاموس التحديث بدون بيانات شخصية"""
+        if isinstance(data, list):
+            return [self.anonymize(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        for key, value in data.items():
+            if key in _DROP_KEYS:
+                continue
+            if key in _NAME_KEYS:
+                result[key] = "User"
+            elif key in _FILE_KEYS:
+                result[key] = "redacted"
+            elif key == "username" and isinstance(value, str):
+                result[key] = self.pseudonym_username(value)
+            elif key == "id" and isinstance(value, int) and ("is_bot" in data or "type" in data):
+                # معرف مستخدم أو محادثة
+                result[key] = self.pseudonym_id(value)
+            elif key in ("text", "caption") and isinstance(value, str):
+                result[key] = self.anonymize_text(value)
+            else:
+                result[key] = self.anonymize(value)
+        return result
+
+    # ===== التسجيل =====
+
+    def record(self, update):
+        """إضافة تحديث واحد للملف (سطر JSON مضغوط لكل تحديث)"""
+        line = json.dumps(
+            {"t": round(time.time(), 3), "u": self.anonymize(update.to_dict())},
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self.recorded += 1
+            if self.recorded % self.flush_every == 0:
+                self._file.flush()
+
+    async def handle_update(self, update, context):
+        """معالج تلقرام يسجل كل تحديث ولا يوقف المعالجات الأخرى"""
+        try:
+            self.record(update)
+        except Exception as e:
+            logger.error("❌ خطأ في تسجيل التحديث: %s", e)
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            self._file.close()
+
+
+def read_recording(path):
+    """قراءة ملف تسجيل: قائمة (الوقت، قاموس التحديث) مرتبة حسب الوقت"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # السطر الأخير قد يكون ناقصاً إذا توقف البوت أثناء الكتابة
+                continue
+            records.append((entry["t"], entry["u"]))
+    records.sort(key=lambda record: record[0])
+    return records
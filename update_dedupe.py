@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+
+from shared_store import Transactions, connect
+
+DEDUPE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_updates (
+    key TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_updates_time ON seen_updates (seen_at);
+"""
+
+
+def update_keys(update):
+    """مفاتيح التحديث: update_id دائماً و(المحادثة، الرسالة) للرسائل الجديدة فقط
+
+    أزرار الرسائل (callback) تشترك في نفس الرسالة لذلك لا تُستخدم رسالتها كمفتاح
+    """
+    keys = [f"u:{update.update_id}"]
+    if update.message is not None:
+        keys.append(f"m:{update.message.chat_id}:{update.message.message_id}")
+    return keys
+
+
+class UpdateDeduplicator:
+    """ذاكرة محدودة (LRU مع مدة صلاحية) للتحديثات المعالجة تبقى بعد إعادة التشغيل"""
+
+    def __init__(self, dedupe_file="update_dedupe.sqlite3", max_entries=10000, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.transactions = Transactions(connect(dedupe_file, DEDUPE_SCHEMA))
+
+        self._lock = threading.Lock()
+        self._inserted = 0
+        self.duplicates = 0
+
+        # تحميل أحدث المفاتيح من التشغيل السابق (الأقدم أولاً)
+        rows = self.transactions.query(
+            "SELECT key, seen_at FROM seen_updates WHERE seen_at >= ? ORDER BY seen_at DESC LIMIT ?",
+            (time.time() - ttl, max_entries)
+        )
+        self._seen = OrderedDict(reversed(rows))
+
+    def __len__(self):
+        return len(self._seen)
+
+    def is_duplicate(self, keys):
+        """هل عولج أحد المفاتيح من قبل؛ وإلا تُسجل المفاتيح كمعالجة"""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                seen_at = self._seen.get(key)
+                if seen_at is not None and now - seen_at < self.ttl:
+                    self._seen.move_to_end(key)
+                    self.duplicates += 1
+                    return True
+
+            for key in keys:
+                self._seen[key] = now
+                self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+            # الحفظ قبل المعالجة: التحديث المُعاد بعد توقف مفاجئ لا يُعالج مرتين
+            self.transactions.run(lambda connection: connection.executemany(
+                "INSERT OR REPLACE INTO seen_updates (key, seen_at) VALUES (?, ?)",
+                [(key, now) for key in keys]
+            ))
+            self._inserted += len(keys)
+            if self._inserted >= self.max_entries:
+                self._inserted = 0
+                self._prune(now)
+        return False
+
+    def _prune(self, now):
+        """حذف المفاتيح المنتهية والزائدة عن الحد من الملف"""
+
+        def work(connection):
+            connection.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.ttl,))
+            connection.execute(
+                "DELETE FROM seen_updates WHERE key NOT IN "
+                "(SELECT key FROM seen_updates ORDER BY seen_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+        self.transactions.run(work)
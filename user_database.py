@@ -6,13 +6,106 @@ import os
 import logging
 import threading
 import time
+import heapq
+from bisect import bisect_left, insort
 from datetime import datetime
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# الحقول التي يُحتفظ لها بفهرس مرتب
+SORT_FIELDS = ("credits", "total_purchases", "join_date", "last_activity")
+
+class UserIndex:
+    """فهارس مرتبة للمستخدمين للتصفح والبحث بدون المرور على جميع المستخدمين"""
+
+    def __init__(self):
+        self.sorted = {field: [] for field in SORT_FIELDS}  # الحقل -> [(القيمة، user_id)]
+        self.names = []  # [(الاسم بحروف صغيرة، user_id)] لاسم المستخدم والاسم الأول
+        self._keys = {}  # user_id -> المفاتيح المفهرسة حالياً
+
+    def _user_keys(self, user):
+        keys = {field: user.get(field, 0 if field in ("credits", "total_purchases") else "")
+                for field in SORT_FIELDS}
+        keys["names"] = sorted({name.lower() for name in (user.get("username"), user.get("first_name")) if name})
+        return keys
+
+    def rebuild(self, users):
+        """إعادة بناء جميع الفهارس دفعة واحدة"""
+        self._keys = {user_id: self._user_keys(user) for user_id, user in users.items()}
+        for field in SORT_FIELDS:
+            self.sorted[field] = sorted((keys[field], user_id) for user_id, keys in self._keys.items())
+        self.names = sorted((name, user_id) for user_id, keys in self._keys.items() for name in keys["names"])
+
+    @staticmethod
+    def _discard(items, item):
+        i = bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+    def refresh(self, user_id, user):
+        """تحديث مفاتيح مستخدم واحد في الفهارس"""
+        new_keys = self._user_keys(user)
+        old_keys = self._keys.get(user_id)
+        if old_keys == new_keys:
+            return
+
+        for field in SORT_FIELDS:
+            if old_keys is None or old_keys[field] != new_keys[field]:
+                if old_keys is not None:
+                    self._discard(self.sorted[field], (old_keys[field], user_id))
+                insort(self.sorted[field], (new_keys[field], user_id))
+
+        if old_keys is None or old_keys["names"] != new_keys["names"]:
+            for name in (old_keys or {}).get("names", []):
+                self._discard(self.names, (name, user_id))
+            for name in new_keys["names"]:
+                insort(self.names, (name, user_id))
+
+        self._keys[user_id] = new_keys
+
+    def page(self, field, page, page_size, descending=True):
+        """معرفات مستخدمي صفحة محددة مرتبة حسب الحقل"""
+        items = self.sorted[field]
+        start = (page - 1) * page_size
+        if descending:
+            end = len(items) - start
+            selected = reversed(items[max(end - page_size, 0):max(end, 0)])
+        else:
+            selected = items[start:start + page_size]
+        return [user_id for _, user_id in selected]
+
+    def search_prefix(self, prefix, limit=20):
+        """البحث ببادئة اسم المستخدم أو الاسم الأول"""
+        prefix = prefix.lower().lstrip("@")
+        results = []
+        i = bisect_left(self.names, (prefix,))
+        while i < len(self.names) and len(results) < limit:
+            name, user_id = self.names[i]
+            if not name.startswith(prefix):
+                break
+            if user_id not in results:
+                results.append(user_id)
+            i += 1
+        return results
+
 class UserDatabase:
     def __init__(self, db_file="users.json"):
         self.db_file = db_file
         self.users = self.load_database()
+        self.last_save_bytes = 0  # حجم آخر حفظ بالبايت
+
+        # فهارس مرتبة للتصفح والبحث
+        self.index = UserIndex()
+        self.index.rebuild(self.users)
+
+        # فهرس اسم المستخدم (بحروف صغيرة) -> user_id
+        self.username_index = {}
+        self.rebuild_username_index()
+
+        # معرفات المحظورين (int) للتحقق السريع قبل معالجة أي تحديث
+        self.banned_ids = set()
+        self.rebuild_banned_index()
     
     def load_database(self):
         """تحميل قاعدة البيانات من الملف"""
@@ -21,18 +114,34 @@ class UserDatabase:
                 with open(self.db_file, 'r', encoding='utf-8') as f:
                     return json.load(f)
             except Exception as e:
-                print(f"خطأ في تحميل قاعدة البيانات: {e}")
+                logger.error("خطأ في تحميل قاعدة البيانات: %s", e)
                 return {}
         return {}
     
+    def rebuild_username_index(self):
+        """إعادة بناء فهرس أسماء المستخدمين"""
+        self.username_index = {
+            user["username"].lower(): user_id
+            for user_id, user in self.users.items()
+            if user.get("username")
+        }
+
+    def rebuild_banned_index(self):
+        """إعادة بناء مجموعة المستخدمين المحظورين"""
+        self.banned_ids = {
+            int(user_id) for user_id, user in self.users.items()
+            if user.get("is_banned", False)
+        }
+
     def save_database(self):
         """حفظ قاعدة البيانات في الملف"""
         try:
             with open(self.db_file, 'w', encoding='utf-8') as f:
                 json.dump(self.users, f, ensure_ascii=False, indent=2)
+                self.last_save_bytes = f.tell()
             return True
         except Exception as e:
-            print(f"خطأ في حفظ قاعدة البيانات: {e}")
+            logger.error("خطأ في حفظ قاعدة البيانات: %s", e)
             return False
     
     def get_user(self, user_id, give_welcome_credits=False):
@@ -58,6 +167,7 @@ class UserDatabase:
 
         # تحديث آخر نشاط
         self.users[user_id]["last_activity"] = datetime.now().isoformat()
+        self.index.refresh(user_id, self.users[user_id])
         return self.users[user_id], is_new_user
     
     def update_user_info(self, user_id, username=None, first_name=None, give_welcome_credits=False):
@@ -66,7 +176,11 @@ class UserDatabase:
         user, is_new = self.get_user(user_id, give_welcome_credits)
 
         if username:
+            old_username = user.get("username", "").lower()
+            if old_username and old_username != username.lower() and self.username_index.get(old_username) == user_id:
+                del self.username_index[old_username]
             user["username"] = username
+            self.username_index[username.lower()] = user_id
         if first_name:
             user["first_name"] = first_name
 
@@ -74,9 +188,22 @@ class UserDatabase:
         if "is_new" in user:
             user["is_new"] = False
 
+        self.index.refresh(user_id, user)
         self.save_database()
         return is_new
 
+    def get_user_id_by_username(self, username):
+        """الحصول على معرف المستخدم من اسم المستخدم، أو None"""
+        user_id = self.username_index.get(username.lstrip("@").lower())
+        return int(user_id) if user_id else None
+
+    def resolve_user_id(self, target):
+        """تحويل معرف رقمي أو @username إلى معرف المستخدم (None إذا لم يوجد الاسم)"""
+        target = str(target).strip()
+        if target.startswith("@"):
+            return self.get_user_id_by_username(target)
+        return int(target)
+
     def get_credits(self, user_id):
         """الحصول على كريدت المستخدم"""
         user, _ = self.get_user(user_id)
@@ -86,6 +213,7 @@ class UserDatabase:
         """إضافة كريدت للمستخدم"""
         user, _ = self.get_user(user_id)
         user["credits"] += amount
+        self.index.refresh(str(user_id), user)
         self.save_database()
         return user["credits"]
 
@@ -95,6 +223,7 @@ class UserDatabase:
         if user["credits"] >= amount:
             user["credits"] -= amount
             user["total_purchases"] += 1
+            self.index.refresh(str(user_id), user)
             self.save_database()
             return True
         return False
@@ -103,6 +232,7 @@ class UserDatabase:
         """تعيين كريدت المستخدم"""
         user, _ = self.get_user(user_id)
         user["credits"] = amount
+        self.index.refresh(str(user_id), user)
         self.save_database()
         return amount
 
@@ -110,23 +240,37 @@ class UserDatabase:
         """حظر المستخدم"""
         user, _ = self.get_user(user_id)
         user["is_banned"] = True
+        self.banned_ids.add(int(user_id))
         self.save_database()
 
     def unban_user(self, user_id):
         """إلغاء حظر المستخدم"""
         user, _ = self.get_user(user_id)
         user["is_banned"] = False
+        self.banned_ids.discard(int(user_id))
         self.save_database()
 
     def is_banned(self, user_id):
-        """التحقق من حظر المستخدم"""
-        user, _ = self.get_user(user_id)
-        return user.get("is_banned", False)
+        """التحقق من حظر المستخدم بدون إنشاء سجل أو تحديث آخر نشاط"""
+        return int(user_id) in self.banned_ids
     
     def get_all_users(self):
         """الحصول على جميع المستخدمين"""
         return self.users
     
+    def get_users_page(self, sort_field="credits", page=1, page_size=20):
+        """صفحة من المستخدمين مرتبة حسب حقل (من الأكبر للأصغر)"""
+        user_ids = self.index.page(sort_field, page, page_size)
+        return [(user_id, self.users[user_id]) for user_id in user_ids]
+
+    def search_users(self, prefix, limit=20):
+        """البحث عن المستخدمين ببادئة اسم المستخدم أو الاسم الأول"""
+        return [(user_id, self.users[user_id]) for user_id in self.index.search_prefix(prefix, limit)]
+
+    def top_users(self, field="credits", k=10):
+        """أعلى k مستخدمين حسب حقل باستخدام heap بدلاً من ترتيب كامل"""
+        return heapq.nlargest(k, self.users.items(), key=lambda item: item[1].get(field, 0))
+
     def get_user_count(self):
         """الحصول على عدد المستخدمين"""
         return len(self.users)
@@ -140,7 +284,7 @@ class UserDatabase:
         total_users = len(self.users)
         total_credits = sum(user["credits"] for user in self.users.values())
         total_purchases = sum(user["total_purchases"] for user in self.users.values())
-        banned_users = sum(1 for user in self.users.values() if user.get("is_banned", False))
+        banned_users = len(self.banned_ids)
         
         return {
             "total_users": total_users,